@@ -0,0 +1,91 @@
+# 分區 Parquet 目錄 (M2 以上、數百萬筆)：查詢延遲與常駐記憶體
+# 執行：PYTHONPATH=. python benchmarks/bench_quake_partitions.py [--n 3000000] [--queries 200] [--compare-memory]
+import argparse
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import duckdb
+import numpy as np
+
+from geodata import catalog, quake_db
+from geodata.synthetic import iter_yearly_events
+
+
+def rss_mb():
+    # Linux 的 ru_maxrss 單位是 KB (尖峰常駐記憶體)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def random_filters(n, min_mag, seed=1):
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        start = int(rng.integers(2000, 2021))
+        yield round(float(rng.uniform(min_mag, min_mag + 3.0)), 1), start, start + int(rng.integers(0, 6))
+
+
+def run(label, fn, filters):
+    samples = []
+    for min_mag, start_year, end_year in filters:
+        t0 = time.perf_counter()
+        fn(min_mag, start_year, end_year)
+        samples.append(time.perf_counter() - t0)
+    ms = np.asarray(samples) * 1000
+    print(f"{label:<28} p50 {np.percentile(ms, 50):8.2f} ms   p99 {np.percentile(ms, 99):8.2f} ms")
+
+
+def lod_uncached(min_mag, start_year, end_year):
+    # 格網聚合平常有 lru_cache，這裡每次清掉才量得到真正的查詢時間
+    quake_db._aggregate_grid.cache_clear()
+    return quake_db.query_lod(min_mag, start_year, end_year, 9)
+
+
+def run_suite(title, filters):
+    print(f"--- {title}")
+    run("count_q", quake_db.count_events, filters)
+    run("query_lod (zoom 9)", lod_uncached, filters)
+    run("stats_q (單次聚合)", quake_db.aggregate_stats, filters)
+    run("bbox_q (0.5° 方框)", lambda m, a, b: quake_db.query_bbox(m, a, b, 121.4, 23.8, 121.9, 24.3), filters)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=3_000_000, help="合成地震筆數")
+    parser.add_argument("--min-mag", type=float, default=2.0)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dir", default=None, help="分區資料夾 (預設用暫存資料夾，結束後刪除)")
+    parser.add_argument("--compare-memory", action="store_true", help="另外把整份目錄載入記憶體比較")
+    args = parser.parse_args()
+
+    root = args.dir or os.path.join(tempfile.mkdtemp(prefix="quake-parts-"), catalog.PARTITION_DIR)
+    t0 = time.perf_counter()
+    for df in iter_yearly_events(args.n, min_mag=args.min_mag):
+        catalog.write_partitions(catalog.compact(df), root)
+    size = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(root) for f in files)
+    print(f"寫入分區：{time.perf_counter() - t0:.1f} s，{args.n} 筆，{size / 1e6:.0f} MB，"
+          f"{sum(len(files) for _, _, files in os.walk(root))} 個檔案")
+
+    filters = list(random_filters(args.queries, args.min_mag))
+    t0 = time.perf_counter()
+    quake_db.use_catalog(root)
+    print(f"建立分區 view：{(time.perf_counter() - t0) * 1000:.0f} ms   尖峰 RSS {rss_mb():.0f} MB")
+    run_suite("分區 Parquet (磁碟)", filters)
+    print(f"尖峰 RSS {rss_mb():.0f} MB")
+
+    if args.compare_memory:
+        glob = os.path.join(root, "**", "*.parquet")
+        df = duckdb.connect().execute("SELECT * EXCLUDE (mag_band) FROM read_parquet(?, hive_partitioning = true)", [glob]).df()
+        df = catalog.compact(df)
+        quake_db.use_catalog(df)
+        print(f"整份載入記憶體：{catalog.memory_usage(df) / 1e6:.0f} MB")
+        run_suite("常駐原生表 (記憶體)", filters)
+        print(f"尖峰 RSS {rss_mb():.0f} MB")
+
+    if args.dir is None:
+        shutil.rmtree(os.path.dirname(root), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
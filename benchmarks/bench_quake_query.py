@@ -0,0 +1,64 @@
+# 地震查詢延遲：每次 duckdb.query 掃 pandas (舊) vs 常駐原生表 + PREPARE (新)
+# 執行：PYTHONPATH=. python benchmarks/bench_quake_query.py [--n 300000] [--queries 300]
+import argparse
+import time
+
+import duckdb
+import numpy as np
+
+from geodata import quake_db
+from geodata.synthetic import make_events
+
+
+def random_filters(n, seed=1):
+    rng = np.random.default_rng(seed)
+    for _ in range(n):
+        start = int(rng.integers(2000, 2021))
+        yield round(float(rng.uniform(4.0, 7.0)), 1), start, start + int(rng.integers(0, 6))
+
+
+def percentiles(samples):
+    ms = np.asarray(samples) * 1000
+    return np.percentile(ms, 50), np.percentile(ms, 99)
+
+
+def run(label, fn, filters):
+    samples = []
+    for min_mag, start_year, end_year in filters:
+        t0 = time.perf_counter()
+        fn(min_mag, start_year, end_year)
+        samples.append(time.perf_counter() - t0)
+    p50, p99 = percentiles(samples)
+    print(f"{label:<28} p50 {p50:8.2f} ms   p99 {p99:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=300000, help="合成地震筆數")
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+
+    df_earthquakes = make_events(args.n)
+    filters = list(random_filters(args.queries))
+
+    def before(min_mag, start_year, end_year):
+        # 原本 query_earthquakes 的寫法：f-string + replacement scan (掃呼叫端的區域變數)
+        catalog_df = df_earthquakes
+        return duckdb.query(f"""
+            SELECT latitude, longitude, mag, depth, place, year
+            FROM catalog_df
+            WHERE mag >= {min_mag}
+            AND year >= {start_year} AND year <= {end_year}
+        """).to_df()
+
+    t0 = time.perf_counter()
+    quake_db.use_catalog(df_earthquakes)
+    print(f"建立排序原生表：{(time.perf_counter() - t0) * 1000:.0f} ms ({args.n} 筆)")
+
+    run("before: duckdb.query(df)", before, filters)
+    run("after: points_q", quake_db.query_points, filters)
+    run("after: count_q", quake_db.count_events, filters)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# 地震圖層繪製效能：逐筆 CircleMarker vs 單一 Canvas 圖層
+# 執行：PYTHONPATH=. python benchmarks/bench_quake_render.py [--sizes 1000 10000 50000]
+import argparse
+import io
+import time
+
+import leafmap.foliumap as leafmap
+
+from geodata import quake_layers
+from geodata.synthetic import make_events
+
+
+def build_html(df, mode):
+    m = leafmap.Map(center=[24.14, 121.6], zoom=9, google_map="HYBRID",
+                    draw_control=False, measure_control=False)
+    if mode == "canvas":
+        quake_layers.add_quake_layer(m, df)
+    else:
+        quake_layers.add_circle_markers(m, df)
+    fp = io.BytesIO()
+    m.save(fp, close_file=False)
+    return fp.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--max-markers", type=int, default=50000,
+                        help="超過這個筆數就跳過逐筆模式 (太慢)")
+    args = parser.parse_args()
+
+    print(f"{'筆數':>8} {'模式':>8} {'建置秒數':>10} {'HTML (MB)':>10}")
+    for n in args.sizes:
+        df = make_events(n)
+        for mode in ("markers", "canvas"):
+            if mode == "markers" and n > args.max_markers:
+                print(f"{n:>8} {mode:>8} {'(略過)':>10}")
+                continue
+            t0 = time.perf_counter()
+            html = build_html(df, mode)
+            elapsed = time.perf_counter() - t0
+            print(f"{n:>8} {mode:>8} {elapsed:>10.2f} {len(html) / 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
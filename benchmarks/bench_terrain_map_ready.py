@@ -0,0 +1,326 @@
+# 地形頁 (02) 的地圖就緒延遲：舊版每一步重建 folium 地圖 (iframe 換掉重載) vs 常駐地圖只移動車子
+# 由瀏覽器量測：從換頁 / 送出新座標起，到所有圖磚圖層觸發 Leaflet 的 load 事件為止
+# 舊版每一步是一份新的地圖文件 (iframe 換掉等於整份重載)，這裡以整頁導向下一步的地圖 HTML 重現 (不經 iframe)
+# 需要能正常導向的瀏覽器：kaleido 內附的 Chromium 不載入子框架、也只導向一次，無法用來跑
+# 新版的「圖磚就緒」含 ipyleaflet panTo 的平移動畫 (Leaflet 預設 250 ms)；舊版另外印出伺服器端建 folium 地圖的時間
+# 實測數字見 README (地形頁一段)
+# 執行：PYTHONPATH=. python benchmarks/bench_terrain_map_ready.py --browser "chromium --headless=new --disable-gpu {url}"
+#   --assets DIR：離線時 CDN 上的 JS / CSS 改由本機資料夾提供 (依檔名對應，缺的檔案回傳空內容並列出)
+#   不給 --browser 就只印出網址，自己用瀏覽器打開
+import argparse
+import ast
+import io
+import json
+import os
+import re
+import shlex
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import leafmap.foliumap as leafmap
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from geodata import route_dem, route_line
+
+PAGE = os.path.join(os.path.dirname(__file__), "..", "pages", "02_Terrain_Explorer.py")
+TILE_URLS = {
+    "osm": "https://tile.openstreetmap.org/{z}/{x}/{y}.png",
+    "topo": "https://server.arcgisonline.com/ArcGIS/rest/services/World_Topo_Map/MapServer/tile/{z}/{y}/{x}",
+}
+ASSET_RE = re.compile(r'(?:src|href)="(https://[^"]+\.(?:js|css))"')
+
+
+def load_stations():
+    # 節點表直接從頁面原始碼取 (import 頁面會開始下載地震目錄)
+    with open(PAGE, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and getattr(node.targets[0], "id", None) == "route_data":
+            return pd.DataFrame(ast.literal_eval(node.value))
+    raise ValueError("頁面裡找不到 route_data")
+
+
+# ==========================================
+# 1. 舊版：每一步都是一張新的 folium 地圖 (與改版前 02 頁的 calculate_map 相同)
+# ==========================================
+def old_map_html(route, stations, profile, km):
+    lat, lon, _, section_name = route.locate(km)
+    elev = float(np.interp(km, profile['km'], profile['elev']))
+    m = leafmap.Map(center=[lat, lon], zoom=12, google_map="TERRAIN", draw_control=False, measure_control=False)
+    points = np.column_stack([route.lat, route.lon]).round(5).tolist()
+    leafmap.folium.PolyLine(locations=points, color="blue", weight=3, opacity=0.5).add_to(m)
+    leafmap.folium.Marker(location=[lat, lon], popup=f"目前位置: {section_name}<br>海拔: {int(elev)}m",
+                          icon=leafmap.folium.Icon(color="red", icon="car", prefix="fa")).add_to(m)
+    for _, row in stations.iterrows():
+        if row['name'] in ["武嶺", "埔里", "太魯閣"]:
+            leafmap.folium.Marker(location=[row['lat'], row['lon']], tooltip=row['name'],
+                                  icon=leafmap.folium.Icon(color="green", icon="info-sign")).add_to(m)
+    fp = io.BytesIO()
+    m.save(fp, close_file=False)
+    return fp.getvalue().decode("utf-8")
+
+
+BEFORE_PROBE = """<script>
+(function() {
+    // 地圖腳本跑完時圖磚已經開始下載：等每個圖磚圖層都觸發 load，回報後導向下一步
+    // (t0 = 上一頁開始換頁的時間，放在網址的 # 後面)
+    function now() { return performance.timeOrigin + performance.now(); }
+    var t0 = parseFloat(location.hash.slice(1)), step = __STEP__, steps = __STEPS__;
+    var script = now(), sent = false;
+    var layers = Object.keys(window).filter(function(k) { return k.indexOf('tile_layer_') === 0; }).map(function(k) { return window[k]; });
+    var tiles = layers.reduce(function(n, l) { return n + Object.keys(l._tiles).length; }, 0);
+    function done() {
+        if (sent || layers.some(function(l) { return l.isLoading(); })) return;
+        sent = true;
+        var sample = {step: step, script: script - t0, ready: now() - t0, tiles: tiles};
+        fetch('/step', {method: 'POST', body: JSON.stringify(sample)}).then(function() {
+            location.href = (step + 1 < steps ? '/before/' + (step + 1) + '.html' : '/after.html') + '#' + now();
+        });
+    }
+    layers.forEach(function(l) { l.on('load', done); });
+    done();
+})();
+</script>
+"""
+
+
+# ==========================================
+# 2. 新版：常駐地圖 (與 02 頁的 create_drive_map 相同的圖層)，每一步只 setLatLng + panTo
+#    (ipyleaflet 前端收到 location / center 改變時做的就是這兩件事)
+# ==========================================
+AFTER_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8">
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css"/>
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.2.0/css/all.min.css"/>
+<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/Leaflet.awesome-markers/2.0.2/leaflet.awesome-markers.css"/>
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet.fullscreen@3.0.0/Control.FullScreen.css"/>
+<script src="https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js"></script>
+<script src="https://cdnjs.cloudflare.com/ajax/libs/Leaflet.awesome-markers/2.0.2/leaflet.awesome-markers.js"></script>
+<script src="https://cdn.jsdelivr.net/npm/leaflet.fullscreen@3.0.0/Control.FullScreen.min.js"></script>
+<style>html, body, #map { margin: 0; width: 100%; height: 100%; }</style>
+</head><body><div id="map"></div>
+<script>
+(function() {
+    function now() { return performance.timeOrigin + performance.now(); }
+    var cfg = __CONFIG__;
+    var map = L.map('map', {center: cfg.start, zoom: 12, scrollWheelZoom: true});
+    // 先掛 tileloadstart 再加到地圖上：addTo 當下就會開始要第一批圖磚
+    var requested = 0;
+    var layers = [L.tileLayer(cfg.tiles.osm, {maxZoom: 19}), L.tileLayer(cfg.tiles.topo, {maxZoom: 19})];
+    layers.forEach(function(l) { l.on('tileloadstart', function() { requested++; }).addTo(map); });
+    L.control.fullscreen().addTo(map);
+    L.polyline(cfg.route, {color: 'blue', weight: 3, opacity: 0.5, fill: false}).addTo(map);
+    cfg.stations.forEach(function(s) {
+        L.marker(s.location, {title: s.name, icon: L.AwesomeMarkers.icon({icon: 'info-circle', markerColor: 'green', prefix: 'fa'})}).addTo(map);
+    });
+    var car = L.marker(cfg.start, {icon: L.AwesomeMarkers.icon({icon: 'car', markerColor: 'red', prefix: 'fa'})}).bindPopup('').addTo(map);
+
+    function whenTilesLoaded(callback) {
+        var loading = layers.filter(function(l) { return l.isLoading(); }), left = loading.length;
+        if (!left) return callback();
+        loading.forEach(function(l) { l.once('load', function() { if (--left === 0) callback(); }); });
+    }
+    function move(step) {
+        // 每一步：車子換位置、popup 換字、視角平移 (ipyleaflet 的 panTo)
+        return new Promise(function(resolve) {
+            var t0 = now();
+            requested = 0;
+            car.setLatLng(step.location);
+            car.setPopupContent(step.popup);
+            map.once('moveend', function() {
+                var moved = now();
+                whenTilesLoaded(function() { resolve({moved: moved - t0, ready: now() - t0, tiles: requested}); });
+            });
+            map.panTo(step.location);
+        });
+    }
+
+    var t0 = parseFloat(location.hash.slice(1)), script = now();
+    whenTilesLoaded(async function() {
+        var results = {userAgent: navigator.userAgent, after: [],
+                       after_first: {script: script - t0, ready: now() - t0, tiles: requested}};
+        for (var i = 1; i < cfg.steps.length; i++) {
+            results.after.push(await move(cfg.steps[i]));
+        }
+        fetch('/result', {method: 'POST', body: JSON.stringify(results)});
+    });
+})();
+</script></body></html>
+"""
+
+
+def new_map_html(route, stations, steps):
+    config = {
+        "start": steps[0]["location"],
+        "steps": steps,
+        "tiles": TILE_URLS,
+        "route": np.column_stack([route.lat, route.lon]).round(5).tolist(),
+        "stations": [{"name": r['name'], "location": [r['lat'], r['lon']]}
+                     for _, r in stations.iterrows() if r['name'] in ["武嶺", "埔里", "太魯閣"]],
+    }
+    return AFTER_TEMPLATE.replace("__CONFIG__", json.dumps(config, ensure_ascii=False))
+
+
+# ==========================================
+# 3. 量測流程：舊版每一步整頁載入下一張地圖 → 新版常駐地圖自己跑完每一步，結果 POST 回來
+# ==========================================
+HARNESS = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"></head><body><script>
+location.href = '/before/0.html#' + (performance.timeOrigin + performance.now());
+</script></body></html>
+"""
+
+
+def tile_png(seed):
+    # 約 20~30 KB 的雜訊圖 (實際圖磚大小的量級)，每個圖層一張
+    rng = np.random.default_rng(seed)
+    buf = io.BytesIO()
+    Image.fromarray(rng.integers(96, 112, (256, 256), dtype=np.uint8), "L").save(buf, "PNG")
+    return buf.getvalue()
+
+
+def start_server(handler_routes, port=0):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            handler_routes(self)
+
+        def do_POST(self):
+            handler_routes(self)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def reply(request, body, content_type, cache=False):
+    request.send_response(200)
+    request.send_header("Content-Type", content_type)
+    request.send_header("Content-Length", str(len(body)))
+    # 圖磚伺服器 (OSM / Esri) 都允許瀏覽器快取：舊版換 iframe 時同一張圖磚多半從快取拿
+    request.send_header("Cache-Control", "max-age=86400" if cache else "no-store")
+    request.end_headers()
+    request.wfile.write(body)
+
+
+def start_tile_server(png, latency_ms):
+    # 每個圖磚來源各開一個埠 (瀏覽器對每個主機各自限制同時連線數，與兩個真的圖磚主機相同)
+    def routes(request):
+        time.sleep(latency_ms / 1000)
+        reply(request, png, "image/png", cache=True)
+    return start_server(routes)
+
+
+def summarize(label, samples, key):
+    ms = np.array([s[key] for s in samples])
+    tiles = np.array([s["tiles"] for s in samples])
+    print(f"{label:<34} p50 {np.percentile(ms, 50):7.1f} ms   p95 {np.percentile(ms, 95):7.1f} ms   "
+          f"每步新圖磚 {tiles.mean():5.1f} 張")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=40, help="滑桿從 0 km 起每 1 km 一步，共幾步")
+    parser.add_argument("--tile-latency-ms", type=float, default=40.0, help="本機圖磚伺服器每張圖磚的延遲")
+    parser.add_argument("--assets", default=None, help="離線用：CDN 上 JS / CSS 的本機資料夾 (依檔名對應)")
+    parser.add_argument("--browser", default=None, help="開啟量測頁的指令，{url} 會換成網址")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+
+    stations = load_stations()
+    route = route_line.load_route(stations)
+    stations = route.stations
+    profile = route_dem.load_profile(route)
+    km = np.arange(args.steps, dtype=float)
+    points = route.locate_many(km)
+
+    tile_servers = {name: start_tile_server(tile_png(k), args.tile_latency_ms) for k, name in enumerate(TILE_URLS)}
+    assets = {}
+    if args.assets:
+        for root, _, files in os.walk(args.assets):
+            for name in files:
+                assets.setdefault(name, os.path.join(root, name))
+    stubbed = set()
+
+    def localize(html):
+        # 圖磚換成本機伺服器；有 --assets 時 CDN 的 JS / CSS 也換成本機
+        for name, url in TILE_URLS.items():
+            html = html.replace(url, f"http://127.0.0.1:{tile_servers[name].server_address[1]}/{name}/{{z}}/{{x}}/{{y}}.png")
+        if args.assets:
+            html = ASSET_RE.sub(lambda m: m.group(0).replace(m.group(1), "/assets/" + m.group(1).rsplit("/", 1)[1]), html)
+        return html
+
+    # 舊版每一步在伺服器端還要先建一次 folium 地圖 (瀏覽器量不到，這裡另外計時)
+    before, build_ms = [], []
+    for i, k in enumerate(km):
+        t0 = time.perf_counter()
+        html = old_map_html(route, stations, profile, k)
+        build_ms.append((time.perf_counter() - t0) * 1000)
+        before.append(localize(html).replace(
+            "</html>", BEFORE_PROBE.replace("__STEP__", str(i)).replace("__STEPS__", str(args.steps)) + "</html>"))
+    steps = [{"location": [round(float(r['lat']), 6), round(float(r['lon']), 6)],
+              "popup": f"目前位置: {route.section_name(int(r['section']))}<br>海拔: {int(np.interp(r['km'], profile['km'], profile['elev']))}m"}
+             for _, r in points.iterrows()]
+    after = localize(new_map_html(route, stations, steps))
+    done, result, before_samples = threading.Event(), {}, []
+
+    def routes(request):
+        path = request.path.split("?")[0]
+        if request.command == "POST":
+            body = json.loads(request.rfile.read(int(request.headers["Content-Length"])))
+            reply(request, b"{}", "application/json")
+            if path == "/step":
+                before_samples.append(body)
+            else:
+                result.update(body)
+                done.set()
+        elif path == "/":
+            reply(request, HARNESS.encode(), "text/html; charset=utf-8")
+        elif path == "/after.html":
+            reply(request, after.encode(), "text/html; charset=utf-8")
+        elif path.startswith("/before/"):
+            reply(request, before[int(path.rsplit("/", 1)[1].split(".")[0])].encode(), "text/html; charset=utf-8")
+        else:
+            # CDN 資源 (含 CSS 內相對路徑引用的字型與圖片) 依檔名找
+            name = path.rsplit("/", 1)[1]
+            if name not in assets:
+                stubbed.add(name)
+            body = open(assets[name], "rb").read() if name in assets else b""
+            kind = "text/css" if name.endswith(".css") else "application/javascript" if name.endswith(".js") else "application/octet-stream"
+            reply(request, body, kind, cache=True)
+
+    server = start_server(routes)
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    print(f"量測頁：{url} ({args.steps} 步，圖磚延遲 {args.tile_latency_ms:.0f} ms，舊版每步 HTML {np.mean([len(h) for h in before]) / 1024:.1f} KB)")
+    browser = subprocess.Popen(shlex.split(args.browser.replace("{url}", url))) if args.browser else None
+    try:
+        if not done.wait(args.timeout):
+            raise SystemExit("量測逾時 (瀏覽器沒有回報結果)")
+    finally:
+        if browser is not None:
+            browser.terminate()
+
+    result["before"] = sorted(before_samples, key=lambda d: d["step"])
+    print(f"瀏覽器：{result['userAgent']}")
+    if stubbed:
+        print(f"本機沒有、以空內容代替的資源：{', '.join(sorted(stubbed))}")
+    print(f"{'舊版 每步：伺服器端建 folium 地圖':<34} p50 {np.percentile(build_ms, 50):7.1f} ms   "
+          f"p95 {np.percentile(build_ms, 95):7.1f} ms")
+    first = result["before"][0]
+    print(f"{'舊版 第一步 (冷快取)':<34} 腳本 {first['script']:7.1f} ms   圖磚就緒 {first['ready']:7.1f} ms   圖磚 {first['tiles']} 張")
+    summarize("舊版 之後每步：換頁 → 腳本跑完", result["before"][1:], "script")
+    summarize("舊版 之後每步：換頁 → 圖磚就緒", result["before"][1:], "ready")
+    first = result["after_first"]
+    print(f"{'新版 首次載入':<34} 腳本 {first['script']:7.1f} ms   圖磚就緒 {first['ready']:7.1f} ms   圖磚 {first['tiles']} 張")
+    summarize("新版 每步：送座標 → 平移結束", result["after"], "moved")
+    summarize("新版 每步：送座標 → 圖磚就緒", result["after"], "ready")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# 本機假 FDSN 端點：每隔幾秒新增幾筆合成地震，測試即時 feed (geodata/quake_feed.py) 用
+# 執行：PYTHONPATH=. python benchmarks/fake_fdsn_feed.py [--port 18778] [--every 5] [--batch 3]
+# 再以 QUAKE_FEED_URL=http://127.0.0.1:18778/query QUAKE_FEED_INTERVAL=5 啟動 solara
+import argparse
+import collections
+import io
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from geodata.synthetic import make_events
+
+FDSN_COLUMNS = ['time', 'latitude', 'longitude', 'depth', 'mag', 'magType', 'nst', 'gap', 'dmin', 'rms',
+                'net', 'id', 'updated', 'place', 'type']
+
+
+class FakeCatalog:
+    # 也給測試用 (tests/)：add() 放入指定的事件，requests 記下每次查詢的參數
+    def __init__(self, batch=3, seed=0):
+        self.batch = batch
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.events = make_events(0).drop(columns="year").assign(updated=pd.Series(dtype="datetime64[ns]"))
+        self.next_id = 0
+        self.requests = collections.deque(maxlen=1000)
+
+    def add(self, df):
+        # df：id / time / latitude / longitude / depth / mag / place (updated 沒給就等於 time)
+        df = df.drop(columns="year", errors="ignore")
+        if "updated" not in df:
+            df = df.assign(updated=df["time"])
+        with self.lock:
+            self.events = pd.concat([self.events, df[self.events.columns]], ignore_index=True)
+
+    def revise(self, event_id, **changes):
+        # USGS 事後修正：同一 id 再出現一次，updated 較新
+        with self.lock:
+            row = self.events[self.events["id"] == event_id].iloc[[-1]].copy()
+            for column, value in changes.items():
+                row[column] = value
+            row["updated"] = pd.Timestamp.now(tz="UTC").tz_localize(None)
+            self.events = pd.concat([self.events, row], ignore_index=True)
+
+    def grow(self):
+        # 新事件的時間稍微往前 (模擬 USGS 晚幾分鐘才上架)；偶爾重送上一筆的修訂版
+        now = pd.Timestamp.now(tz="UTC").tz_localize(None)
+        df = make_events(self.batch, seed=int(self.rng.integers(1 << 31)), min_mag=2.0, id_offset=self.next_id)
+        df["id"] = "live" + df["id"]
+        df["time"] = now - pd.to_timedelta(self.rng.uniform(0, 300, self.batch), unit="s")
+        self.next_id += self.batch
+        previous = self.events["id"].iloc[-1] if len(self.events) else None
+        self.add(df)
+        if previous is not None and self.rng.random() < 0.3:
+            self.revise(previous, mag=round(float(self.events.loc[self.events["id"] == previous, "mag"].iloc[-1]) + 0.1, 1))
+        print(f"新增 {self.batch} 筆，共 {len(self.events)} 筆")
+
+    def query(self, params):
+        self.requests.append(params)
+        with self.lock:
+            df = self.events
+        # 同一 id 只回傳最新的版本 (與 FDSN 相同)
+        df = df.sort_values("updated", kind="stable").drop_duplicates("id", keep="last")
+        if "starttime" in params:
+            df = df[df["time"] >= pd.Timestamp(params["starttime"][0])]
+        if "endtime" in params:
+            df = df[df["time"] < pd.Timestamp(params["endtime"][0])]
+        if "minmagnitude" in params:
+            df = df[df["mag"] >= float(params["minmagnitude"][0])]
+        df = df.sort_values("time")
+        out = pd.DataFrame({c: df[c] if c in df else "" for c in FDSN_COLUMNS})
+        out["time"] = df["time"].dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        out["updated"] = df["updated"].dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        buf = io.StringIO()
+        out.to_csv(buf, index=False)
+        return buf.getvalue().encode("utf8") if len(out) else b""
+
+
+def make_server(fake, port=0):
+    # port=0：由系統挑一個空的埠 (測試用)，實際位址見 server.server_address
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            body = fake.query(urllib.parse.parse_qs(url.query))
+            # FDSN 查無資料時回 204
+            self.send_response(200 if body else 204)
+            self.send_header("Content-Type", "text/csv")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer(("127.0.0.1", port), Handler)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=18778)
+    parser.add_argument("--every", type=float, default=5.0, help="每隔幾秒新增一批")
+    parser.add_argument("--batch", type=int, default=3, help="每批幾筆")
+    args = parser.parse_args()
+
+    fake = FakeCatalog(args.batch)
+
+    def grow_forever():
+        while True:
+            time.sleep(args.every)
+            fake.grow()
+
+    threading.Thread(target=grow_forever, daemon=True).start()
+    print(f"假 FDSN feed：http://127.0.0.1:{args.port}/query (每 {args.every:g} 秒 {args.batch} 筆)")
+    make_server(fake, args.port).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# 共用資料模組：供 pages/ 底下各頁面匯入 (pages 目錄會被 solara 當成頁面自動路由)
@@ -0,0 +1,357 @@
+import concurrent.futures
+import datetime
+import json
+import os
+import shutil
+import threading
+import urllib.parse
+import urllib.request
+from dataclasses import dataclass
+from typing import Optional
+
+import duckdb
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# ==========================================
+# 1. 設定：USGS FDSN 端點與本機快取位置
+# ==========================================
+# 測試時可用環境變數指向本機假伺服器 (例如 http://127.0.0.1:8000/query)
+USGS_FDSN_URL = os.environ.get("USGS_FDSN_URL", "https://earthquake.usgs.gov/fdsnws/event/1/query")
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.environ.get("QUAKE_CACHE_DIR", os.path.join(_REPO_ROOT, "data", "cache"))
+
+# 台灣東部與花蓮外海 (與原本的查詢條件相同)
+TAIWAN_REGION = {
+    "minmagnitude": 4.0,
+    "minlatitude": 21.0,
+    "maxlatitude": 26.0,
+    "minlongitude": 119.0,
+    "maxlongitude": 123.0,
+}
+CATALOG_START = datetime.datetime(2000, 1, 1)
+
+# 增量更新時往回多抓一段，讓 USGS 事後修正的地震 (規模、位置) 也能被覆蓋
+OVERLAP_WINDOW = datetime.timedelta(days=30)
+# 距離上次同步不到這段時間就直接用快取，不連網
+MIN_REFRESH_INTERVAL = datetime.timedelta(hours=1)
+
+CATALOG_FILE = "usgs_taiwan.parquet"
+META_FILE = "usgs_taiwan.meta.json"
+
+EMPTY_COLUMNS = ['id', 'time', 'latitude', 'longitude', 'mag', 'depth', 'year', 'place']
+
+# USGS CSV 約有 22 欄，只留下頁面與增量同步用得到的欄位
+CSV_COLUMNS = ['time', 'id', 'updated', 'latitude', 'longitude', 'depth', 'mag', 'place']
+# float32 對經緯度約 1 m 精度、規模 / 深度遠小於量測誤差；year 用 int16 就夠
+CSV_DTYPES = {'latitude': 'float32', 'longitude': 'float32', 'depth': 'float32', 'mag': 'float32', 'id': 'str', 'place': 'str'}
+# 分段解析：尖峰記憶體只多一段原始資料，不隨目錄大小成長
+CSV_CHUNK_ROWS = int(os.environ.get("QUAKE_CSV_CHUNK_ROWS", "50000"))
+
+
+@dataclass
+class SyncStats:
+    fetched: int = 0          # 這次從網路下載的筆數
+    reused: int = 0           # 直接沿用快取的筆數
+    total: int = 0
+    high_water_mark: Optional[str] = None
+    from_network: bool = False
+    memory_bytes: int = 0     # 目錄在記憶體中的大小 (含字串 / 類別)
+
+
+# ==========================================
+# 2. 下載：只抓指定時間窗
+# ==========================================
+def build_query_url(starttime, endtime=None, base_url=None, min_magnitude=None):
+    params = {"format": "csv", "orderby": "time-asc", "starttime": starttime.strftime("%Y-%m-%dT%H:%M:%S")}
+    if endtime is not None:
+        params["endtime"] = endtime.strftime("%Y-%m-%dT%H:%M:%S")
+    params.update(TAIWAN_REGION)
+    if min_magnitude is not None:
+        params["minmagnitude"] = min_magnitude
+    return f"{base_url or USGS_FDSN_URL}?{urllib.parse.urlencode(params)}"
+
+
+def _normalize(df):
+    # 時間統一存成 UTC (不帶時區)，Parquet 讀回來才不會被轉成本地時區
+    df['time'] = pd.to_datetime(df['time'], utc=True).dt.tz_localize(None)
+    if 'updated' in df.columns:
+        df['updated'] = pd.to_datetime(df['updated'], utc=True).dt.tz_localize(None)
+    df['year'] = df['time'].dt.year
+    return compact(df.dropna(subset=['latitude', 'longitude', 'mag', 'depth']))
+
+
+def compact(df):
+    # 數值欄降成 float32 / int16，地名 (大量重複) 存成類別欄
+    df = df.astype({c: t for c, t in CSV_DTYPES.items() if c in df.columns and t == 'float32'})
+    if 'year' in df.columns:
+        df['year'] = df['year'].astype('int16')
+    if 'place' in df.columns and not isinstance(df['place'].dtype, pd.CategoricalDtype):
+        # 缺值先補空字串：類別欄之後不能再 fillna 一個不在類別裡的值
+        df['place'] = df['place'].fillna("").astype('category')
+    return df
+
+
+def concat_compact(frames):
+    # 各段的地名類別不同，先聯集類別再合併，否則 concat 會退回成一般字串欄
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=EMPTY_COLUMNS)
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    places = union_categoricals([f['place'] for f in frames])
+    merged = pd.concat([f.drop(columns='place') for f in frames], ignore_index=True)
+    merged['place'] = places
+    return merged[frames[0].columns]
+
+
+def memory_usage(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def fetch_events(starttime, endtime=None, base_url=None, chunk_rows=None, min_magnitude=None):
+    api_url = build_query_url(starttime, endtime, base_url, min_magnitude)
+    print(f"正在下載台灣地震資料: {api_url} ...")
+    # 直接把 HTTP 回應交給 read_csv：pandas 收到網址會先把整份回應讀進記憶體
+    with urllib.request.urlopen(api_url) as response:
+        try:
+            reader = pd.read_csv(response, usecols=CSV_COLUMNS, dtype=CSV_DTYPES,
+                                 chunksize=chunk_rows or CSV_CHUNK_ROWS)
+            # 每段解析完立刻瘦身，原始字串欄不會整份留在記憶體裡
+            return concat_compact([_normalize(chunk) for chunk in reader])
+        except pd.errors.EmptyDataError:
+            # FDSN 查無資料時會回傳 204 (空內容)
+            return pd.DataFrame(columns=EMPTY_COLUMNS)
+
+
+# ==========================================
+# 3. 本機快取：Parquet 目錄 + 高水位時間
+# ==========================================
+def _paths(cache_dir):
+    cache_dir = cache_dir or CACHE_DIR
+    return os.path.join(cache_dir, CATALOG_FILE), os.path.join(cache_dir, META_FILE)
+
+
+def read_cache(cache_dir=None):
+    parquet_path, meta_path = _paths(cache_dir)
+    if not (os.path.exists(parquet_path) and os.path.exists(meta_path)):
+        return None, None
+    try:
+        with open(meta_path, encoding="utf8") as f:
+            meta = json.load(f)
+        df = duckdb.connect().execute("SELECT * FROM read_parquet(?)", [parquet_path]).df()
+    except Exception as e:
+        print(f"快取讀取失敗，將重新下載: {e}")
+        return None, None
+    # 舊版快取是 float64 / 字串欄，讀進來一律轉成精簡型別
+    return compact(df), meta
+
+
+def write_cache(df, meta, cache_dir=None):
+    parquet_path, meta_path = _paths(cache_dir)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+
+    # 先寫暫存檔再 rename，避免寫到一半被其他行程讀到
+    tmp_path = parquet_path + ".tmp"
+    con = duckdb.connect()
+    con.register("catalog_df", df)
+    con.execute(f"COPY catalog_df TO '{tmp_path.replace(chr(39), chr(39) * 2)}' (FORMAT PARQUET)")
+    con.close()
+    os.replace(tmp_path, parquet_path)
+
+    with open(meta_path + ".tmp", "w", encoding="utf8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def merge_events(cached, fresh):
+    # 以 USGS 事件 id 合併：同一 id 以新下載的版本為準
+    if cached is None or cached.empty:
+        return fresh.reset_index(drop=True), 0
+    if fresh.empty:
+        return cached, len(cached)
+    kept = cached[~cached['id'].isin(fresh['id'])]
+    merged = concat_compact([kept, fresh])
+    merged = merged.drop_duplicates(subset='id', keep='last').sort_values('time', kind='stable')
+    return merged.reset_index(drop=True), len(kept)
+
+
+# ==========================================
+# 4. 同步：冷啟動讀快取，只補抓高水位之後的資料
+# ==========================================
+def sync_catalog(cache_dir=None, base_url=None, overlap=OVERLAP_WINDOW,
+                 min_interval=MIN_REFRESH_INTERVAL, now=None):
+    now = now or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    cached, meta = read_cache(cache_dir)
+    stats = SyncStats()
+
+    if cached is not None:
+        last_sync = datetime.datetime.fromisoformat(meta["last_sync"])
+        stats.high_water_mark = meta.get("high_water_mark")
+        if now - last_sync < min_interval:
+            stats.reused = stats.total = len(cached)
+            stats.memory_bytes = memory_usage(cached)
+            print(f"使用本機地震快取：{stats.total} 筆 (上次同步 {meta['last_sync']}，記憶體 {stats.memory_bytes / 1e6:.1f} MB)")
+            return cached, stats
+
+    if cached is not None and not cached.empty and stats.high_water_mark:
+        start = datetime.datetime.fromisoformat(stats.high_water_mark) - overlap
+    else:
+        start = CATALOG_START
+
+    try:
+        fresh = fetch_events(start, base_url=base_url)
+    except Exception as e:
+        print(f"下載失敗: {e}")
+        if cached is not None:
+            stats.reused = stats.total = len(cached)
+            stats.memory_bytes = memory_usage(cached)
+            return cached, stats
+        # 回傳空 DataFrame 避免報錯
+        return pd.DataFrame(columns=EMPTY_COLUMNS), stats
+
+    merged, reused = merge_events(cached, fresh)
+    stats.fetched = len(fresh)
+    stats.reused = reused
+    stats.total = len(merged)
+    stats.from_network = True
+    stats.memory_bytes = memory_usage(merged)
+    if not merged.empty:
+        stats.high_water_mark = merged['time'].max().isoformat()
+
+    try:
+        write_cache(merged, {
+            "high_water_mark": stats.high_water_mark,
+            "last_sync": now.isoformat(),
+            "rows": stats.total,
+        }, cache_dir)
+    except OSError as e:
+        # 快取寫不進去 (例如唯讀磁碟) 不影響這次使用
+        print(f"快取寫入失敗: {e}")
+
+    print(f"地震資料同步完成：新下載 {stats.fetched} 筆，沿用快取 {stats.reused} 筆，共 {stats.total} 筆 (記憶體 {stats.memory_bytes / 1e6:.1f} MB)。")
+    return merged, stats
+
+
+# ==========================================
+# 5. 背景載入：整個行程共用一個 Future
+# ==========================================
+# 頁面 import 時只送出工作，不等網路；第一次同步完成後所有 session 共用結果
+# 結果是 (目錄, SyncStats)：memory 模式的目錄是 DataFrame，parquet 模式是分區資料夾路徑
+_loader = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="quake-catalog")
+_catalog_future = None
+_future_lock = threading.Lock()
+
+
+def load_catalog_async(**kwargs):
+    global _catalog_future
+    with _future_lock:
+        if _catalog_future is None:
+            sync = sync_partitioned if STORAGE_MODE == "parquet" else sync_catalog
+            _catalog_future = _loader.submit(sync, **kwargs)
+        return _catalog_future
+
+
+# ==========================================
+# 6. 分區 Parquet 目錄：依 年份 / 整數規模級距 分區 (Hive 目錄結構)
+# ==========================================
+# QUAKE_STORAGE=parquet：目錄不常駐記憶體，DuckDB 直接查磁碟上的分區檔，
+# 年份 / 規模篩選只會打開相關分區，M2 以上的完整目錄也載得動
+STORAGE_MODE = os.environ.get("QUAKE_STORAGE", "memory")
+PARTITION_DIR = "usgs_taiwan_parts"
+PARTITION_META_FILE = "usgs_taiwan_parts.meta.json"
+PARTITION_MIN_MAGNITUDE = float(os.environ.get("QUAKE_PARTITION_MIN_MAG", "2.0"))
+
+
+def partition_root(cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, PARTITION_DIR)
+
+
+def write_partitions(df, root, years=None):
+    # 以年份為更新單位：years (預設為 df 內出現的年份) 的分區整個換掉，其他年份不動；
+    # 重抓的年份回來是空的 (例如事件被 USGS 刪除) 也要清掉舊分區，否則舊資料會一直被查到
+    years = set(int(y) for y in (df['year'].unique() if years is None else years))
+    if df.empty:
+        for year in years:
+            shutil.rmtree(os.path.join(root, f"year={year}"), ignore_errors=True)
+        return
+    tmp_root = root + ".tmp"
+    shutil.rmtree(tmp_root, ignore_errors=True)
+    con = duckdb.connect()
+    con.register("catalog_df", df)
+    # 分區內依規模排序：每個 row group 的 mag min/max 很窄，規模篩選可直接跳過整段
+    con.execute(f"""
+        COPY (SELECT *, floor(mag)::INTEGER AS mag_band FROM catalog_df ORDER BY year, mag_band, mag)
+        TO '{tmp_root.replace(chr(39), chr(39) * 2)}' (FORMAT PARQUET, PARTITION_BY (year, mag_band))
+    """)
+    con.close()
+
+    os.makedirs(root, exist_ok=True)
+    written = set(os.listdir(tmp_root))   # year=YYYY
+    for name in written:
+        dest = os.path.join(root, name)
+        shutil.rmtree(dest, ignore_errors=True)
+        os.replace(os.path.join(tmp_root, name), dest)
+    for year in years:
+        if f"year={year}" not in written:
+            shutil.rmtree(os.path.join(root, f"year={year}"), ignore_errors=True)
+    shutil.rmtree(tmp_root, ignore_errors=True)
+
+
+def count_partitioned(root):
+    if not os.path.isdir(root) or not os.listdir(root):
+        return 0
+    glob = os.path.join(root, "**", "*.parquet").replace("'", "''")
+    return duckdb.connect().execute(f"SELECT count(*) FROM read_parquet('{glob}', hive_partitioning = true)").fetchone()[0]
+
+
+def sync_partitioned(cache_dir=None, base_url=None, min_magnitude=PARTITION_MIN_MAGNITUDE,
+                     overlap=OVERLAP_WINDOW, min_interval=MIN_REFRESH_INTERVAL, now=None):
+    # 逐年下載、逐年寫入：記憶體裡最多只有一年的資料 (FDSN 單次查詢也有筆數上限)
+    now = now or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    root = partition_root(cache_dir)
+    meta_path = os.path.join(cache_dir or CACHE_DIR, PARTITION_META_FILE)
+    stats = SyncStats()
+
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding="utf8") as f:
+            meta = json.load(f)
+    if meta.get("min_magnitude") != min_magnitude:
+        meta = {"min_magnitude": min_magnitude, "years": {}}
+
+    if meta.get("last_sync") and now - datetime.datetime.fromisoformat(meta["last_sync"]) < min_interval:
+        stats.reused = stats.total = count_partitioned(root)
+        print(f"使用本機分區目錄：{stats.total} 筆 (M{min_magnitude} 以上，上次同步 {meta['last_sync']})")
+        return root, stats
+
+    # 已完整下載的年份不再重抓；今年 (以及重疊窗跨到的去年) 每次都重抓
+    open_years = {now.year, (now - overlap).year}
+    for year in range(CATALOG_START.year, now.year + 1):
+        if str(year) in meta["years"] and year not in open_years:
+            stats.reused += meta["years"][str(year)]
+            continue
+        try:
+            df = fetch_events(datetime.datetime(year, 1, 1), datetime.datetime(year + 1, 1, 1),
+                              base_url=base_url, min_magnitude=min_magnitude)
+            write_partitions(df, root, years=[year])
+        except Exception as e:
+            print(f"{year} 年下載失敗: {e}")
+            continue
+        meta["years"][str(year)] = len(df)
+        stats.fetched += len(df)
+        stats.from_network = True
+
+    meta["last_sync"] = now.isoformat()
+    try:
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        with open(meta_path + ".tmp", "w", encoding="utf8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(meta_path + ".tmp", meta_path)
+    except OSError as e:
+        print(f"快取寫入失敗: {e}")
+
+    stats.total = count_partitioned(root)
+    print(f"分區目錄同步完成：新下載 {stats.fetched} 筆，沿用 {stats.reused} 筆，共 {stats.total} 筆。")
+    return root, stats
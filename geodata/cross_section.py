@@ -0,0 +1,170 @@
+import math
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from geodata import quake_db
+
+# ==========================================
+# 1. 空間索引：規則格網 + 依格號排序 (建一次，查詢只碰到範圍內的格子)
+# ==========================================
+KM_PER_DEG_LAT = 110.57
+
+
+class GridIndex:
+    def __init__(self, lon, lat, cell_deg=0.1):
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        self.cell_deg = cell_deg
+        self.lon0 = float(lon.min()) if len(lon) else 0.0
+        self.lat0 = float(lat.min()) if len(lat) else 0.0
+        ix = ((lon - self.lon0) / cell_deg).astype(np.int64)
+        iy = ((lat - self.lat0) / cell_deg).astype(np.int64)
+        self.nx = int(ix.max()) + 1 if len(ix) else 1
+        self.ny = int(iy.max()) + 1 if len(iy) else 1
+        cell = iy * self.nx + ix
+        self.order = np.argsort(cell, kind="stable")
+        self.sorted_cells = cell[self.order]
+
+    def query_bbox(self, west, south, east, north):
+        # 回傳落在 bbox 所涵蓋格子內的列索引 (候選點，之後再精確篩選)
+        ix0 = max(int(math.floor((west - self.lon0) / self.cell_deg)), 0)
+        ix1 = min(int(math.floor((east - self.lon0) / self.cell_deg)), self.nx - 1)
+        iy0 = max(int(math.floor((south - self.lat0) / self.cell_deg)), 0)
+        iy1 = min(int(math.floor((north - self.lat0) / self.cell_deg)), self.ny - 1)
+        if ix0 > ix1 or iy0 > iy1:
+            return np.empty(0, dtype=np.int64)
+        # 同一列 (iy) 上連續的格子在排序後也是連續的一段，每列做一次二分搜尋
+        rows = np.arange(iy0, iy1 + 1) * self.nx
+        lo = np.searchsorted(self.sorted_cells, rows + ix0, side="left")
+        hi = np.searchsorted(self.sorted_cells, rows + ix1, side="right")
+        if not len(lo):
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.order[a:b] for a, b in zip(lo, hi)])
+
+
+_index_lock = threading.Lock()
+_index_cache = {}
+
+
+def get_index():
+    # 每份基本目錄只建一次索引 (以目錄版本為鍵，兩種儲存模式都由 DuckDB 掃五個數值欄)；
+    # 即時 feed 不改版本，疊加層的事件在查詢時另外補上 (見 cross_section)
+    version = quake_db.catalog_version()
+    with _index_lock:
+        cached = _index_cache.get("catalog")
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        columns = quake_db.section_input()
+        index = GridIndex(columns['longitude'], columns['latitude'])
+        # 常用欄位留成 NumPy，剖面查詢時只用索引取值
+        index.columns = columns
+        _index_cache["catalog"] = (version, index)
+        return index
+
+
+# ==========================================
+# 2. 剖面線：中心點 + 方位角 + 半長 + 平移 + 緩衝寬度
+# ==========================================
+# 預設：通過立霧溪出海口的東西向剖面
+LIWU_RIVER_MOUTH = (24.138, 121.655)
+
+
+@dataclass(frozen=True)
+class SectionLine:
+    center: tuple = LIWU_RIVER_MOUTH
+    azimuth: float = 90.0        # 由北順時針 (90 = 東西向)
+    half_length_km: float = 100.0
+    offset_km: float = 0.0       # 垂直於剖面線方向的平移 (正值 = 往左 / 北側)
+    buffer_km: float = 20.0
+
+    def _frame(self):
+        lat0, lon0 = self.center
+        kx = 111.32 * math.cos(math.radians(lat0))
+        az = math.radians(self.azimuth)
+        ux, uy = math.sin(az), math.cos(az)          # 沿線方向 (東, 北)
+        vx, vy = -uy, ux                             # 垂直方向 (左側)
+        return lat0, lon0, kx, ux, uy, vx, vy
+
+    def endpoints(self):
+        lat0, lon0, kx, ux, uy, vx, vy = self._frame()
+        pts = []
+        for s in (-self.half_length_km, self.half_length_km):
+            x = s * ux + self.offset_km * vx
+            y = s * uy + self.offset_km * vy
+            pts.append((lat0 + y / KM_PER_DEG_LAT, lon0 + x / kx))
+        return pts
+
+    def corners(self):
+        # 緩衝帶的四個角 (lat, lon)，依序繞一圈
+        lat0, lon0, kx, ux, uy, vx, vy = self._frame()
+        pts = []
+        for s, t in ((-1, -1), (1, -1), (1, 1), (-1, 1)):
+            x = s * self.half_length_km * ux + (self.offset_km + t * self.buffer_km) * vx
+            y = s * self.half_length_km * uy + (self.offset_km + t * self.buffer_km) * vy
+            pts.append((lat0 + y / KM_PER_DEG_LAT, lon0 + x / kx))
+        return pts
+
+    def bbox(self):
+        lats, lons = zip(*self.corners())
+        return min(lons), min(lats), max(lons), max(lats)
+
+    def overlay(self):
+        # 地圖疊圖用 (quake_layers.add_section_layer)：剖面線端點 A / B 與緩衝帶，座標取到小數第 4 位
+        def rounded(pts):
+            return [[round(lat, 4), round(lon, 4)] for lat, lon in pts]
+        return {"line": rounded(self.endpoints()), "buffer": rounded(self.corners()),
+                "tooltip": f"剖面線 A → B (緩衝 ±{self.buffer_km:.0f} km)"}
+
+    def project(self, lon, lat):
+        # 回傳 (沿線距離 km，從起點算起；離線距離 km)
+        lat0, lon0, kx, ux, uy, vx, vy = self._frame()
+        x = (np.asarray(lon, dtype=float) - lon0) * kx
+        y = (np.asarray(lat, dtype=float) - lat0) * KM_PER_DEG_LAT
+        along = x * ux + y * uy
+        across = x * vx + y * vy - self.offset_km
+        return along + self.half_length_km, across
+
+
+# ==========================================
+# 3. 剖面查詢：索引挑候選 (+ 即時疊加層) → 向量化投影 → 條件篩選
+# ==========================================
+SECTION_COLUMNS = ['distance_km', 'offset_km', 'depth', 'mag', 'year']
+
+
+def cross_section(line, min_mag=None, year_range=None):
+    # 呼叫端先 quake_db.use_catalog(...)
+    bbox = line.bbox()
+    index = get_index()
+    candidates = index.query_bbox(*bbox)
+    col = {c: v[candidates] for c, v in index.columns.items()}
+
+    # 基本目錄裡被即時 feed 修訂過的舊版換成疊加層裡的新版，新事件一併補上
+    live, revised = quake_db.live_section_rows(*bbox)
+    if len(revised):
+        keep = ~np.isin(col['id_key'], revised)
+        col = {c: v[keep] for c, v in col.items()}
+    if not live.empty:
+        col = {c: np.concatenate([v, live[c].to_numpy()]) for c, v in col.items()}
+    if not len(col['mag']):
+        return pd.DataFrame(columns=SECTION_COLUMNS)
+    return _project_and_filter(col, line, min_mag, year_range)
+
+
+def _project_and_filter(col, line, min_mag, year_range):
+    distance, across = line.project(col['longitude'], col['latitude'])
+    keep = (np.abs(across) <= line.buffer_km) & (distance >= 0) & (distance <= 2 * line.half_length_km)
+    if min_mag is not None:
+        keep &= col['mag'] >= min_mag
+    if year_range is not None:
+        keep &= (col['year'] >= year_range[0]) & (col['year'] <= year_range[1])
+
+    return pd.DataFrame({
+        'distance_km': distance[keep],
+        'offset_km': across[keep],
+        'depth': col['depth'][keep],
+        'mag': col['mag'][keep],
+        'year': col['year'][keep],
+    }).sort_values('distance_km', kind='stable').reset_index(drop=True)
@@ -0,0 +1,194 @@
+import base64
+import functools
+import math
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from geodata import quake_db
+
+# ==========================================
+# 1. 預先分箱的點陣圖索引 (bitmap index)
+# ==========================================
+# 每個維度 × 每個分箱一條點陣圖 (每個地震 1 bit，64 筆包成一個 uint64)：
+# 刷選 = 範圍內分箱的點陣圖做 OR，跨維度做 AND；直方圖 = 分箱點陣圖 AND 篩選後數 1 的個數
+# 拖動刷選時完全不碰 SQL，只做幾 MB 的位元運算
+MAG_BIN = 0.1
+DEPTH_BIN_KM = 10.0
+DIMENSIONS = ("mag", "depth", "year")
+DIMENSION_LABELS = {"mag": "規模", "depth": "深度 (km)", "year": "年份"}
+
+
+# 每個位元組有幾個 1：numpy 2 以前沒有 np.bitwise_count 時查表
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _count_bits(bitmaps):
+    # 最後一維 (一條點陣圖的所有 word) 的 1 個數
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bitmaps).sum(axis=-1, dtype=np.int64)
+    return _POPCOUNT8[np.ascontiguousarray(bitmaps).view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def _pack(mask, words):
+    # bool 陣列 → uint64 點陣圖 (第 i 筆在第 i // 64 個 word 的第 i % 64 bit)
+    padded = np.zeros(words * 64, dtype=bool)
+    padded[:len(mask)] = mask
+    return np.packbits(padded, bitorder="little").view(np.uint64)
+
+
+class Dimension:
+    def __init__(self, name, edges, bins, words):
+        # edges：分箱邊界 (長度 = 分箱數 + 1)，bins：每筆地震所在的分箱編號
+        self.name = name
+        self.edges = edges
+        self.bitmaps = np.stack([_pack(bins == k, words) for k in range(len(edges) - 1)]) \
+            if len(edges) > 1 else np.zeros((0, words), dtype=np.uint64)
+
+    def bin_range(self, lo, hi):
+        # 數值範圍 [lo, hi) → 分箱 [k0, k1)；刷選邊界都落在分箱邊界上 (滑桿步距 = 分箱寬度)
+        k0 = int(np.searchsorted(self.edges, lo + 1e-9, side="right")) - 1
+        k1 = int(np.searchsorted(self.edges, hi - 1e-9, side="left"))
+        return max(k0, 0), min(k1, len(self.edges) - 1)
+
+    def select(self, lo, hi):
+        # 範圍內分箱的 OR；整個維度都選到就回傳 None (不篩選)
+        k0, k1 = self.bin_range(lo, hi)
+        if k0 == 0 and k1 == len(self.edges) - 1:
+            return None
+        if k0 >= k1:
+            return np.zeros(self.bitmaps.shape[1], dtype=np.uint64)
+        return np.bitwise_or.reduce(self.bitmaps[k0:k1], axis=0)
+
+
+@dataclass
+class CrossfilterResult:
+    total: int                          # 三個維度都通過的筆數
+    histograms: dict                    # 維度 → 各分箱筆數 (套用「其他」維度的刷選)
+    bits: np.ndarray                    # 通過全部刷選的點陣圖
+
+
+class Crossfilter:
+    def __init__(self, columns, min_mag=None, map_rows=None):
+        # columns：quake_db.crossfilter_input 的 {欄名: 陣列} (DataFrame 也可以，依規模由大到小排序)；
+        # min_mag：因筆數上限而設的規模下限 (None = 全目錄)；map_rows：地圖只畫前幾筆 (None = 全部)
+        n = len(columns['mag'])
+        self.n = n
+        self.words = (n + 63) // 64
+        self.min_mag = min_mag
+        self.map_rows = n if map_rows is None else min(n, int(map_rows))
+        self.latitude = np.asarray(columns['latitude'], dtype=np.float32)
+        self.longitude = np.asarray(columns['longitude'], dtype=np.float32)
+        self.mag = np.asarray(columns['mag'], dtype=np.float32)
+        self.depth = np.asarray(columns['depth'], dtype=np.float32)
+        self.year = np.asarray(columns['year'], dtype=np.int16)
+
+        mag = np.nan_to_num(self.mag.astype(float), nan=0.0)
+        depth = np.clip(np.nan_to_num(self.depth.astype(float), nan=0.0), 0, None)
+        year = self.year.astype(int)
+        lo_mag = math.floor(mag.min() * 10) / 10 if n else 0.0
+        hi_mag = math.floor(mag.max() * 10) / 10 + MAG_BIN if n else MAG_BIN
+        hi_depth = (math.floor(depth.max() / DEPTH_BIN_KM) + 1) * DEPTH_BIN_KM if n else DEPTH_BIN_KM
+        lo_year, hi_year = (int(year.min()), int(year.max()) + 1) if n else (0, 1)
+        mag_edges = np.round(np.arange(round((hi_mag - lo_mag) / MAG_BIN) + 1) * MAG_BIN + lo_mag, 1)
+        depth_edges = np.arange(0.0, hi_depth + DEPTH_BIN_KM / 2, DEPTH_BIN_KM)
+        year_edges = np.arange(lo_year, hi_year + 1, dtype=float)
+
+        # 規模先四捨五入到 0.1 (與 USGS 的精度一致) 再分箱，避免 float32 誤差落到隔壁分箱
+        self.dims = {
+            "mag": Dimension("mag", mag_edges, np.round((np.round(mag, 1) - lo_mag) / MAG_BIN).astype(np.int64), self.words),
+            "depth": Dimension("depth", depth_edges, np.minimum(depth // DEPTH_BIN_KM, len(depth_edges) - 2).astype(np.int64), self.words),
+            "year": Dimension("year", year_edges, year - lo_year, self.words),
+        }
+
+    def __len__(self):
+        return self.n
+
+    def extent(self, name):
+        edges = self.dims[name].edges
+        return float(edges[0]), float(edges[-1])
+
+    def update(self, brushes):
+        # brushes：維度 → (lo, hi) 數值範圍 ([lo, hi))，沒給的維度不篩選
+        selected = {}
+        for name, dim in self.dims.items():
+            if name in brushes:
+                bits = dim.select(*brushes[name])
+                if bits is not None:
+                    selected[name] = bits
+
+        all_bits = np.full(self.words, np.uint64(0xFFFFFFFFFFFFFFFF), dtype=np.uint64)
+        if self.n % 64:
+            # 最後一個 word 超出筆數的 bit 要清掉，否則篩選為空時會被算進總數
+            all_bits[-1] = np.uint64((1 << (self.n % 64)) - 1)
+
+        histograms = {}
+        for name, dim in self.dims.items():
+            # crossfilter 慣例：每個直方圖只套用「其他」維度的刷選，自己的刷選範圍外仍看得到分布
+            others = [bits for other, bits in selected.items() if other != name]
+            if others:
+                mask = functools.reduce(np.bitwise_and, others)
+                histograms[name] = _count_bits(dim.bitmaps & mask)
+            else:
+                histograms[name] = _count_bits(dim.bitmaps)
+
+        bits = functools.reduce(np.bitwise_and, selected.values(), all_bits)
+        return CrossfilterResult(int(_count_bits(bits)), histograms, bits)
+
+    def indices(self, bits):
+        # 點陣圖 → 列索引
+        return np.flatnonzero(np.unpackbits(bits.view(np.uint8), bitorder="little")[:self.n])
+
+    def encode(self, bits):
+        # 點陣圖的前 map_rows 筆 → base64 (第 i 筆 = 第 i // 8 個位元組的第 i % 8 bit)，給地圖 iframe 的 data-selection
+        raw = bits.view(np.uint8)[:(self.map_rows + 7) // 8].copy()
+        if self.map_rows % 8:
+            raw[-1] &= (1 << (self.map_rows % 8)) - 1
+        return base64.b64encode(raw.tobytes()).decode("ascii")
+
+    def points(self):
+        # 地圖要畫的地震 (索引的前 map_rows 筆 = 規模最大的那些，欄位同 quake_db.POINT_COLUMNS 但沒有地名)：
+        # 地圖上畫一次，刷選只切換顯示；直方圖與選取筆數仍以整個索引計算
+        k = self.map_rows
+        return pd.DataFrame({
+            "latitude": self.latitude[:k], "longitude": self.longitude[:k], "mag": self.mag[:k],
+            "depth": self.depth[:k], "year": self.year[:k],
+        })
+
+
+# 索引的筆數上限 (記憶體保護)：超過時由大到小保留規模較大的地震 (規模下限見 Crossfilter.min_mag)；
+# 50 萬筆的索引約 30 MB，刷選一次 (位元運算 + 直方圖 + 編碼) 只要幾 ms
+MAX_ROWS = int(os.environ.get("CROSSFILTER_MAX_ROWS", "1000000"))
+# 地圖只畫規模最大的前幾筆：地圖 HTML 的大小與每次刷選寫進 data-selection 的位元組數由它決定
+MAP_ROWS = int(os.environ.get("CROSSFILTER_MAP_ROWS", "50000"))
+
+
+@functools.lru_cache(maxsize=2)
+def _build(version):
+    # version 只用來當快取鍵：每份目錄只建一次索引；只掃五個數值欄，不把整份目錄讀成 DataFrame
+    min_mag = quake_db.crossfilter_floor(MAX_ROWS)
+    return Crossfilter(quake_db.crossfilter_input(min_mag), min_mag, MAP_ROWS)
+
+
+def get_crossfilter():
+    return _build(quake_db.catalog_version())
+
+
+# ==========================================
+# 2. 直方圖：直接輸出 SVG (不經 matplotlib，拖動刷選時幾乎不花時間)
+# ==========================================
+def histogram_svg(counts, active, width=300, height=70, color="#3498db"):
+    # active：(k0, k1) 刷選範圍內的分箱用主色，範圍外灰色
+    counts = np.asarray(counts)
+    peak = max(int(counts.max()) if len(counts) else 0, 1)
+    bar = width / max(len(counts), 1)
+    k0, k1 = active
+    rects = []
+    for k, c in enumerate(counts):
+        h = c / peak * (height - 2)
+        fill = color if k0 <= k < k1 else "#7f8c8d"
+        rects.append(f'<rect x="{k * bar:.1f}" y="{height - h:.1f}" width="{max(bar - 0.5, 0.5):.1f}" height="{h:.1f}" fill="{fill}"/>')
+    return (f'<svg viewBox="0 0 {width} {height}" width="100%" height="{height}" preserveAspectRatio="none">'
+            + "".join(rects) + "</svg>")
@@ -0,0 +1,265 @@
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import duckdb
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from geodata import catalog, quake_db
+from geodata.route_quakes import EARTH_RADIUS_KM, unit_vectors
+
+# ==========================================
+# 1. 時空窗：主震規模 → (距離 km, 時間 日)
+# ==========================================
+DAY_SECONDS = 86400.0
+
+
+def gardner_knopoff_window(mag):
+    # Gardner & Knopoff (1974)
+    mag = np.asarray(mag, dtype=float)
+    dist = 10 ** (0.1238 * mag + 0.983)
+    days = np.where(mag >= 6.5, 10 ** (0.032 * mag + 2.7389), 10 ** (0.5409 * mag - 0.547))
+    return dist, days
+
+
+def uhrhammer_window(mag):
+    # Uhrhammer (1986)：距離與時間窗都比 GK 小，留下較多事件
+    mag = np.asarray(mag, dtype=float)
+    return np.exp(-1.024 + 0.804 * mag), np.exp(-2.87 + 1.235 * mag)
+
+
+def gruenthal_window(mag):
+    # Grünthal (歐洲地震目錄常用)
+    mag = np.asarray(mag, dtype=float)
+    dist = np.exp(1.77 + np.sqrt(0.037 + 1.02 * mag))
+    days = np.where(mag >= 6.5, 10 ** (2.8 + 0.024 * mag), np.exp(-3.95 + np.sqrt(0.62 + 17.32 * mag)))
+    return dist, days
+
+
+WINDOWS = {
+    "gardner_knopoff": gardner_knopoff_window,
+    "uhrhammer": uhrhammer_window,
+    "gruenthal": gruenthal_window,
+}
+DECLUSTER_METHOD = os.environ.get("QUAKE_DECLUSTER_METHOD", "gardner_knopoff")
+# 前震時間窗佔主震 (餘震) 時間窗的比例：1 = 前後對稱，0 = 只找餘震
+FORESHOCK_FRACTION = 1.0
+
+
+# ==========================================
+# 2. 去叢集：由大到小處理；時間排序切成區塊，每個區塊一棵 k-d tree 當時空索引
+# ==========================================
+# 時間區塊的長度 (日)：以時間而不是筆數切，目錄再密，同一個時間窗跨到的區塊數也不變
+BLOCK_DAYS = 180.0
+# 每次一起篩選獨立事件的筆數 (依規模由大到小)
+SCREEN_EVENTS = 4096
+
+
+class TimeBlocks:
+    # 依時間排序的事件每 BLOCK_DAYS 切成一塊，各建一棵單位球 3D 座標的 k-d tree (第一次查到才建)；
+    # 查詢只碰時間窗跨到的區塊，區塊內再用弦長半徑找空間範圍內的事件
+    def __init__(self, t, xyz, block_seconds=BLOCK_DAYS * DAY_SECONDS):
+        # t 需已遞增排序且不為空；starts = 每個區塊第一筆的列號 (沒有事件的區塊去掉)，最後一個是總筆數
+        self.xyz = xyz
+        edges = np.arange(t[0], t[-1] + block_seconds, block_seconds)
+        self.starts = np.unique(np.append(np.searchsorted(t, edges, side="left"), len(t)))
+        self._trees = {}
+
+    def _tree(self, k):
+        tree = self._trees.get(k)
+        if tree is None:
+            tree = self._trees[k] = cKDTree(self.xyz[self.starts[k]:self.starts[k + 1]])
+        return tree
+
+    def spans(self, lo, hi):
+        # 每個時間窗 [lo, hi) 跨到的區塊範圍 [first, last)
+        return np.searchsorted(self.starts, lo, side="right") - 1, np.searchsorted(self.starts, hi, side="left")
+
+    def has_neighbor(self, rows, chord, lo, hi):
+        # rows 這些事件的時間窗跨到的區塊裡，除了自己以外有沒有弦長 ≤ chord 的事件 (區塊邊緣超出時間窗的也算，
+        # 所以 False 一定是獨立事件)。同一區塊的查詢點一起做 k-d tree 最近兩點查詢，不產生鄰居清單；
+        # 先查自己所在的區塊 (密集的目錄大多在這一步就找到)，沒找到的再查時間窗跨到的其他區塊
+        found = np.zeros(len(rows), dtype=bool)
+        own = np.searchsorted(self.starts, rows, side="right") - 1
+        self._mark(found, np.arange(len(rows)), rows, own, chord)
+        first, last = self.spans(lo[rows], hi[rows])
+        todo = np.flatnonzero(~found & (last - first > 1))
+        # 每個 (事件, 跨到的區塊) 展開成一列，自己所在的區塊已經查過
+        width = last[todo] - first[todo]
+        pos = np.repeat(todo, width)
+        blocks = np.repeat(first[todo] - np.cumsum(width) + width, width) + np.arange(width.sum())
+        other = blocks != own[pos]
+        self._mark(found, pos[other], rows[pos[other]], blocks[other], chord)
+        return found
+
+    def _mark(self, found, pos, events, blocks, chord):
+        # found[pos[j]] |= 事件 events[j] 在區塊 blocks[j] 裡有鄰居
+        order = np.argsort(blocks, kind="stable")
+        pos, events, blocks = pos[order], events[order], blocks[order]
+        keys, cuts = np.unique(blocks, return_index=True)
+        for k, a, b in zip(keys, cuts, np.append(cuts[1:], len(blocks))):
+            q = events[a:b]
+            dist, near = self._tree(k).query(self.xyz[q], k=2, distance_upper_bound=float(chord[q].max()))
+            found[pos[a:b]] |= ((dist <= chord[q, None]) & (near + self.starts[k] != q[:, None])).any(axis=1)
+
+    def query(self, i, chord, lo, hi):
+        # 列號在 [lo, hi) 之內、與第 i 筆弦長 ≤ chord 的事件 (順序不拘)
+        first, last = self.spans(lo, hi)
+        found = []
+        for k in range(first, last):
+            rows = self.starts[k] + np.asarray(self._tree(k).query_ball_point(self.xyz[i], chord), dtype=np.int64)
+            found.append(rows[(rows >= lo) & (rows < hi)])
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+
+def decluster(t, lat, lon, mag, method=DECLUSTER_METHOD, foreshock_fraction=FORESHOCK_FRACTION):
+    # t 需已遞增排序 (epoch 秒)；回傳 (是否主震, 叢集編號 (0 = 獨立事件))
+    # 每個事件的時間窗一次用 searchsorted 算好，之後只在時間窗跨到的區塊裡做 k-d tree 半徑查詢：
+    # 每筆的成本是 O(區塊數 × log 區塊大小 + 範圍內的事件數)，與整個時間窗裡有多少事件無關
+    t = np.asarray(t, dtype=float)
+    mag = np.asarray(mag, dtype=float)
+    n = len(t)
+    if not n:
+        return np.ones(0, dtype=bool), np.zeros(0, dtype=np.int32)
+
+    dist_km, days = WINDOWS[method](mag)
+    span = days * DAY_SECONDS
+    lo = np.searchsorted(t, t - foreshock_fraction * span, side="left")
+    hi = np.searchsorted(t, t + span, side="right")
+    # 球面距離 ≤ L 等同單位球上的弦長 ≤ 2 sin(L / 2R)
+    chord = 2 * np.sin(np.minimum(dist_km / EARTH_RADIUS_KM, math.pi) / 2)
+    blocks = TimeBlocks(t, unit_vectors(lat, lon))
+
+    # cluster：0 = 尚未處理，-1 = 已處理的獨立事件，> 0 = 叢集編號
+    cluster = np.zeros(n, dtype=np.int32)
+    mainshock = np.ones(n, dtype=bool)
+    isolated = np.zeros(n, dtype=bool)
+    next_id = 1
+    # 同規模時較早的事件先當主震
+    order = np.argsort(-mag, kind="stable")
+    for step, i in enumerate(order):
+        if step % SCREEN_EVENTS == 0:
+            # 接下來這一段還沒被併進叢集的事件，先一次篩出時空窗內只有自己的 (一定是獨立事件)，迴圈裡不必再查；
+            # 密集的目錄大多已被前面的大地震併掉，要篩的很少
+            pending = order[step:step + SCREEN_EVENTS]
+            pending = pending[cluster[pending] == 0]
+            isolated[pending] = ~blocks.has_neighbor(pending, chord, lo, hi)
+        if cluster[i]:
+            continue
+        if isolated[i]:
+            cluster[i] = -1
+            continue
+        near = blocks.query(i, chord[i], lo[i], hi[i])
+        members = near[cluster[near] == 0]
+        if len(members) > 1:
+            cluster[members] = next_id
+            mainshock[members] = False
+            mainshock[i] = True
+            next_id += 1
+        else:
+            cluster[i] = -1
+    cluster[cluster < 0] = 0
+    return mainshock, cluster
+
+
+# ==========================================
+# 3. 每份目錄算一次：標記存在快取資料夾 (以目錄指紋判斷能否沿用)
+# ==========================================
+@dataclass
+class DeclusterResult:
+    labels: pd.DataFrame           # id, mainshock, cluster
+    method: str
+    n_main: int
+    n_dependent: int
+    seconds: float
+    from_cache: bool
+
+
+def _label_paths(cache_dir=None):
+    cache_dir = cache_dir or catalog.CACHE_DIR
+    # 兩種儲存模式的目錄內容不同 (M4+ / M2+)，標記分開存
+    base = catalog.PARTITION_DIR if catalog.STORAGE_MODE == "parquet" else os.path.splitext(catalog.CATALOG_FILE)[0]
+    return (os.path.join(cache_dir, f"{base}.decluster.parquet"),
+            os.path.join(cache_dir, f"{base}.decluster.meta.json"))
+
+
+def read_labels(fingerprint, method, cache_dir=None):
+    parquet_path, meta_path = _label_paths(cache_dir)
+    if not (os.path.exists(parquet_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path, encoding="utf8") as f:
+            meta = json.load(f)
+        if meta.get("fingerprint") != fingerprint or meta.get("method") != method:
+            return None
+        return duckdb.connect().execute("SELECT * FROM read_parquet(?)", [parquet_path]).df()
+    except Exception as e:
+        print(f"主震標記讀取失敗，將重新計算: {e}")
+        return None
+
+
+def write_labels(labels, fingerprint, method, cache_dir=None):
+    parquet_path, meta_path = _label_paths(cache_dir)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+
+    # 先寫暫存檔再 rename，避免寫到一半被其他行程讀到
+    tmp_path = parquet_path + ".tmp"
+    con = duckdb.connect()
+    con.register("labels_df", labels)
+    con.execute(f"COPY labels_df TO '{tmp_path.replace(chr(39), chr(39) * 2)}' (FORMAT PARQUET)")
+    con.close()
+    os.replace(tmp_path, parquet_path)
+
+    meta = {"fingerprint": fingerprint, "method": method, "events": len(labels),
+            "mainshocks": int(labels['mainshock'].sum())}
+    with open(meta_path + ".tmp", "w", encoding="utf8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+_labels_lock = threading.Lock()
+# (目錄版本, 方法, DeclusterResult)：mainshocks view 同一時間只掛一種方法的結果
+_current = None
+
+
+def labels_ready(method=DECLUSTER_METHOD):
+    # 目前的目錄已掛上主震標記 (不等鎖、不觸發計算，渲染時用)
+    current = _current
+    return current is not None and current[:2] == (quake_db.catalog_version(), method) and quake_db.has_mainshocks()
+
+
+def ensure_labels(method=DECLUSTER_METHOD, cache_dir=None):
+    # 確保目前目錄已掛上主震標記 (quake_db 的 mainshocks view)；每個目錄版本只做一次
+    global _current
+    with _labels_lock:
+        version = quake_db.catalog_version()
+        if _current is not None and _current[:2] == (version, method) and quake_db.has_mainshocks():
+            return _current[2]
+
+        started = time.perf_counter()
+        fingerprint = quake_db.catalog_fingerprint()
+        labels = read_labels(fingerprint, method, cache_dir)
+        from_cache = labels is not None
+        if not from_cache:
+            events = quake_db.decluster_input()
+            mainshock, cluster = decluster(events['t'], events['latitude'], events['longitude'], events['mag'], method)
+            labels = pd.DataFrame({"id": events['id'].to_pandas(), "mainshock": mainshock, "cluster": cluster})
+            try:
+                write_labels(labels, fingerprint, method, cache_dir)
+            except (OSError, duckdb.IOException) as e:
+                # 快取寫不進去 (例如唯讀磁碟) 不影響這次使用，下次啟動再重算
+                print(f"主震標記快取寫入失敗: {e}")
+
+        quake_db.attach_mainshocks(version, labels.loc[labels['mainshock'], 'id'])
+        n_main = int(labels['mainshock'].sum())
+        result = DeclusterResult(labels, method, n_main, len(labels) - n_main,
+                                 time.perf_counter() - started, from_cache)
+        print(f"主震標記完成 ({method})：主震 {result.n_main} 筆、餘震/前震 {result.n_dependent} 筆，"
+              f"{'沿用快取' if from_cache else '重新計算'} {result.seconds:.2f} 秒。")
+        _current = (version, method, result)
+        return result
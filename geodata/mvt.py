@@ -0,0 +1,102 @@
+import struct
+
+# ==========================================
+# 極簡 Mapbox Vector Tile (v2) 編碼器：只支援點圖層
+# 規格：https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+# ==========================================
+EXTENT = 4096
+
+_WIRE_VARINT = 0
+_WIRE_FIXED64 = 1
+_WIRE_BYTES = 2
+
+_GEOM_POINT = 1
+_CMD_MOVE_TO = 1
+
+
+def _varint(value, out):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _field(number, wire, out):
+    _varint((number << 3) | wire, out)
+
+
+def _bytes_field(number, payload, out):
+    _field(number, _WIRE_BYTES, out)
+    _varint(len(payload), out)
+    out += payload
+
+
+def _packed(number, values, out):
+    payload = bytearray()
+    for v in values:
+        _varint(v, payload)
+    _bytes_field(number, payload, out)
+
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def _encode_value(value):
+    out = bytearray()
+    if isinstance(value, str):
+        _bytes_field(1, value.encode("utf-8"), out)          # string_value
+    elif isinstance(value, bool):
+        _field(7, _WIRE_VARINT, out)                         # bool_value
+        _varint(int(value), out)
+    elif isinstance(value, int):
+        _field(6, _WIRE_VARINT, out)                         # sint_value
+        _varint(_zigzag(value), out)
+    else:
+        _field(3, _WIRE_FIXED64, out)                        # double_value
+        out += struct.pack("<d", float(value))
+    return bytes(out)
+
+
+def encode_point_layer(name, xs, ys, properties, extent=EXTENT):
+    # xs / ys：圖磚內的整數座標 (0 ~ extent)；properties：{欄位名稱: 每個點的值 list}
+    keys = list(properties)
+    values, value_index = [], {}
+    columns = [properties[k] for k in keys]
+
+    layer = bytearray()
+    _field(15, _WIRE_VARINT, layer)                          # version
+    _varint(2, layer)
+    _bytes_field(1, name.encode("utf-8"), layer)             # name
+
+    for i, (x, y) in enumerate(zip(xs, ys)):
+        tags = []
+        for k, column in enumerate(columns):
+            v = column[i]
+            if v is None:
+                continue
+            token = (type(v), v)
+            if token not in value_index:
+                value_index[token] = len(values)
+                values.append(v)
+            tags += (k, value_index[token])
+
+        feature = bytearray()
+        _field(1, _WIRE_VARINT, feature)                     # id
+        _varint(i + 1, feature)
+        _packed(2, tags, feature)                            # tags
+        _field(3, _WIRE_VARINT, feature)                     # type = POINT
+        _varint(_GEOM_POINT, feature)
+        _packed(4, [(_CMD_MOVE_TO & 0x7) | (1 << 3), _zigzag(int(x)), _zigzag(int(y))], feature)
+        _bytes_field(2, feature, layer)                      # features
+
+    for k in keys:
+        _bytes_field(3, k.encode("utf-8"), layer)            # keys
+    for v in values:
+        _bytes_field(4, _encode_value(v), layer)             # values
+    _field(5, _WIRE_VARINT, layer)                           # extent
+    _varint(extent, layer)
+
+    tile = bytearray()
+    _bytes_field(3, layer, tile)                             # Tile.layers
+    return bytes(tile)
@@ -0,0 +1,91 @@
+import base64
+import io
+from dataclasses import dataclass
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# ==========================================
+# 1. 靜態剖面底圖：每個行程只畫一次，並記下資料座標 → 像素的對應
+# ==========================================
+# 滑桿移動時只換疊在上面的 SVG (紅線 + 紅點 + 海拔)，底圖的 <img> 屬性不變，瀏覽器不必重新下載
+LABELED_STATIONS = ["埔里", "武嶺", "太魯閣"]
+
+
+@dataclass
+class ProfileBackground:
+    data_uri: str          # PNG (base64)
+    width: int             # 圖片像素大小 (SVG 疊圖的 viewBox 與此相同)
+    height: int
+    km_range: tuple        # x 軸範圍 (km)
+    elev_range: tuple      # y 軸範圍 (m)
+    axes_box: tuple        # 軸區域的像素範圍 (left, top, right, bottom)，原點在左上
+
+    def to_pixel(self, km, elev):
+        left, top, right, bottom = self.axes_box
+        (k0, k1), (e0, e1) = self.km_range, self.elev_range
+        x = left + (km - k0) / (k1 - k0) * (right - left)
+        y = bottom - (elev - e0) / (e1 - e0) * (bottom - top)
+        return x, y
+
+
+def render_background(profile, stations, title="中橫公路垂直剖面 (拖曳下方滑桿移動)", ylim=(0, 3600)):
+    # profile：km / elev 欄；stations：name / dist 欄 (節點標籤的位置)
+    # 直接用 Figure + Agg canvas (不經 pyplot)：不改整個行程的 matplotlib 後端，也不必 close
+    fig = Figure(figsize=(6, 4))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    fig.patch.set_facecolor('#ffffff')
+
+    km, elev = profile['km'].to_numpy(), profile['elev'].to_numpy()
+    ax.fill_between(km, elev, color='#2E8B57', alpha=0.5)
+    ax.plot(km, elev, color='#006400', linewidth=2)
+
+    for _, row in stations.iterrows():
+        if row['name'] in LABELED_STATIONS:
+            label_elev = float(np.interp(row['dist'], km, elev))
+            ax.text(row['dist'], label_elev + 100, row['name'], ha='center', fontsize=8, fontweight='bold')
+
+    ax.set_title(title, fontsize=10, fontweight='bold')
+    ax.set_xlabel("距離 (km)")
+    ax.set_ylabel("海拔 (m)")
+    ax.grid(True, linestyle='--', alpha=0.3)
+    ax.set_ylim(*ylim)
+    fig.tight_layout()
+
+    # tight_layout 之後軸的位置才確定：記下軸區域的像素範圍 (matplotlib 原點在左下，換成左上)
+    fig.canvas.draw()
+    width, height = fig.canvas.get_width_height()
+    x0, y0, x1, y1 = ax.bbox.extents
+    background = ProfileBackground(
+        data_uri="",
+        width=width,
+        height=height,
+        km_range=tuple(float(v) for v in ax.get_xlim()),
+        elev_range=tuple(float(v) for v in ax.get_ylim()),
+        axes_box=(float(x0), float(height - y1), float(x1), float(height - y0)),
+    )
+
+    s = io.BytesIO()
+    fig.savefig(s, format='png', dpi=fig.dpi)
+    background.data_uri = f"data:image/png;base64,{base64.b64encode(s.getvalue()).decode()}"
+    return background
+
+
+# ==========================================
+# 2. 每次滑桿移動：只產生幾百位元組的 SVG 疊圖
+# ==========================================
+def marker_svg(background, km, elev):
+    # 尺寸以底圖像素為單位 (matplotlib 的 pt × dpi / 72)，與原本整張重畫時的紅線 / 紅點 / 字一樣大
+    left, top, right, bottom = background.axes_box
+    x, y = background.to_pixel(km, elev)
+    label_x, _ = background.to_pixel(km + 2, elev)
+    return (
+        f'<svg viewBox="0 0 {background.width} {background.height}" width="100%" height="100%" '
+        f'preserveAspectRatio="none" style="position:absolute; left:0; top:0;">'
+        f'<line x1="{x:.1f}" y1="{top:.1f}" x2="{x:.1f}" y2="{bottom:.1f}" stroke="red" stroke-width="2.8" stroke-dasharray="10.3,4.4"/>'
+        f'<circle cx="{x:.1f}" cy="{y:.1f}" r="5.5" fill="red"/>'
+        f'<text x="{label_x:.1f}" y="{y:.1f}" fill="red" font-size="12.5" font-weight="bold">{int(elev)}m</text>'
+        f'</svg>'
+    )
@@ -0,0 +1,123 @@
+import functools
+import os
+
+import numpy as np
+import pydeck as pdk
+
+from geodata import map_cache, quake_db, quake_layers, server_routes
+
+# ==========================================
+# 1. 二進位屬性緩衝：位置 / 顏色 / 半徑直接由 NumPy 打包成 typed array
+# ==========================================
+# 版面：uint32 筆數 n | float32 位置 (經度, 緯度, 高度 m) × n | uint8 RGBA × n | float32 半徑 (px) × n
+# 每一段的起點都對齊 4 bytes，瀏覽器端可以直接包成 Float32Array / Uint8Array，不用解析 JSON
+POINTS_ROUTE = "/_quake/points3d.bin"
+LAYER_ID = "quakes-3d"
+# 深度放大倍率 (1 = 真實深度)
+DEPTH_SCALE = 1.0
+DEPTH_RGBA = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] + [200] for c in quake_layers.DEPTH_COLORS], dtype=np.uint8)
+
+
+def build_buffers(min_mag, start_year, end_year):
+    df = quake_db.query_points(min_mag, start_year, end_year)
+    n = len(df)
+    positions = np.empty((n, 3), dtype=np.float32)
+    positions[:, 0] = df['longitude'].to_numpy(dtype=np.float32)
+    positions[:, 1] = df['latitude'].to_numpy(dtype=np.float32)
+    positions[:, 2] = -df['depth'].to_numpy(dtype=np.float32) * 1000 * DEPTH_SCALE   # 地表以下，單位公尺
+    colors = DEPTH_RGBA[quake_layers.depth_class(df['depth'])]
+    radii = quake_layers.marker_radius(df['mag'], n).astype(np.float32)
+    return np.uint32(n).tobytes() + positions.tobytes() + colors.tobytes() + radii.tobytes()
+
+
+POINTS_CACHE = map_cache.ByteLRUCache(max_bytes=int(float(os.environ.get("QUAKE_POINTS3D_CACHE_MB", "64")) * 1024 * 1024))
+
+
+def get_buffers(min_mag, start_year, end_year):
+    min_mag = round(float(min_mag), 1)
+    key = (quake_db.catalog_version(), min_mag, int(start_year), int(end_year))
+    return POINTS_CACHE.get_or_compute(key, lambda: build_buffers(min_mag, int(start_year), int(end_year)))
+
+
+def points_url(min_mag, start_year, end_year):
+    return (f"{POINTS_ROUTE}?min_mag={round(float(min_mag), 1)}"
+            f"&start={int(start_year)}&end={int(end_year)}&v={quake_db.catalog_tag()}")
+
+
+# ==========================================
+# 2. deck.gl 外殼：pydeck 產生一次，之後篩選只換屬性緩衝
+# ==========================================
+# 外層 iframe 的 data-query 屬性一改 (srcdoc 不變，iframe 不會重載)，就抓新的緩衝，
+# 用 layer.clone() 換掉 data：同一個 layer id，deck.gl 只重新上傳屬性，不重建 deck / WebGL context
+# (radiusUnits 在這裡才設：pydeck 會把字串參數當成 @@= 運算式)
+BUFFER_SCRIPT = """
+<script>
+(function() {
+    var frame = window.frameElement;
+    var loaded = null;
+    function load() {
+        var url = frame && frame.getAttribute('data-query');
+        if (!url || url === loaded || typeof deckInstance === 'undefined') return;
+        loaded = url;
+        fetch(url).then(function(r) { return r.arrayBuffer(); }).then(function(buf) {
+            if (url !== loaded) return;   // 拖動滑桿時只套用最後一次
+            var n = new Uint32Array(buf, 0, 1)[0];
+            var data = {
+                length: n,
+                attributes: {
+                    getPosition: {value: new Float32Array(buf, 4, n * 3), size: 3},
+                    getFillColor: {value: new Uint8Array(buf, 4 + n * 12, n * 4), size: 4, normalized: true},
+                    getRadius: {value: new Float32Array(buf, 4 + n * 16, n), size: 1}
+                }
+            };
+            var layers = deckInstance.props.layers.map(function(layer) {
+                return layer.id === '%(layer_id)s' ? layer.clone({data: data, radiusUnits: 'pixels'}) : layer;
+            });
+            deckInstance.setProps({layers: layers});
+        }).catch(function() { loaded = null; });
+    }
+    if (frame) new MutationObserver(load).observe(frame, {attributes: true, attributeFilter: ['data-query']});
+    load();
+})();
+</script>
+"""
+
+
+@functools.lru_cache(maxsize=1)
+def deck_html():
+    layer = pdk.Layer(
+        "ScatterplotLayer",
+        data=[],
+        id=LAYER_ID,
+        billboard=True,
+        stroked=False,
+        pickable=False,
+    )
+    view = pdk.ViewState(latitude=23.6, longitude=121.4, zoom=7, pitch=55, bearing=-20)
+    deck = pdk.Deck(layers=[layer], initial_view_state=view, map_style="light")
+    html = deck.to_html(as_string=True, notebook_display=False)
+    return html.replace("</html>", BUFFER_SCRIPT % {"layer_id": LAYER_ID} + "</html>")
+
+
+# ==========================================
+# 3. 掛到 solara 的 starlette 伺服器上
+# ==========================================
+async def points_endpoint(request):
+    from starlette.concurrency import run_in_threadpool
+    from starlette.responses import Response
+
+    q = request.query_params
+    try:
+        min_mag = float(q.get("min_mag", 4.0))
+        start_year = int(q.get("start", 2000))
+        end_year = int(q.get("end", 2100))
+    except ValueError:
+        return Response("bad filter", status_code=400)
+
+    data = await run_in_threadpool(get_buffers, min_mag, start_year, end_year)
+    return Response(data, media_type="application/octet-stream",
+                    headers={"Cache-Control": "public, max-age=3600"})
+
+
+def install_routes():
+    return server_routes.install_route(POINTS_ROUTE, points_endpoint)
@@ -0,0 +1,93 @@
+import functools
+import json
+
+import numpy as np
+
+from geodata import quake_db, quake_layers, server_routes
+
+# ==========================================
+# 1. 逐月影格：依時間排序掃一次，用 searchsorted 切出每個月的區段
+# ==========================================
+FRAMES_ROUTE = "/_quake/frames.json"
+ANIMATION_START_YEAR = 2000
+# 每次請求 / 內嵌在 HTML 裡的影格數 (約 5 年)
+FRAME_CHUNK = 60
+
+
+@functools.lru_cache(maxsize=16)
+def _build_frames(version, min_mag):
+    # version 只用來當快取鍵：目錄更新後自動重算
+    df = quake_db.query_timeline(min_mag)
+    if df.empty:
+        return {"labels": [], "offsets": np.zeros(1, dtype=np.int64), "lat": np.empty(0),
+                "lon": np.empty(0), "radius": np.empty(0), "color": np.empty(0, dtype=np.int8)}
+
+    t = df['time']
+    month = (t.dt.year.to_numpy() - ANIMATION_START_YEAR) * 12 + t.dt.month.to_numpy() - 1
+    keep = month >= 0
+    month = month[keep]
+    n_frames = int(month.max()) + 1 if len(month) else 0
+    # 資料已依時間排序：每個月在陣列中是連續的一段，offsets[k]:offsets[k+1] 就是第 k 格
+    offsets = np.searchsorted(month, np.arange(n_frames + 1), side="left")
+
+    mag = df['mag'].to_numpy(dtype=float)[keep]
+    labels = [f"{ANIMATION_START_YEAR + k // 12}-{k % 12 + 1:02d}" for k in range(n_frames)]
+    return {
+        "labels": labels,
+        "offsets": offsets,
+        "lat": np.round(df['latitude'].to_numpy(dtype=float)[keep], 4),
+        "lon": np.round(df['longitude'].to_numpy(dtype=float)[keep], 4),
+        "radius": np.round(quake_layers.marker_radius(mag, 0), 1),   # 每格筆數少，不縮小
+        "color": quake_layers.depth_class(df['depth'].to_numpy(dtype=float)[keep]),
+    }
+
+
+def get_frames(min_mag):
+    return _build_frames(quake_db.catalog_version(), round(float(min_mag), 1))
+
+
+def frame_chunk(min_mag, start, count=FRAME_CHUNK):
+    # 回傳 [start, start+count) 影格的欄位式資料；offsets 以這一段的開頭為 0
+    frames = get_frames(min_mag)
+    start = max(int(start), 0)
+    end = min(start + int(count), len(frames["labels"]))
+    if start >= end:
+        return {"start": start, "labels": [], "offsets": [0], "lat": [], "lon": [], "radius": [], "color": []}
+    a, b = int(frames["offsets"][start]), int(frames["offsets"][end])
+    return {
+        "start": start,
+        "labels": frames["labels"][start:end],
+        "offsets": (frames["offsets"][start:end + 1] - a).tolist(),
+        "lat": frames["lat"][a:b].tolist(),
+        "lon": frames["lon"][a:b].tolist(),
+        "radius": frames["radius"][a:b].tolist(),
+        "color": frames["color"][a:b].astype(int).tolist(),
+    }
+
+
+def frames_url(min_mag):
+    return f"{FRAMES_ROUTE}?min_mag={round(float(min_mag), 1)}&v={quake_db.catalog_tag()}"
+
+
+# ==========================================
+# 2. 後續影格由瀏覽器分段抓取 (不必整段塞進 HTML)
+# ==========================================
+async def frames_endpoint(request):
+    from starlette.concurrency import run_in_threadpool
+    from starlette.responses import Response
+
+    q = request.query_params
+    try:
+        min_mag = float(q.get("min_mag", 4.0))
+        start = int(q.get("start", 0))
+        count = min(int(q.get("count", FRAME_CHUNK)), 12 * FRAME_CHUNK)
+    except ValueError:
+        return Response("bad filter", status_code=400)
+
+    chunk = await run_in_threadpool(frame_chunk, min_mag, start, count)
+    return Response(json.dumps(chunk, separators=(",", ":")), media_type="application/json",
+                    headers={"Cache-Control": "public, max-age=3600"})
+
+
+def install_routes():
+    return server_routes.install_route(FRAMES_ROUTE, frames_endpoint)
@@ -0,0 +1,528 @@
+import functools
+import hashlib
+import numbers
+import os
+import threading
+from dataclasses import dataclass
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# ==========================================
+# 1. 目錄註冊：整個行程共用一份 DuckDB 連線與原生表
+# ==========================================
+_lock = threading.Lock()
+_con = duckdb.connect()
+_catalog = None
+_rows = 0
+_version = 0
+# 主震 view (mainshocks) 對應的目錄版本；與 _version 不同表示還沒掛上去
+_mainshocks_version = 0
+# 分區 Parquet 模式的檔案 glob
+_partition_glob = None
+# 基本目錄 (base_events：原生表或 read_parquet 的 view) 只在 use_catalog 時更換，_version 跟著它走；
+# 即時 feed 的新事件 / 修訂版放在 live_events 疊加層，events view 再把兩者合併
+
+POINT_COLUMNS = ['latitude', 'longitude', 'mag', 'depth', 'place', 'year']
+_FILTER = "mag >= $1 AND year >= $2 AND year <= $3"
+# 分區 Parquet 模式多一個分區欄條件：規模級距不符的分區連檔案都不打開
+_PARTITION_FILTER = _FILTER + " AND mag_band >= floor($1)::INTEGER"
+
+# 滑桿會反覆觸發的查詢：目錄載入時 PREPARE 一次，之後只帶參數 EXECUTE
+PREPARED_QUERIES = {
+    "points_q": f"SELECT {', '.join(POINT_COLUMNS)} FROM events WHERE {_FILTER}",
+    "count_q": f"SELECT count(*) AS n FROM events WHERE {_FILTER}",
+    "timeline_q": "SELECT time, latitude, longitude, mag, depth FROM events WHERE mag >= $1 ORDER BY time",
+    # 漸進式繪製：依規模由大到小分批取點 (keyset 分頁，見 query_ranked)；$4/$5 上一批最後一筆的鍵、$6 批量
+    "ranked_q": f"""
+        SELECT {', '.join(POINT_COLUMNS)}, round(mag * 10)::INTEGER AS mag_key, hash(id) AS id_key FROM events
+        WHERE {_FILTER}
+        AND (round(mag * 10)::INTEGER < $4 OR (round(mag * 10)::INTEGER = $4 AND hash(id) > $5))
+        ORDER BY mag_key DESC, id_key
+        LIMIT $6
+    """,
+    "bbox_q": f"""
+        SELECT {', '.join(POINT_COLUMNS)} FROM events
+        WHERE {_FILTER}
+        AND longitude >= $4 AND longitude <= $5 AND latitude >= $6 AND latitude <= $7
+    """,
+    # 統計面板：一次掃描同時算出 每年 / 每個深度分層 / 每 0.1 規模 的筆數
+    "stats_q": f"""
+        SELECT
+            year,
+            (depth >= 20)::INTEGER + (depth >= 60)::INTEGER + (depth >= 150)::INTEGER AS depth_class,
+            round(mag * 10)::INTEGER AS mag_bin,
+            count(*) AS count
+        FROM events
+        WHERE {_FILTER}
+        GROUP BY GROUPING SETS ((year), (depth_class), (mag_bin))
+    """,
+    # 密度圖：在 Web Mercator 座標 (x = 經度弧度, y = ln tan(π/4 + 緯度/2)) 上分箱，
+    # 影像疊圖在地圖上才會剛好對齊；$4/$5 原點、$6/$7 格寬、$8/$9 格數
+    "density_q": f"""
+        SELECT ix, iy, count(*) AS count, sum(mag) AS mag_sum FROM (
+            SELECT
+                floor((radians(longitude) - $4) / $6)::INTEGER AS ix,
+                floor((ln(tan(pi() / 4 + radians(latitude) / 2)) - $5) / $7)::INTEGER AS iy,
+                mag
+            FROM events
+            WHERE {_FILTER}
+        )
+        WHERE ix >= 0 AND ix < $8 AND iy >= 0 AND iy < $9
+        GROUP BY ix, iy
+    """,
+    "grid_q": f"""
+        SELECT
+            floor(longitude / $4)::INTEGER AS gx,
+            floor(latitude / $4)::INTEGER AS gy,
+            count(*) AS count,
+            max(mag) AS max_mag,
+            median(depth) AS median_depth,
+            avg(latitude) AS latitude,
+            avg(longitude) AS longitude
+        FROM events
+        WHERE {_FILTER}
+        GROUP BY gx, gy
+    """,
+}
+
+
+def use_catalog(source):
+    # source：DataFrame (常駐記憶體) 或分區 Parquet 資料夾路徑 (catalog.STORAGE_MODE == "parquet")
+    # 同一個目錄重複呼叫不做事；換了新目錄就重建 events 並清掉聚合快取
+    global _catalog, _rows, _version
+    with _lock:
+        if source is _catalog:
+            return _version
+        _drop_events()
+        if isinstance(source, str):
+            _rows = _use_partitions(source)
+        else:
+            _con.register("catalog_df", source)
+            # 依 (year, mag) 排序存成 DuckDB 原生表：每個 row group 的 min/max (zone map)
+            # 區間很窄，年份 / 規模篩選可以直接跳過整段資料，不必每次掃 pandas
+            # 地名存成 VARCHAR (DuckDB 自己會做字典壓縮)：類別欄會變成 ENUM，之後 feed 加進新地名會失敗
+            _con.execute(f"CREATE TABLE base_events AS SELECT {_select_columns(source.columns)} FROM catalog_df ORDER BY year, mag")
+            _con.unregister("catalog_df")
+            _con.execute("CREATE VIEW events AS SELECT * FROM base_events")
+            _rows = len(source)
+        if _rows:
+            _prepare_all()
+        _catalog = source
+        _version += 1
+    _aggregate_grid.cache_clear()
+    return _version
+
+
+def _prepare_all(mainshocks=False):
+    # mainshocks=True：PREPARE 改查主震 view 的那一份 (<name>_main)
+    filter_sql = _PARTITION_FILTER if _partition_glob else _FILTER
+    for name, sql in PREPARED_QUERIES.items():
+        sql = sql.replace(_FILTER, filter_sql)
+        if mainshocks:
+            name, sql = name + "_main", sql.replace("FROM events", "FROM mainshocks")
+        _con.execute(f"PREPARE {name} AS {sql}")
+
+
+def _select_columns(columns):
+    return ", ".join("place::VARCHAR AS place" if c == "place" else c for c in columns)
+
+
+def _drop_events():
+    # 由外往內拆：主震 view → events view → 基本目錄 / 即時疊加層
+    global _partition_glob
+    _con.execute("DROP VIEW IF EXISTS mainshocks")
+    _con.execute("DROP TABLE IF EXISTS mainshock_ids")
+    _con.execute("DROP VIEW IF EXISTS events")
+    _partition_glob = None
+    # base_events 可能是原生表 (DataFrame) 或 view (分區 Parquet)，DROP 時型別要對
+    for (kind,) in _con.execute("""
+        SELECT 'TABLE' FROM duckdb_tables() WHERE table_name = 'base_events'
+        UNION ALL SELECT 'VIEW' FROM duckdb_views() WHERE view_name = 'base_events'
+    """).fetchall():
+        _con.execute(f"DROP {kind} base_events")
+    _con.execute("DROP TABLE IF EXISTS live_events")
+
+
+def _use_partitions(root):
+    # base_events 只是 read_parquet 的 view：資料留在磁碟，查詢時依分區欄與 row group 統計跳過不需要的部分
+    global _partition_glob
+    if not os.path.isdir(root) or not os.listdir(root):
+        return 0
+    _partition_glob = os.path.join(root, "**", "*.parquet").replace("'", "''")
+    _con.execute("SET parquet_metadata_cache = true")
+    _con.execute(f"CREATE VIEW base_events AS {_parquet_scan()}")
+    _con.execute("CREATE VIEW events AS SELECT * FROM base_events")
+    return _con.execute("SELECT count(*) FROM events").fetchone()[0]
+
+
+def _parquet_scan():
+    return (f"SELECT * FROM read_parquet('{_partition_glob}', hive_partitioning = true, "
+            f"hive_types = {{'year': SMALLINT, 'mag_band': INTEGER}})")
+
+
+def catalog_version():
+    return _version
+
+
+def catalog_tag():
+    # 瀏覽器快取用的目錄標籤 (URL 上的 v=)：目錄指紋的短雜湊。版本號每次啟動都從 1 數起，
+    # 重啟後換了內容的目錄可能拿到同一個號碼，被 max-age 快取住的舊回應就會被當成新的
+    return _catalog_tag(_version)
+
+
+@functools.lru_cache(maxsize=4)
+def _catalog_tag(version):
+    # version 只用來當快取鍵：指紋要掃整個目錄，每個版本只算一次
+    return hashlib.sha1(catalog_fingerprint().encode()).hexdigest()[:12]
+
+
+def latest_time():
+    # 目錄中最新一筆地震的時間 (即時 feed 的高水位起點)
+    if not _rows:
+        return None
+    with _lock:
+        return _con.execute("SELECT max(time) FROM events").fetchone()[0]
+
+
+def append_events(df):
+    # 即時 feed：新事件與修訂版 (同一 id、updated 較新) 寫進 live_events 疊加層，基本目錄不動，
+    # 目錄版本也不變：主震標記、交叉篩選、k-d tree 與各種地圖 / 圖磚快取都以版本為鍵，不會每次輪詢就失效
+    # (這些快取裡是當時的快照，之後的即時事件由瀏覽器依 feed 序號補畫)。回傳實際寫入的列
+    global _rows, _version
+    with _lock:
+        if _catalog is None or df.empty:
+            return df.iloc[0:0]
+        _con.register("new_df", df)
+        try:
+            if not _rows and not _partition_glob:
+                # 原本是空目錄 (第一次下載失敗)：直接以新資料當基本目錄，這才算換了目錄 (版本 +1)
+                _drop_events()
+                _con.execute(f"CREATE TABLE base_events AS SELECT {_select_columns(df.columns)} FROM new_df ORDER BY year, mag")
+                _con.execute("CREATE VIEW events AS SELECT * FROM base_events")
+                added = _con.execute("SELECT * FROM events").df()
+                _rows = len(added)
+                if _rows:
+                    _prepare_all()
+                    _version += 1
+                    _aggregate_grid.cache_clear()
+                return added
+            added = _upsert_live(df.columns)
+        finally:
+            _con.unregister("new_df")
+        _rows += int(added.pop('is_new').sum())
+    return added
+
+
+def _upsert_live(df_columns):
+    # 呼叫端持有 _lock 並已註冊 new_df
+    if not _has_live():
+        # 第一次有即時事件才建疊加層：沒有 feed 時 events 就是基本目錄本身，查詢不多一道 anti-join
+        _con.execute("CREATE TABLE live_events AS SELECT * FROM base_events LIMIT 0")
+        _con.execute("""
+            CREATE OR REPLACE VIEW events AS
+            SELECT * FROM base_events WHERE id NOT IN (SELECT id FROM live_events)
+            UNION ALL BY NAME SELECT * FROM live_events
+        """)
+        # events 的定義變了：重新 PREPARE (主震 view 已掛上的話連同 _main 那一份)
+        _prepare_all()
+        if _mainshocks_version == _version:
+            _prepare_all(mainshocks=True)
+    live_columns = _con.execute("SELECT * FROM live_events LIMIT 0").df().columns
+    columns = [c for c in live_columns if c in df_columns]
+    extra = ", floor(mag)::INTEGER AS mag_band" if "mag_band" in live_columns else ""
+    # 目錄裡沒有的 id 是新事件；已有的 id 只在 updated 比較新時 (USGS 事後修訂規模 / 位置) 取代舊版
+    newer = " OR updated > (SELECT max(e.updated) FROM events e WHERE e.id = new_df.id)" if "updated" in columns else ""
+    _con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE live_upsert AS
+        SELECT {_select_columns(columns)}{extra}, id NOT IN (SELECT id FROM events) AS is_new FROM new_df
+        WHERE id NOT IN (SELECT id FROM events){newer}
+    """)
+    _con.execute("DELETE FROM live_events WHERE id IN (SELECT id FROM live_upsert)")
+    _con.execute("INSERT INTO live_events BY NAME SELECT * EXCLUDE (is_new) FROM live_upsert")
+    added = _con.execute(f"SELECT {', '.join(columns)}, is_new FROM live_upsert").df()
+    _con.execute("DROP TABLE live_upsert")
+    return added
+
+
+def _has_live():
+    return bool(_con.execute("SELECT count(*) FROM duckdb_tables() WHERE table_name = 'live_events'").fetchone()[0])
+
+
+def year_bounds():
+    if not _rows:
+        return None
+    with _lock:
+        lo, hi = _con.execute("SELECT min(year), max(year) FROM events").fetchone()
+    return int(lo), int(hi)
+
+
+def _literal(value):
+    # 非整數的實數 (float、np.float32 / np.float64 等) 照原值寫出，整數才轉 int；
+    # 只看 isinstance(float) 的話 np.float32 會走 int() 被無聲截斷
+    if isinstance(value, numbers.Real) and not isinstance(value, numbers.Integral):
+        return repr(float(value))
+    return str(int(value))
+
+
+def _execute_prepared(name, *args, mainshocks=False):
+    # EXECUTE 不接受綁定參數，所以先轉成 float / int 再組字串 (不會有注入問題)
+    # mainshocks=True：改查去除餘震後的 view (需先 attach_mainshocks)
+    if mainshocks:
+        if _mainshocks_version != _version:
+            raise RuntimeError("主震標記尚未掛上目前的目錄 (先呼叫 decluster.ensure_labels)")
+        name += "_main"
+    literals = ", ".join(_literal(a) for a in args)
+    with _lock:
+        return _con.execute(f"EXECUTE {name}({literals})").df()
+
+
+# ==========================================
+# 2. 原始點位查詢
+# ==========================================
+def query_points(min_mag, start_year, end_year, mainshocks=False):
+    if not _rows:
+        return pd.DataFrame(columns=POINT_COLUMNS)
+    return _execute_prepared("points_q", float(min_mag), start_year, end_year, mainshocks=mainshocks)
+
+
+def stream_points(min_mag, start_year, end_year, columns, mainshocks=False, batch_rows=65536):
+    # 匯出用：另開一個 cursor (同一個資料庫、獨立的連線狀態) 逐批取 Arrow record batch，
+    # 不經 pandas，也不會在下載期間佔住共用連線；回傳 pyarrow.RecordBatchReader (空目錄回傳 None)
+    if not _rows:
+        return None
+    if mainshocks and not has_mainshocks():
+        raise RuntimeError("主震標記尚未掛上目前的目錄 (先呼叫 decluster.ensure_labels)")
+    with _lock:
+        cur = _con.cursor()
+        available = set(_con.execute("SELECT * FROM events LIMIT 0").df().columns)
+    filter_sql = _PARTITION_FILTER if _partition_glob else _FILTER
+    source = "mainshocks" if mainshocks else "events"
+    select = _select_columns([c for c in columns if c in available])
+    cur.execute(f"SELECT {select} FROM {source} WHERE {filter_sql}", [float(min_mag), int(start_year), int(end_year)])
+    return cur.fetch_record_batch(batch_rows)
+
+
+def count_events(min_mag, start_year, end_year, mainshocks=False):
+    if not _rows:
+        return 0
+    return int(_execute_prepared("count_q", float(min_mag), start_year, end_year, mainshocks=mainshocks)['n'].iloc[0])
+
+
+def query_ranked(min_mag, start_year, end_year, after=None, limit=500, mainshocks=False):
+    # 依規模由大到小的下一批地震；after = 上一批最後一筆的 (mag_key, id_key)，None = 從最大的開始
+    # 用 keyset 分頁而不是 OFFSET：每一批都只是一次 top-N，越後面的批次不會越慢
+    if not _rows:
+        return pd.DataFrame(columns=POINT_COLUMNS + ['mag_key', 'id_key'])
+    mag_key, id_key = after if after is not None else (1 << 30, 0)
+    return _execute_prepared("ranked_q", float(min_mag), start_year, end_year, mag_key, id_key, limit,
+                             mainshocks=mainshocks)
+
+
+def query_bbox(min_mag, start_year, end_year, west, south, east, north):
+    # 向量圖磚用：只取圖磚範圍內的地震
+    if not _rows:
+        return pd.DataFrame(columns=POINT_COLUMNS)
+    return _execute_prepared("bbox_q", float(min_mag), start_year, end_year,
+                             float(west), float(east), float(south), float(north))
+
+
+def query_timeline(min_mag):
+    # 時間動畫用：依時間排序的全部地震 (一次掃描切成逐月影格)
+    if not _rows:
+        return pd.DataFrame(columns=['time', 'latitude', 'longitude', 'mag', 'depth'])
+    return _execute_prepared("timeline_q", float(min_mag))
+
+
+# ==========================================
+# 3. 依縮放等級做格網聚合 (Level of Detail)
+# ==========================================
+# 筆數低於門檻就畫原始點，否則改畫格網
+RAW_POINT_LIMIT = 2000
+# 每個 256px 圖磚切成幾格：zoom 9 約 0.088°(≈10 km) 一格
+CELLS_PER_TILE = 8
+
+
+def cell_size_for_zoom(zoom):
+    return 360.0 / (2 ** int(zoom)) / CELLS_PER_TILE
+
+
+@dataclass
+class LodResult:
+    kind: str              # "points"、"grid"、"tiles"、"animation" (data 為 None) 或 "progressive" (data 為第一批的 dict)
+    data: pd.DataFrame
+    total: int             # 篩選後的地震總數 (不論是否聚合)
+    cell_deg: float = 0.0
+
+
+@functools.lru_cache(maxsize=256)
+def _aggregate_grid(version, min_mag, start_year, end_year, zoom, mainshocks=False):
+    # version 只用來當快取鍵：目錄更新後舊的聚合結果自然失效
+    return _execute_prepared("grid_q", min_mag, start_year, end_year, cell_size_for_zoom(zoom), mainshocks=mainshocks)
+
+
+def query_lod(min_mag, start_year, end_year, zoom, raw_limit=RAW_POINT_LIMIT, mainshocks=False):
+    # 滑桿數值先量化，常見組合才能命中快取
+    min_mag = round(float(min_mag), 1)
+    start_year, end_year, zoom = int(start_year), int(end_year), int(zoom)
+
+    total = count_events(min_mag, start_year, end_year, mainshocks)
+    if total <= raw_limit:
+        return LodResult("points", query_points(min_mag, start_year, end_year, mainshocks), total)
+
+    grid = _aggregate_grid(_version, min_mag, start_year, end_year, zoom, bool(mainshocks))
+    return LodResult("grid", grid, total, cell_size_for_zoom(zoom))
+
+
+def bin_density(min_mag, start_year, end_year, x0, y0, dx, dy, nx, ny, mainshocks=False):
+    # 回傳有地震的格子 (ix, iy, count, mag_sum)；座標定義見 density_q
+    if not _rows:
+        return pd.DataFrame(columns=['ix', 'iy', 'count', 'mag_sum'])
+    return _execute_prepared("density_q", float(min_mag), start_year, end_year,
+                             float(x0), float(y0), float(dx), float(dy), nx, ny, mainshocks=mainshocks)
+
+
+# ==========================================
+# 4. 統計面板用的聚合 (單次掃描，三種分組)
+# ==========================================
+def aggregate_stats(min_mag, start_year, end_year, mainshocks=False):
+    # depth_class 的分界與 quake_layers.DEPTH_BINS 相同 (20 / 60 / 150 km)
+    if not _rows:
+        return pd.DataFrame(columns=['year', 'depth_class', 'mag_bin', 'count'])
+    return _execute_prepared("stats_q", float(min_mag), start_year, end_year, mainshocks=mainshocks)
+
+
+# ==========================================
+# 5. 主震 / 餘震 (去叢集) ：標記由 decluster 模組計算，這裡只負責掛上查詢
+# ==========================================
+def catalog_fingerprint():
+    # 目錄內容的指紋 (筆數 + 每筆 id / 時間 / 位置 / 規模的雜湊和)：
+    # 事件有增刪或規模被修訂都會改變，用來判斷磁碟上的標記還能不能沿用
+    # 只算基本目錄 (與目錄版本同步)：即時疊加層的變動不影響標記與 URL 上的 v=
+    if not _rows:
+        return "0:0"
+    with _lock:
+        n, h = _con.execute(
+            "SELECT count(*), sum(hash(id, time, latitude, longitude, mag))::VARCHAR FROM base_events").fetchone()
+    return f"{n}:{h}"
+
+
+DECLUSTER_COLUMNS = ['id', 't', 'latitude', 'longitude', 'mag']
+
+
+def decluster_input(batch_rows=262144):
+    # 去叢集用：基本目錄的全部事件依時間排序 (時間轉成 epoch 秒，方便 searchsorted)；
+    # 標記以目錄版本為鍵，即時疊加層的新事件不在裡面 (主震模式下要等下次同步才會出現)
+    # 只取需要的五欄，逐批 (Arrow record batch) 接成 NumPy 陣列，不先整份變成 pandas DataFrame；
+    # id 留在 Arrow 字串陣列，不展開成一個個 Python 字串。回傳 {欄名: 陣列}
+    parts = {name: [] for name in DECLUSTER_COLUMNS}
+    if _rows:
+        with _lock:
+            reader = _con.execute(
+                "SELECT id, epoch(time) AS t, latitude, longitude, mag FROM base_events ORDER BY time, id"
+            ).fetch_record_batch(batch_rows)
+            for batch in reader:
+                for name in DECLUSTER_COLUMNS:
+                    parts[name].append(batch.column(name))
+    columns = {name: np.concatenate([c.to_numpy() for c in parts[name]]) if parts[name] else np.empty(0)
+               for name in DECLUSTER_COLUMNS[1:]}
+    columns['id'] = pa.chunked_array(parts['id'], type=pa.string())
+    return columns
+
+
+CROSSFILTER_COLUMNS = ['latitude', 'longitude', 'mag', 'depth', 'year']
+
+
+def crossfilter_floor(max_rows):
+    # 筆數上限 → 規模下限：由大到小累計每 0.1 級的筆數，回傳總數不超過 max_rows 的最低一級
+    # (全目錄都放得下就回傳 None，不設下限)
+    if not _rows:
+        return None
+    with _lock:
+        row = _con.execute("""
+            WITH bins AS (
+                SELECT floor(round(mag * 10)) AS m10, count(*) AS n FROM base_events WHERE mag IS NOT NULL GROUP BY 1
+            ), ranked AS (
+                SELECT m10, sum(n) OVER (ORDER BY m10 DESC) AS cum, sum(n) OVER () AS total FROM bins
+            )
+            SELECT min(m10) FILTER (WHERE cum <= ?), max(m10), max(total) FROM ranked
+        """, [int(max_rows)]).fetchone()
+    m10, top, total = row
+    if total is None or total <= max_rows:
+        return None
+    # 最大的一級就超過上限時只留那一級 (筆數略超過上限，總比空白好)
+    return float(m10 if m10 is not None else top) / 10
+
+
+def crossfilter_input(min_mag=None, batch_rows=262144):
+    # 交叉篩選用：基本目錄只取五個數值欄 (不含地名等字串欄)，規模下限由 crossfilter_floor 決定；
+    # 依規模由大到小排序 (地圖只畫前幾筆時就是最大的那些)，逐批 (Arrow record batch) 接成 NumPy 陣列。回傳 {欄名: 陣列}
+    parts = {name: [] for name in CROSSFILTER_COLUMNS}
+    if _rows:
+        where = "" if min_mag is None else f"WHERE mag >= {float(min_mag) - 1e-6}"
+        with _lock:
+            reader = _con.execute(
+                f"SELECT {', '.join(CROSSFILTER_COLUMNS)} FROM base_events {where} ORDER BY mag DESC NULLS LAST, time"
+            ).fetch_record_batch(batch_rows)
+            for batch in reader:
+                for name in CROSSFILTER_COLUMNS:
+                    parts[name].append(batch.column(name))
+    return {name: np.concatenate([c.to_numpy(zero_copy_only=False) for c in parts[name]]) if parts[name] else np.empty(0)
+            for name in CROSSFILTER_COLUMNS}
+
+
+SECTION_INDEX_COLUMNS = ['longitude', 'latitude', 'depth', 'mag', 'year']
+
+
+def section_input(batch_rows=262144):
+    # 剖面空間索引用 (cross_section.get_index)：基本目錄的五個數值欄 + id_key (= hash(id)，與即時疊加層比對修訂版)；
+    # 逐批 (Arrow record batch) 接成 NumPy 陣列，不經 pandas。回傳 {欄名: 陣列}
+    names = SECTION_INDEX_COLUMNS + ['id_key']
+    parts = {name: [] for name in names}
+    if _rows:
+        with _lock:
+            reader = _con.execute(
+                f"SELECT {', '.join(SECTION_INDEX_COLUMNS)}, hash(id) AS id_key FROM base_events"
+            ).fetch_record_batch(batch_rows)
+            for batch in reader:
+                for name in names:
+                    parts[name].append(batch.column(name))
+    return {name: np.concatenate([c.to_numpy(zero_copy_only=False) for c in parts[name]]) if parts[name] else np.empty(0)
+            for name in names}
+
+
+def live_section_rows(west, south, east, north):
+    # 即時疊加層裡 bbox 內的事件 (欄位同 section_input)，以及疊加層全部的 id_key：
+    # 基本目錄裡 id_key 在其中的是被修訂過的舊版 (新版可能已移出 bbox)，剖面要拿掉
+    empty = pd.DataFrame(columns=SECTION_INDEX_COLUMNS + ['id_key'])
+    with _lock:
+        if not _rows or not _has_live():
+            return empty, np.empty(0, dtype=np.uint64)
+        rows = _con.execute(f"""
+            SELECT {', '.join(SECTION_INDEX_COLUMNS)}, hash(id) AS id_key FROM live_events
+            WHERE longitude >= ? AND longitude <= ? AND latitude >= ? AND latitude <= ?
+        """, [float(west), float(east), float(south), float(north)]).df()
+        keys = _con.execute("SELECT hash(id) AS id_key FROM live_events").df()['id_key'].to_numpy()
+    return rows, keys
+
+
+def attach_mainshocks(version, ids):
+    # ids：主震的事件 id；建立 mainshocks view，並把每個查詢再 PREPARE 一份 (<name>_main)
+    # version 與目前目錄不同 (計算期間目錄已換新) 就不掛，回傳 False
+    global _mainshocks_version
+    with _lock:
+        if version != _version or not _rows:
+            return False
+        _con.register("mainshock_df", pd.DataFrame({"id": pd.Series(ids, dtype=str)}))
+        _con.execute("CREATE OR REPLACE TABLE mainshock_ids AS SELECT DISTINCT id FROM mainshock_df")
+        _con.unregister("mainshock_df")
+        _con.execute("CREATE OR REPLACE VIEW mainshocks AS SELECT * FROM events WHERE id IN (SELECT id FROM mainshock_ids)")
+        _prepare_all(mainshocks=True)
+        _mainshocks_version = version
+    return True
+
+
+def has_mainshocks():
+    return bool(_rows) and _mainshocks_version == _version
@@ -0,0 +1,111 @@
+import base64
+import io
+import math
+import os
+
+import numpy as np
+
+from geodata import catalog, map_cache, quake_db
+
+# ==========================================
+# 1. 格網：涵蓋整個查詢範圍，在 Web Mercator 座標上等距切格
+# ==========================================
+EARTH_RADIUS_KM = 6371.0
+DENSITY_BOUNDS = (catalog.TAIWAN_REGION["minlongitude"], catalog.TAIWAN_REGION["minlatitude"],
+                  catalog.TAIWAN_REGION["maxlongitude"], catalog.TAIWAN_REGION["maxlatitude"])
+GRID_SIZE = 1000
+BANDWIDTH_KM = 5.0
+
+
+def mercator_y(lat):
+    return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+
+def grid_frame(size=GRID_SIZE, bounds=DENSITY_BOUNDS):
+    west, south, east, north = bounds
+    x0, x1 = math.radians(west), math.radians(east)
+    y0, y1 = mercator_y(south), mercator_y(north)
+    return x0, y0, (x1 - x0) / size, (y1 - y0) / size
+
+
+# ==========================================
+# 2. 高斯核密度：分箱後用 FFT 做卷積 (O(N log N)，與地震筆數無關)
+# ==========================================
+def _gaussian_spectrum(length, sigma, real=False):
+    # 週期性 (wrap-around) 的一維高斯核頻譜；二維核 = 兩軸外積，頻譜也是外積
+    i = np.arange(length)
+    d = np.minimum(i, length - i).astype(float)
+    kernel = np.exp(-0.5 * (d / max(sigma, 1e-6)) ** 2)
+    kernel /= kernel.sum()
+    return np.fft.rfft(kernel) if real else np.fft.fft(kernel)
+
+
+def gaussian_kde_fft(hist, sigma_x, sigma_y):
+    # 四周補 3σ 的零，避免 FFT 的週期邊界把東邊的地震捲到西邊
+    ny, nx = hist.shape
+    px, py = int(math.ceil(3 * sigma_x)), int(math.ceil(3 * sigma_y))
+    padded = np.zeros((ny + 2 * py, nx + 2 * px))
+    padded[py:py + ny, px:px + nx] = hist
+    spectrum = np.outer(_gaussian_spectrum(padded.shape[0], sigma_y),
+                        _gaussian_spectrum(padded.shape[1], sigma_x, real=True))
+    smooth = np.fft.irfft2(np.fft.rfft2(padded) * spectrum, s=padded.shape)
+    return np.maximum(smooth[py:py + ny, px:px + nx], 0.0)
+
+
+def compute_density(min_mag, start_year, end_year, weighted=False, bandwidth_km=BANDWIDTH_KM, size=GRID_SIZE,
+                    mainshocks=False):
+    # 回傳 (size × size) 的密度 (每 km² 筆數，weighted 時為規模加權)，第 0 列在南邊
+    x0, y0, dx, dy = grid_frame(size)
+    cells = quake_db.bin_density(min_mag, start_year, end_year, x0, y0, dx, dy, size, size, mainshocks)
+    hist = np.zeros((size, size))
+    if not cells.empty:
+        weights = cells['mag_sum'] if weighted else cells['count']
+        np.add.at(hist, (cells['iy'].to_numpy(dtype=np.int64), cells['ix'].to_numpy(dtype=np.int64)),
+                  weights.to_numpy(dtype=float))
+
+    # Mercator 是等角投影：地面上 1 km 在兩軸都是 1 / (R cos φ)，以範圍中心緯度換算成格數
+    km_scale = EARTH_RADIUS_KM * math.cos(math.radians((DENSITY_BOUNDS[1] + DENSITY_BOUNDS[3]) / 2))
+    sigma = bandwidth_km / km_scale
+    density = gaussian_kde_fft(hist, sigma / dx, sigma / dy)
+    return (density / (dx * km_scale * dy * km_scale)).astype(np.float32)
+
+
+# 密度格網依篩選條件快取 (1000 × 1000 float32 約 4 MB)，所有 session 共用
+DENSITY_CACHE = map_cache.ByteLRUCache(
+    max_bytes=int(float(os.environ.get("QUAKE_DENSITY_CACHE_MB", "64")) * 1024 * 1024),
+    sizeof=lambda grid: grid.nbytes,
+)
+
+
+def get_density(min_mag, start_year, end_year, weighted=False, bandwidth_km=BANDWIDTH_KM, size=GRID_SIZE,
+                mainshocks=False):
+    min_mag = round(float(min_mag), 1)
+    key = (quake_db.catalog_version(), min_mag, int(start_year), int(end_year), bool(weighted), float(bandwidth_km),
+           int(size), bool(mainshocks))
+    return DENSITY_CACHE.get_or_compute(
+        key, lambda: compute_density(min_mag, int(start_year), int(end_year), weighted, bandwidth_km, size, mainshocks))
+
+
+# ==========================================
+# 3. 上色並輸出成單張 PNG (地圖上用 ImageOverlay 疊一層)
+# ==========================================
+DENSITY_CMAP = "inferno"
+
+
+def density_png(density, cmap=DENSITY_CMAP):
+    import matplotlib
+    from PIL import Image   # matplotlib 的必要相依套件
+
+    # 256 色調色盤 (P 模式) + 每色透明度：比 RGBA 小 3~4 倍，1000 × 1000 編碼只要幾十毫秒
+    peak = float(density.max())
+    levels = (density / peak * 255).astype(np.uint8) if peak > 0 else np.zeros(density.shape, np.uint8)
+    palette = matplotlib.colormaps[cmap](np.linspace(0, 1, 256), bytes=True)
+    # 低密度處漸漸透明，底圖才看得到；極低值直接全透明
+    alpha = np.clip(np.sqrt(np.linspace(0, 1, 256)) * 1.2, 0, 1) * 220
+    alpha[:3] = 0
+
+    img = Image.fromarray(levels[::-1], mode="P")   # 影像第 0 列是北邊
+    img.putpalette(palette[:, :3].tobytes())
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", transparency=alpha.astype(np.uint8).tobytes())
+    return "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()
@@ -0,0 +1,121 @@
+import os
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.ipc as pa_ipc
+import pyarrow.parquet as pq
+
+from geodata import decluster, quake_db, server_routes
+
+# ==========================================
+# 1. 串流匯出：DuckDB 逐批吐 Arrow record batch，邊寫邊送，不先變成 pandas
+# ==========================================
+EXPORT_ROUTE = "/_quake/export.{fmt}"
+# 格式 → (副檔名, MIME)
+EXPORT_FORMATS = {
+    "arrow": ("arrow", "application/vnd.apache.arrow.stream"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "csv": ("csv", "text/csv; charset=utf-8"),
+}
+EXPORT_COLUMNS = ['id', 'time', 'updated', 'latitude', 'longitude', 'depth', 'mag', 'place', 'year']
+# 每批筆數 = 記憶體上限 (一批的 Arrow 資料 + 寫出緩衝)；Parquet 一批就是一個 row group
+EXPORT_BATCH_ROWS = int(os.environ.get("QUAKE_EXPORT_BATCH_ROWS", "65536"))
+
+
+class _ChunkSink:
+    # pyarrow 寫出的位元組先收在這裡，每寫完一批就整包交給 HTTP 回應
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _writer(fmt, sink, schema):
+    if fmt == "arrow":
+        return pa_ipc.new_stream(sink, schema)
+    if fmt == "parquet":
+        return pq.ParquetWriter(sink, schema, compression="zstd")
+    return pa_csv.CSVWriter(sink, schema)
+
+
+def iter_export(reader, fmt):
+    # reader：pyarrow.RecordBatchReader；產生要送出的位元組片段 (每批一段)
+    sink = _ChunkSink()
+    try:
+        writer = _writer(fmt, sink, reader.schema)
+        for batch in reader:
+            writer.write_batch(batch)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+        writer.close()
+        yield sink.drain()
+    finally:
+        # 下載到一半被取消：關掉 reader，DuckDB 那邊的查詢跟著結束
+        reader.close()
+
+
+def export_reader(min_mag, start_year, end_year, mainshocks=False, batch_rows=EXPORT_BATCH_ROWS):
+    if mainshocks:
+        decluster.ensure_labels()
+    reader = quake_db.stream_points(min_mag, start_year, end_year, EXPORT_COLUMNS, mainshocks, batch_rows)
+    if reader is None:
+        # 目錄還是空的：照樣回傳有欄位名稱的空檔案
+        reader = pa.table({c: pa.array([], pa.string()) for c in EXPORT_COLUMNS}).to_reader()
+    return reader
+
+
+def export_filename(min_mag, start_year, end_year, mainshocks, fmt):
+    suffix = "_mainshocks" if mainshocks else ""
+    return f"taiwan_quakes_M{round(float(min_mag), 1)}_{int(start_year)}-{int(end_year)}{suffix}.{EXPORT_FORMATS[fmt][0]}"
+
+
+def export_url(fmt, min_mag, start_year, end_year, mainshocks=False):
+    return (f"{EXPORT_ROUTE.replace('{fmt}', fmt)}?min_mag={round(float(min_mag), 1)}"
+            f"&start={int(start_year)}&end={int(end_year)}&main={int(bool(mainshocks))}")
+
+
+# ==========================================
+# 2. 下載端點：StreamingResponse 逐段送出 (同步產生器由 starlette 丟到執行緒池跑)
+# ==========================================
+async def export_endpoint(request):
+    from starlette.concurrency import run_in_threadpool
+    from starlette.responses import Response, StreamingResponse
+
+    fmt = request.path_params.get("fmt")
+    if fmt not in EXPORT_FORMATS:
+        return Response("unknown format", status_code=404)
+    q = request.query_params
+    try:
+        min_mag = float(q.get("min_mag", 4.0))
+        start_year = int(q.get("start", 0))
+        end_year = int(q.get("end", 9999))
+        mainshocks = q.get("main", "0") == "1"
+    except ValueError:
+        return Response("bad filter", status_code=400)
+
+    reader = await run_in_threadpool(export_reader, min_mag, start_year, end_year, mainshocks)
+    filename = export_filename(min_mag, start_year, end_year, mainshocks, fmt)
+    return StreamingResponse(iter_export(reader, fmt), media_type=EXPORT_FORMATS[fmt][1],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+def install_routes():
+    return server_routes.install_route(EXPORT_ROUTE, export_endpoint)
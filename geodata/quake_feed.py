@@ -0,0 +1,204 @@
+import collections
+import datetime
+import json
+import os
+import random
+import threading
+
+from geodata import catalog, quake_db, quake_layers, server_routes
+
+# ==========================================
+# 1. 背景輪詢：只抓高水位之後的新地震，加進 DuckDB 目錄
+# ==========================================
+FEED_ROUTE = "/_quake/live.json"
+# 輪詢間隔 (秒)；0 = 關閉即時 feed
+FEED_INTERVAL = float(os.environ.get("QUAKE_FEED_INTERVAL", "60"))
+# 預設與目錄同步用同一個 FDSN 端點 (測試時可指向 benchmarks/fake_fdsn_feed.py)
+FEED_URL = os.environ.get("QUAKE_FEED_URL") or catalog.USGS_FDSN_URL
+# 連續失敗時指數退避的上限 (秒)
+MAX_BACKOFF = 15 * 60
+# USGS 的事件常晚幾分鐘才出現在 feed：每次往回多抓一段，重複的 id 由 DuckDB 去掉 (updated 較新的修訂版取代舊版)
+FEED_OVERLAP = datetime.timedelta(minutes=30)
+# 伺服器端保留最近幾筆推送過的事件 (瀏覽器依序號補抓)
+LIVE_BUFFER = 5000
+
+
+class LiveFeed:
+    def __init__(self, base_url=None, interval=FEED_INTERVAL, min_magnitude=None):
+        self.base_url = base_url or FEED_URL
+        self.interval = interval
+        self.min_magnitude = min_magnitude
+        self.high_water = None
+        self.failures = 0
+        self.polls = 0
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._events = collections.deque(maxlen=LIVE_BUFFER)   # (序號, 事件 dict)
+        self._subscribers = {}                                  # session id → callback(seq, 新筆數)
+        self._delivered = collections.Counter()                 # session id → 已推送筆數
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- 輪詢 ---
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="quake-feed")
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def next_delay(self):
+        # 成功時照常間隔；失敗時指數退避 (加上 ±20% 抖動，多個行程不會同時重試)
+        if not self.failures:
+            return self.interval
+        return min(self.interval * 2 ** self.failures, MAX_BACKOFF) * random.uniform(0.8, 1.2)
+
+    def _run(self):
+        while not self._stop.wait(self.next_delay()):
+            self.poll()
+
+    def poll(self):
+        # 輪詢一次並記下連續失敗次數 (決定下一次的退避間隔)；失敗時回傳 None
+        try:
+            added = self.poll_once()
+        except Exception as e:
+            self.failures += 1
+            print(f"即時地震 feed 失敗 (連續 {self.failures} 次)，{self.next_delay():.0f} 秒後重試: {e}")
+            return None
+        self.failures = 0
+        return added
+
+    def poll_once(self):
+        # 回傳這次實際寫入的筆數 (新事件 + 修訂版)
+        self.polls += 1
+        if self.high_water is None:
+            self.high_water = quake_db.latest_time() or catalog.CATALOG_START
+        start = self.high_water - FEED_OVERLAP
+        fresh = catalog.fetch_events(start, base_url=self.base_url, min_magnitude=self.min_magnitude)
+        if fresh.empty:
+            return 0
+        # 同一批裡同一個 id 只留最新的一版；目錄裡已有、又沒有更新的 id 由 append_events 略過
+        if 'updated' in fresh.columns:
+            fresh = fresh.sort_values('updated', kind='stable')
+        fresh = fresh.drop_duplicates(subset='id', keep='last')
+        added = quake_db.append_events(fresh)
+        self.high_water = max(self.high_water, fresh['time'].max())
+        if added.empty:
+            return 0
+        self._publish(added)
+        print(f"即時地震 feed：寫入 {len(added)} 筆新事件 / 修訂版 (序號 {self._seq})")
+        return len(added)
+
+    # --- 推送 ---
+    def _publish(self, added):
+        colors = quake_layers.depth_class(added['depth'].to_numpy(dtype=float))
+        radii = quake_layers.marker_radius(added['mag'].to_numpy(dtype=float), 0)   # 筆數少，不縮小
+        with self._lock:
+            for (_, row), color, radius in zip(added.iterrows(), colors, radii):
+                self._seq += 1
+                self._events.append((self._seq, {
+                    "id": str(row['id']),
+                    "time": row['time'].isoformat(),
+                    "lat": round(float(row['latitude']), 4),
+                    "lon": round(float(row['longitude']), 4),
+                    "mag": round(float(row['mag']), 1),
+                    "depth": round(float(row['depth']), 1),
+                    "place": str(row['place']),
+                    "year": int(row['year']),
+                    "color": int(color),
+                    "radius": round(float(radius), 1),
+                }))
+            seq, subscribers = self._seq, list(self._subscribers.items())
+        for session_id, callback in subscribers:
+            try:
+                callback(seq, len(added))
+                with self._lock:
+                    self._delivered[session_id] += len(added)
+            except Exception as e:
+                # session 已關閉 (kernel 不在了)：取消訂閱
+                print(f"即時推送失敗，取消訂閱 {session_id}: {e}")
+                self.unsubscribe(session_id)
+
+    def subscribe(self, session_id, callback):
+        with self._lock:
+            self._subscribers[session_id] = callback
+        return lambda: self.unsubscribe(session_id)
+
+    def unsubscribe(self, session_id):
+        with self._lock:
+            self._subscribers.pop(session_id, None)
+
+    def delivered(self, session_id):
+        with self._lock:
+            return self._delivered[session_id]
+
+    def current_seq(self):
+        return self._seq
+
+    def events_between(self, since, upto=None, min_mag=None, start_year=None, end_year=None):
+        # 序號在 (since, upto] 之間、符合篩選條件的事件
+        with self._lock:
+            items = [e for s, e in self._events if s > since and (upto is None or s <= upto)]
+        return [e for e in items
+                if (min_mag is None or e["mag"] >= min_mag)
+                and (start_year is None or e["year"] >= start_year)
+                and (end_year is None or e["year"] <= end_year)]
+
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+def get_feed():
+    global _feed
+    with _feed_lock:
+        if _feed is None:
+            # 分區 Parquet 模式的目錄是 M2 以上，feed 也抓到同一個下限
+            min_mag = catalog.PARTITION_MIN_MAGNITUDE if catalog.STORAGE_MODE == "parquet" else None
+            _feed = LiveFeed(min_magnitude=min_mag)
+        return _feed
+
+
+def start(source):
+    # 目錄載入完成後呼叫：先掛上目錄 (高水位從 DuckDB 取)，再啟動輪詢執行緒
+    quake_db.use_catalog(source)
+    return get_feed().start()
+
+
+def current_seq():
+    return get_feed().current_seq()
+
+
+def live_url(since, upto, min_mag, start_year, end_year):
+    return (f"{FEED_ROUTE}?since={int(since)}&upto={int(upto)}&min_mag={round(float(min_mag), 1)}"
+            f"&start={int(start_year)}&end={int(end_year)}")
+
+
+# ==========================================
+# 2. 瀏覽器依序號補抓新事件 (地圖不重建，只在上面加點)
+# ==========================================
+async def live_endpoint(request):
+    from starlette.responses import Response
+
+    q = request.query_params
+    try:
+        since = int(q.get("since", 0))
+        upto = int(q["upto"]) if "upto" in q else None
+        min_mag = float(q.get("min_mag", 0))
+        start_year = int(q.get("start", 0))
+        end_year = int(q.get("end", 9999))
+    except ValueError:
+        return Response("bad filter", status_code=400)
+
+    feed = get_feed()
+    events = feed.events_between(since, upto, min_mag, start_year, end_year)
+    body = {"seq": feed.current_seq(), "events": events}
+    return Response(json.dumps(body, ensure_ascii=False, separators=(",", ":")), media_type="application/json",
+                    headers={"Cache-Control": "no-store"})
+
+
+def install_routes():
+    return server_routes.install_route(FEED_ROUTE, live_endpoint)
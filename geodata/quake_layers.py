@@ -0,0 +1,555 @@
+import json
+
+import folium
+import numpy as np
+import pandas as pd
+from branca.element import MacroElement
+from jinja2 import Template
+
+# ==========================================
+# 1. 深度分層與圓點大小 (整欄一次算完)
+# ==========================================
+# ★★★ 顏色分層：強調隱沒帶深度結構 ★★★
+DEPTH_BINS = [20, 60, 150]
+DEPTH_COLORS = [
+    "#FF0000",   # 極淺層 (<20km，紅) - 破壞力最強
+    "#FF8800",   # 淺層 (20-60km，橘)
+    "#FFFF00",   # 中層 (60-150km，黃)
+    "#0000FF",   # 深層 (>150km，藍) - 隱沒帶深處
+]
+
+POPUP_TEMPLATE = "<b>{place}</b><br>年份: {year}<br>規模: {mag}<br>深度: {depth}km"
+
+
+def get_color(depth):
+    return DEPTH_COLORS[int(np.searchsorted(DEPTH_BINS, depth, side='right'))]
+
+
+def depth_class(depth):
+    # 回傳 DEPTH_COLORS 的索引 (0~3)，與 get_color 的分界一致
+    return np.searchsorted(DEPTH_BINS, np.asarray(depth, dtype=float), side='right').astype(np.int8)
+
+
+def marker_radius(mag, count):
+    radius_scale = 1.0 if count < 1000 else 0.8
+    return (np.asarray(mag, dtype=float) ** 2) * 0.15 * radius_scale
+
+
+# ==========================================
+# 2. 單一 Canvas 圖層：資料以欄位陣列送到前端，共用一個 popup 模板
+# ==========================================
+class QuakeCanvasLayer(MacroElement):
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var data = {{ this.data_json }};
+            var renderer = L.canvas({padding: 0.5});
+            var layer = L.featureGroup();
+            var markers = [];
+            for (var i = 0; i < data.lat.length; i++) {
+                markers.push(L.circleMarker([data.lat[i], data.lon[i]], {
+                    renderer: renderer,
+                    radius: data.radius[i],
+                    stroke: false,
+                    fillColor: data.palette[data.color[i]],
+                    fillOpacity: 0.6,
+                    quakeIndex: i
+                }).addTo(layer));
+            }
+            // 交叉篩選：外層 iframe 的 data-selection 是 base64 點陣圖 (第 i 筆 = 第 i >> 3 個位元組的第 i & 7 bit)，
+            // 一改就只增刪狀態有變的點，地圖本身不重建
+            var frame = window.frameElement, shown = null;
+            function select() {
+                var encoded = frame && frame.getAttribute('data-selection');
+                if (encoded === null || encoded === shown) return;
+                shown = encoded;
+                var bytes = atob(encoded);
+                for (var i = 0; i < markers.length; i++) {
+                    var on = encoded === '' || ((bytes.charCodeAt(i >> 3) >> (i & 7)) & 1);
+                    if (on && !layer.hasLayer(markers[i])) layer.addLayer(markers[i]);
+                    else if (!on && layer.hasLayer(markers[i])) layer.removeLayer(markers[i]);
+                }
+            }
+            if (data.select && frame) {
+                new MutationObserver(select).observe(frame, {attributes: true, attributeFilter: ['data-selection']});
+                select();
+            }
+            layer.bindPopup(function(marker) {
+                var i = marker.options.quakeIndex;
+                var values = {
+                    place: data.places[data.place[i]],
+                    year: data.year[i],
+                    mag: data.mag[i],
+                    depth: data.depth[i]
+                };
+                return data.popup.replace(/\{(\w+)\}/g, function(_, key) { return values[key]; });
+            });
+            layer.addTo({{ this._parent.get_name() }});
+            window.{{ this.get_name() }} = layer;
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, df, select=False):
+        super().__init__()
+        self._name = "QuakeCanvasLayer"
+        data = build_layer_data(df)
+        data["select"] = select
+        self.data_json = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def build_layer_data(df):
+    count = len(df)
+    # 沒有地名欄 (交叉篩選的索引只存數值欄) 時 popup 不顯示地名
+    has_place = 'place' in df
+    place_codes, places = pd.factorize(df['place'].fillna("")) if has_place else (np.zeros(count, dtype=int), [""])
+    return {
+        # 經緯度取到小數第 4 位 (約 10 m)，顯示上無差異但 HTML 小很多
+        "lat": np.round(df['latitude'].to_numpy(dtype=float), 4).tolist(),
+        "lon": np.round(df['longitude'].to_numpy(dtype=float), 4).tolist(),
+        "radius": np.round(marker_radius(df['mag'], count), 2).tolist(),
+        "color": depth_class(df['depth']).tolist(),
+        "mag": np.round(df['mag'].to_numpy(dtype=float), 1).tolist(),
+        "depth": np.round(df['depth'].to_numpy(dtype=float), 1).tolist(),
+        "year": df['year'].astype(int).tolist(),
+        "place": place_codes.tolist(),
+        "places": [str(p) for p in places],
+        "palette": DEPTH_COLORS,
+        "popup": POPUP_TEMPLATE if has_place else POPUP_TEMPLATE.split("<br>", 1)[1],
+    }
+
+
+def add_quake_layer(m, df, select=False):
+    # select=True：點位依 iframe 的 data-selection 點陣圖增刪 (交叉篩選)
+    if not df.empty:
+        QuakeCanvasLayer(df, select).add_to(m)
+    return m
+
+
+# ==========================================
+# 3. 舊版：逐筆 CircleMarker (保留給少量資料與效能比較)
+# ==========================================
+def add_circle_markers(m, df):
+    count = len(df)
+    radius_scale = 1.0 if count < 1000 else 0.8
+    for _, row in df.iterrows():
+        folium.CircleMarker(
+            location=[row['latitude'], row['longitude']],
+            radius=(row['mag'] ** 2) * 0.15 * radius_scale,
+            color=None,
+            fill=True,
+            fill_color=get_color(row['depth']),
+            fill_opacity=0.6,
+            popup=POPUP_TEMPLATE.format(place=row['place'], year=row['year'], mag=row['mag'], depth=row['depth'])
+        ).add_to(m)
+    return m
+
+
+# ==========================================
+# 4. 格網聚合圖層 (縮放較遠、筆數太多時使用)
+# ==========================================
+GRID_POPUP_TEMPLATE = "<b>格網內 {count} 筆地震</b><br>最大規模: {max_mag}<br>深度中位數: {median_depth}km"
+
+
+class QuakeGridLayer(MacroElement):
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var data = {{ this.data_json }};
+            var renderer = L.canvas({padding: 0.5});
+            var layer = L.featureGroup();
+            var half = data.cell / 2;
+            for (var i = 0; i < data.count.length; i++) {
+                var lat = (data.gy[i] + 0.5) * data.cell, lon = (data.gx[i] + 0.5) * data.cell;
+                L.rectangle([[lat - half, lon - half], [lat + half, lon + half]], {
+                    renderer: renderer,
+                    weight: 0,
+                    fillColor: data.palette[data.color[i]],
+                    fillOpacity: data.opacity[i],
+                    quakeIndex: i
+                }).addTo(layer);
+            }
+            layer.bindPopup(function(cell) {
+                var i = cell.options.quakeIndex;
+                var values = {count: data.count[i], max_mag: data.max_mag[i], median_depth: data.median_depth[i]};
+                return data.popup.replace(/\{(\w+)\}/g, function(_, key) { return values[key]; });
+            });
+            layer.addTo({{ this._parent.get_name() }});
+            window.{{ this.get_name() }} = layer;
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, grid, cell_deg):
+        super().__init__()
+        self._name = "QuakeGridLayer"
+        self.data_json = json.dumps(build_grid_data(grid, cell_deg), ensure_ascii=False, separators=(",", ":"))
+
+
+def build_grid_data(grid, cell_deg):
+    counts = grid['count'].to_numpy(dtype=float)
+    # 透明度依筆數取對數，避免一格特別密就把其他格洗掉
+    opacity = 0.25 + 0.6 * np.log1p(counts) / max(np.log1p(counts.max()), 1e-9)
+    return {
+        "cell": cell_deg,
+        "gx": grid['gx'].astype(int).tolist(),
+        "gy": grid['gy'].astype(int).tolist(),
+        "count": grid['count'].astype(int).tolist(),
+        "max_mag": np.round(grid['max_mag'].to_numpy(dtype=float), 1).tolist(),
+        "median_depth": np.round(grid['median_depth'].to_numpy(dtype=float), 1).tolist(),
+        "color": depth_class(grid['median_depth']).tolist(),
+        "opacity": np.round(opacity, 2).tolist(),
+        "palette": DEPTH_COLORS,
+        "popup": GRID_POPUP_TEMPLATE,
+    }
+
+
+def add_grid_layer(m, grid, cell_deg):
+    if not grid.empty:
+        QuakeGridLayer(grid, cell_deg).add_to(m)
+    return m
+
+
+# ==========================================
+# 5. 向量圖磚圖層 (Leaflet.VectorGrid)：只下載畫面內的圖磚
+# ==========================================
+TILE_LAYER_OPTIONS = """{
+    interactive: true,
+    rendererFactory: L.canvas.tile,
+    vectorTileLayerStyles: {
+        %(layer)s: function(p, zoom) {
+            var palette = %(palette)s;
+            return {
+                radius: p.mag * p.mag * 0.15 * 0.8,
+                fill: true,
+                fillColor: palette[p.depth_class],
+                fillOpacity: 0.6,
+                stroke: false
+            };
+        }
+    }
+}"""
+
+
+class QuakeTilePopup(MacroElement):
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        {{ this.layer.get_name() }}.on('click', function(e) {
+            var p = e.layer.properties;
+            var html = {{ this.popup_json }}.replace(/\{(\w+)\}/g, function(_, key) { return p[key]; });
+            L.popup().setLatLng(e.latlng).setContent(html).openOn({{ this._parent.get_name() }});
+        });
+        {% endmacro %}
+    """)
+
+    def __init__(self, layer):
+        super().__init__()
+        self._name = "QuakeTilePopup"
+        self.layer = layer
+        self.popup_json = json.dumps(POPUP_TEMPLATE, ensure_ascii=False)
+
+
+def add_tile_layer(m, url, layer_name="quakes"):
+    from folium.plugins import VectorGridProtobuf
+
+    options = TILE_LAYER_OPTIONS % {"layer": layer_name, "palette": json.dumps(DEPTH_COLORS)}
+    layer = VectorGridProtobuf(url, "地震 (向量圖磚)", options, control=False)
+    layer.add_to(m)
+    QuakeTilePopup(layer).add_to(m)
+    return m
+
+
+# ==========================================
+# 6. 時間動畫：逐月影格在前端播放，只增刪進出視窗的那一格
+# ==========================================
+class QuakeAnimationLayer(MacroElement):
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var cfg = {{ this.config_json }};
+            var renderer = L.canvas({padding: 0.5});
+            var frames = {}, requested = {}, groups = {};
+            var current = -1, timer = null;
+
+            function ingest(chunk) {
+                for (var k = 0; k < chunk.labels.length; k++) {
+                    frames[chunk.start + k] = {label: chunk.labels[k], a: chunk.offsets[k], b: chunk.offsets[k + 1], data: chunk};
+                }
+            }
+            function request(f) {
+                var start = Math.floor(f / cfg.chunk) * cfg.chunk;
+                if (start >= cfg.total || requested[start]) return;
+                requested[start] = true;
+                fetch(cfg.url + '&start=' + start + '&count=' + cfg.chunk)
+                    .then(function(r) { return r.json(); })
+                    .then(ingest)
+                    .catch(function() { delete requested[start]; });
+            }
+            function drop(f) {
+                if (groups[f]) { map.removeLayer(groups[f]); delete groups[f]; }
+            }
+            function show(f) {
+                var frame = frames[f];
+                if (!frame) { request(f); return false; }
+                var d = frame.data, group = L.layerGroup();
+                for (var i = frame.a; i < frame.b; i++) {
+                    L.circleMarker([d.lat[i], d.lon[i]], {
+                        renderer: renderer,
+                        radius: d.radius[i],
+                        stroke: false,
+                        fillColor: cfg.palette[d.color[i]],
+                        fillOpacity: 0.6
+                    }).addTo(group);
+                }
+                group.addTo(map);
+                groups[f] = group;
+                drop(f - cfg.window);
+                label.innerHTML = frame.label + ' <small>(' + (frame.b - frame.a) + ' 筆)</small>';
+                // 播到一半就先抓下一段，播放時不會卡在網路請求
+                request(f + Math.ceil(cfg.chunk / 2));
+                return true;
+            }
+            function step() {
+                if (current + 1 >= cfg.total) { pause(); return; }
+                if (show(current + 1)) current += 1;
+            }
+            function play() {
+                if (current + 1 >= cfg.total) reset();
+                if (!timer) timer = setInterval(step, 1000 / cfg.fps);
+                button.textContent = '⏸';
+            }
+            function pause() {
+                clearInterval(timer);
+                timer = null;
+                button.textContent = '▶';
+            }
+            function reset() {
+                for (var f in groups) drop(f);
+                current = -1;
+            }
+
+            ingest(cfg.first);
+            requested[0] = true;
+            var control = L.control({position: 'bottomleft'});
+            var button, label;
+            control.onAdd = function() {
+                var div = L.DomUtil.create('div', 'leaflet-bar');
+                div.style.cssText = 'background:white;padding:6px 10px;font-size:14px;';
+                button = L.DomUtil.create('button', '', div);
+                button.textContent = '▶';
+                button.style.cssText = 'margin-right:8px;cursor:pointer;';
+                label = L.DomUtil.create('span', '', div);
+                label.textContent = cfg.total ? cfg.first.labels[0] : '無資料';
+                L.DomEvent.disableClickPropagation(div);
+                L.DomEvent.on(button, 'click', function() { timer ? pause() : play(); });
+                return div;
+            };
+            control.addTo(map);
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, config):
+        super().__init__()
+        self._name = "QuakeAnimationLayer"
+        self.config_json = json.dumps(config, ensure_ascii=False, separators=(",", ":"))
+
+
+def add_animation_layer(m, url, total, first_chunk, chunk, fps=12, window=12):
+    # window：畫面上同時保留最近幾個月的影格
+    QuakeAnimationLayer({
+        "url": url, "total": total, "first": first_chunk, "chunk": chunk,
+        "fps": fps, "window": window, "palette": DEPTH_COLORS,
+    }).add_to(m)
+    return m
+
+
+# ==========================================
+# 7. 密度圖：單張 PNG 疊在地圖上 (取代大量重疊的圓點)
+# ==========================================
+def add_density_layer(m, image_url, bounds, opacity=0.85):
+    # bounds：(west, south, east, north)；影像已在 Web Mercator 上等距取樣，直接對齊底圖
+    west, south, east, north = bounds
+    folium.raster_layers.ImageOverlay(
+        image=image_url,
+        bounds=[[south, west], [north, east]],
+        opacity=opacity,
+        name="地震密度",
+    ).add_to(m)
+    return m
+
+
+# ==========================================
+# 8. 即時新事件：外層 iframe 的 data-live 屬性一改就補抓，只在既有地圖上加點
+# ==========================================
+class QuakeLiveLayer(MacroElement):
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var cfg = {{ this.config_json }};
+            var frame = window.frameElement;
+            var group = L.layerGroup().addTo(map);
+            var markers = {}, loaded = null;
+            function load() {
+                var url = frame && frame.getAttribute('data-live');
+                if (!url || url === loaded) return;
+                loaded = url;
+                fetch(url).then(function(r) { return r.json(); }).then(function(data) {
+                    data.events.forEach(function(e) {
+                        // 同一事件只留一個點：修訂版 (序號較新) 取代先前畫的那一版
+                        if (markers[e.id]) group.removeLayer(markers[e.id]);
+                        markers[e.id] = L.circleMarker([e.lat, e.lon], {
+                            radius: e.radius,
+                            color: '#ffffff',
+                            weight: 2,
+                            fillColor: cfg.palette[e.color],
+                            fillOpacity: 0.9
+                        }).bindPopup(cfg.popup.replace(/\{(\w+)\}/g, function(_, key) { return e[key]; })
+                                     + '<br>' + e.time.replace('T', ' ').slice(0, 19) + ' UTC (即時)').addTo(group);
+                    });
+                }).catch(function() { loaded = null; });
+            }
+            if (frame) new MutationObserver(load).observe(frame, {attributes: true, attributeFilter: ['data-live']});
+            load();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, config):
+        super().__init__()
+        self._name = "QuakeLiveLayer"
+        self.config_json = json.dumps(config, ensure_ascii=False, separators=(",", ":"))
+
+
+def add_live_layer(m):
+    QuakeLiveLayer({"palette": DEPTH_COLORS, "popup": POPUP_TEMPLATE}).add_to(m)
+    return m
+
+
+# ==========================================
+# 9. 漸進式繪製：HTML 只內嵌規模最大的第一批，其餘依序分批抓來加在同一個 Canvas 上
+# ==========================================
+class QuakeProgressiveLayer(MacroElement):
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var cfg = {{ this.config_json }};
+            var renderer = L.canvas({padding: 0.5});
+            var layer = L.featureGroup();
+            var batches = [], shown = 0;
+            // 換了篩選條件 (iframe 被換掉) 就中止還在路上的請求，也不再要下一批
+            var controller = new AbortController();
+            window.addEventListener('pagehide', function() { controller.abort(); });
+
+            function draw(d) {
+                var b = batches.length;
+                batches.push(d);
+                for (var i = 0; i < d.lat.length; i++) {
+                    L.circleMarker([d.lat[i], d.lon[i]], {
+                        renderer: renderer,
+                        radius: d.radius[i],
+                        stroke: false,
+                        fillColor: cfg.palette[d.color[i]],
+                        fillOpacity: 0.6,
+                        quakeBatch: b,
+                        quakeIndex: i
+                    }).addTo(layer);
+                }
+                shown += d.lat.length;
+                status.textContent = d.next ? '載入中 ' + shown + ' / ' + cfg.total + ' 筆 (由大到小)' : '共 ' + shown + ' 筆';
+            }
+            function next(cursor) {
+                if (!cursor || controller.signal.aborted) return;
+                fetch(cfg.url + '&after=' + cursor.join(','), {signal: controller.signal})
+                    .then(function(r) { return r.json(); })
+                    .then(function(d) {
+                        draw(d);
+                        // 讓瀏覽器先把這一批畫出來再要下一批
+                        requestAnimationFrame(function() { next(d.next); });
+                    })
+                    .catch(function(e) {
+                        if (e.name !== 'AbortError') status.textContent = '載入中斷 (' + shown + ' / ' + cfg.total + ' 筆)';
+                    });
+            }
+
+            layer.bindPopup(function(marker) {
+                var d = batches[marker.options.quakeBatch], i = marker.options.quakeIndex;
+                var values = {place: d.places[d.place[i]], year: d.year[i], mag: d.mag[i], depth: d.depth[i]};
+                return cfg.popup.replace(/\{(\w+)\}/g, function(_, key) { return values[key]; });
+            });
+            layer.addTo(map);
+
+            var control = L.control({position: 'bottomleft'});
+            var status;
+            control.onAdd = function() {
+                var div = L.DomUtil.create('div', 'leaflet-bar');
+                div.style.cssText = 'background:white;padding:4px 8px;font-size:12px;';
+                status = L.DomUtil.create('span', '', div);
+                return div;
+            };
+            control.addTo(map);
+
+            draw(cfg.first);
+            next(cfg.first.next);
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, config):
+        super().__init__()
+        self._name = "QuakeProgressiveLayer"
+        self.config_json = json.dumps(config, ensure_ascii=False, separators=(",", ":"))
+
+
+def add_progressive_layer(m, first, url):
+    # first：quake_progressive.first_batch 的結果 (含 total 與下一批的游標)
+    QuakeProgressiveLayer({
+        "first": first, "url": url, "total": first["total"],
+        "palette": DEPTH_COLORS, "popup": POPUP_TEMPLATE,
+    }).add_to(m)
+    return m
+
+
+# ==========================================
+# 10. 震源剖面線：外層 iframe 的 data-section 屬性 (JSON：端點、緩衝帶) 一改就重畫，地圖本身不重建
+# ==========================================
+class QuakeSectionLayer(MacroElement):
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var frame = window.frameElement;
+            var group = L.layerGroup().addTo(map);
+            var shown = null;
+            function draw() {
+                var value = (frame && frame.getAttribute('data-section')) || '';
+                if (value === shown) return;
+                shown = value;
+                group.clearLayers();
+                if (!value) return;
+                var s = JSON.parse(value);
+                L.polygon(s.buffer, {color: 'white', weight: 1, opacity: 0.6, fillOpacity: 0.08, interactive: false}).addTo(group);
+                L.polyline(s.line, {color: 'white', weight: 3, dashArray: '8'}).bindTooltip(s.tooltip).addTo(group);
+                ['A', 'B'].forEach(function(label, k) {
+                    L.marker(s.line[k], {
+                        icon: L.divIcon({className: '', html: "<b style='color:white;font-size:16px'>" + label + "</b>"})
+                    }).bindTooltip('剖面端點 ' + label).addTo(group);
+                });
+            }
+            if (frame) new MutationObserver(draw).observe(frame, {attributes: true, attributeFilter: ['data-section']});
+            draw();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self):
+        super().__init__()
+        self._name = "QuakeSectionLayer"
+
+
+def add_section_layer(m):
+    QuakeSectionLayer().add_to(m)
+    return m
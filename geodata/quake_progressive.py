@@ -0,0 +1,96 @@
+import json
+import os
+
+import numpy as np
+
+from geodata import decluster, quake_db, quake_layers, server_routes
+
+# ==========================================
+# 1. 依規模由大到小分批：地圖 HTML 只內嵌第一批，其餘由瀏覽器依序抓
+# ==========================================
+# 第一批的筆數固定，地圖出現的時間與篩選結果有多少筆無關
+BATCH_ROUTE = "/_quake/batch.json"
+FIRST_BATCH = int(os.environ.get("QUAKE_FIRST_BATCH", "500"))
+BATCH_SIZE = int(os.environ.get("QUAKE_BATCH_SIZE", "5000"))
+
+
+def _cursor(df):
+    # 下一批的起點 (最後一筆的排序鍵)；id_key 是 64 位元雜湊，JSON 裡存字串 (JS 的數字只有 53 位元)
+    if df.empty:
+        return None
+    return [int(df['mag_key'].iloc[-1]), str(int(df['id_key'].iloc[-1]))]
+
+
+def fetch_batch(min_mag, start_year, end_year, after=None, limit=BATCH_SIZE, total=0, mainshocks=False):
+    # 回傳欄位式資料 (與 quake_layers.build_layer_data 相同的欄位) + next 游標；
+    # 圓點大小依「整個篩選結果」的筆數縮放，各批次的大小才一致
+    df = quake_db.query_ranked(min_mag, start_year, end_year, after, limit, mainshocks)
+    place_codes, places = (df['place'].fillna("").factorize() if len(df) else (np.zeros(0, dtype=int), []))
+    mag = df['mag'].to_numpy(dtype=float)
+    return {
+        "lat": np.round(df['latitude'].to_numpy(dtype=float), 4).tolist(),
+        "lon": np.round(df['longitude'].to_numpy(dtype=float), 4).tolist(),
+        "radius": np.round(quake_layers.marker_radius(mag, total), 2).tolist(),
+        "color": quake_layers.depth_class(df['depth']).tolist(),
+        "mag": np.round(mag, 1).tolist(),
+        "depth": np.round(df['depth'].to_numpy(dtype=float), 1).tolist(),
+        "year": df['year'].astype(int).tolist(),
+        "place": place_codes.tolist(),
+        "places": [str(p) for p in places],
+        # 這批沒滿表示已經到底
+        "next": _cursor(df) if len(df) >= limit else None,
+    }
+
+
+def first_batch(min_mag, start_year, end_year, mainshocks=False):
+    total = quake_db.count_events(min_mag, start_year, end_year, mainshocks)
+    batch = fetch_batch(min_mag, start_year, end_year, None, FIRST_BATCH, total, mainshocks)
+    batch["total"] = total
+    return batch
+
+
+def batch_url(min_mag, start_year, end_year, total, mainshocks=False):
+    # 游標 (&after=…) 由前端接在後面；v = 目錄指紋 (主震模式再加上去叢集方法)，內容變了瀏覽器快取自然失效
+    tag = quake_db.catalog_tag() + (f"-{decluster.DECLUSTER_METHOD}" if mainshocks else "")
+    return (f"{BATCH_ROUTE}?min_mag={round(float(min_mag), 1)}&start={int(start_year)}&end={int(end_year)}"
+            f"&n={int(total)}&main={int(bool(mainshocks))}&limit={BATCH_SIZE}&v={tag}")
+
+
+# ==========================================
+# 2. 後續批次端點：一次只會有一個請求在路上 (前端畫完一批才要下一批)
+# ==========================================
+async def batch_endpoint(request):
+    from starlette.concurrency import run_in_threadpool
+    from starlette.responses import Response
+
+    q = request.query_params
+    try:
+        min_mag = float(q.get("min_mag", 4.0))
+        start_year = int(q.get("start", 0))
+        end_year = int(q.get("end", 9999))
+        total = int(q.get("n", 0))
+        mainshocks = q.get("main", "0") == "1"
+        limit = min(max(int(q.get("limit", BATCH_SIZE)), 1), 10 * BATCH_SIZE)
+        after = None
+        if "after" in q:
+            mag_key, id_key = q["after"].split(",")
+            after = (int(mag_key), int(id_key))
+    except ValueError:
+        return Response("bad filter", status_code=400)
+
+    # 使用者已經移動滑桿 (iframe 換掉、請求被中止)：排隊中的查詢直接放棄
+    if await request.is_disconnected():
+        return Response(status_code=204)
+
+    def load():
+        if mainshocks:
+            decluster.ensure_labels()
+        return fetch_batch(min_mag, start_year, end_year, after, limit, total, mainshocks)
+
+    batch = await run_in_threadpool(load)
+    return Response(json.dumps(batch, ensure_ascii=False, separators=(",", ":")), media_type="application/json",
+                    headers={"Cache-Control": "public, max-age=3600"})
+
+
+def install_routes():
+    return server_routes.install_route(BATCH_ROUTE, batch_endpoint)
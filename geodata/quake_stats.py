@@ -0,0 +1,117 @@
+import functools
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from geodata import quake_db
+
+# ==========================================
+# 1. 古登堡-芮克特 (Gutenberg–Richter) 參數
+# ==========================================
+MAG_BIN = 0.1
+# 最大曲率法 (MAXC) 常低估完整震級，文獻慣用 +0.2 修正 (Woessner & Wiemer, 2005)
+MAXC_CORRECTION = 0.2
+# 完整震級以上少於這個筆數就不估 b 值
+MIN_EVENTS_FOR_B = 50
+BOOTSTRAP_SAMPLES = 1000
+DEPTH_LABELS = ["極淺層 (<20km)", "淺層 (20-60km)", "中層 (60-150km)", "深層 (>150km)"]
+
+
+@dataclass
+class GRStats:
+    total: int
+    mfd: pd.DataFrame                  # mag, count, cumulative (N ≥ M)
+    per_year: pd.Series
+    per_depth: pd.Series               # 索引為 DEPTH_LABELS
+    mc: float = float("nan")
+    b: float = float("nan")
+    a: float = float("nan")
+    mc_ci: tuple = (float("nan"), float("nan"))
+    b_ci: tuple = (float("nan"), float("nan"))
+    n_above_mc: int = 0
+    notes: list = field(default_factory=list)
+
+
+def _mc_maxc(mags, counts):
+    # counts 可以是一維 (原始資料) 或二維 (每列一次 bootstrap)
+    return mags[np.argmax(counts, axis=-1)] + MAXC_CORRECTION
+
+
+def _b_value(mags, counts, mc):
+    # Aki-Utsu 最大概似估計 (含分箱修正)：b = log10(e) / (平均規模 - (Mc - ΔM/2))
+    counts = np.atleast_2d(counts)
+    mc = np.atleast_1d(mc)
+    above = mags[None, :] >= mc[:, None] - 1e-9
+    n = (counts * above).sum(axis=1)
+    mean = (counts * above * mags[None, :]).sum(axis=1) / np.maximum(n, 1)
+    b = np.log10(np.e) / (mean - (mc - MAG_BIN / 2))
+    b[n < MIN_EVENTS_FOR_B] = np.nan
+    return b, n
+
+
+def bootstrap_gr(mags, counts, samples=BOOTSTRAP_SAMPLES, seed=0):
+    # 分箱後的重抽樣等同多項分布：一次抽出 samples × 分箱數 的矩陣，全部向量化
+    rng = np.random.default_rng(seed)
+    total = int(counts.sum())
+    resampled = rng.multinomial(total, counts / total, size=samples)
+    mc = _mc_maxc(mags, resampled)
+    b, _ = _b_value(mags, resampled, mc)
+    return mc, b
+
+
+def _interval(values):
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return (float("nan"), float("nan"))
+    lo, hi = np.percentile(values, [2.5, 97.5])
+    return (float(lo), float(hi))
+
+
+# ==========================================
+# 2. 單次 DuckDB 聚合 → 統計量 (依篩選條件快取)
+# ==========================================
+@functools.lru_cache(maxsize=128)
+def _compute_stats(version, min_mag, start_year, end_year, mainshocks=False):
+    # version 只用來當快取鍵：目錄更新後舊結果自然失效
+    agg = quake_db.aggregate_stats(min_mag, start_year, end_year, mainshocks)
+
+    by_mag = agg[agg['mag_bin'].notna()].sort_values('mag_bin')
+    by_year = agg[agg['year'].notna()].sort_values('year')
+    by_depth = agg[agg['depth_class'].notna()]
+
+    per_year = pd.Series(by_year['count'].to_numpy(dtype=int), index=by_year['year'].astype(int), name="count")
+    per_depth = pd.Series(0, index=DEPTH_LABELS, name="count")
+    for c, n in zip(by_depth['depth_class'].astype(int), by_depth['count'].astype(int)):
+        per_depth.iloc[c] += n
+
+    mags = np.round(by_mag['mag_bin'].to_numpy(dtype=float) * MAG_BIN, 1)
+    counts = by_mag['count'].to_numpy(dtype=np.int64)
+    total = int(counts.sum())
+    mfd = pd.DataFrame({"mag": mags, "count": counts, "cumulative": counts[::-1].cumsum()[::-1]})
+
+    stats = GRStats(total=total, mfd=mfd, per_year=per_year, per_depth=per_depth)
+    if total == 0:
+        stats.notes.append("篩選範圍內沒有地震")
+        return stats
+
+    stats.mc = float(_mc_maxc(mags, counts))
+    b, n = _b_value(mags, counts, stats.mc)
+    stats.b, stats.n_above_mc = float(b[0]), int(n[0])
+    if stats.n_above_mc < MIN_EVENTS_FOR_B:
+        stats.notes.append(f"完整震級以上只有 {stats.n_above_mc} 筆 (< {MIN_EVENTS_FOR_B})，不估計 b 值")
+        return stats
+
+    stats.a = float(np.log10(stats.n_above_mc) + stats.b * stats.mc)
+    boot_mc, boot_b = bootstrap_gr(mags, counts)
+    stats.mc_ci, stats.b_ci = _interval(boot_mc), _interval(boot_b)
+    if stats.mc - MAXC_CORRECTION <= min_mag + MAG_BIN / 2:
+        # 分布峰值就在篩選下限：真正的完整震級可能更低，Mc 只反映篩選截斷
+        stats.notes.append("規模分布峰值落在篩選下限，Mc 可能受篩選截斷影響")
+    return stats
+
+
+def get_stats(min_mag, start_year, end_year, mainshocks=False):
+    # 滑桿數值先量化，常見組合才能命中快取
+    return _compute_stats(quake_db.catalog_version(), round(float(min_mag), 1), int(start_year), int(end_year),
+                          bool(mainshocks))
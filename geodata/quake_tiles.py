@@ -0,0 +1,90 @@
+import math
+import os
+
+import numpy as np
+
+from geodata import map_cache, mvt, quake_db, quake_layers, server_routes
+
+# ==========================================
+# 1. 圖磚座標 (Web Mercator / XYZ)
+# ==========================================
+TILE_ROUTE = "/_quake/tiles/{z:int}/{x:int}/{y:int}.pbf"
+TILE_URL_TEMPLATE = "/_quake/tiles/{z}/{x}/{y}.pbf"
+LAYER_NAME = "quakes"
+# 圖磚邊緣外多抓一點，避免大圓點在圖磚交界被切掉 (單位：圖磚寬度比例)
+TILE_BUFFER = 64 / mvt.EXTENT
+
+
+def tile_bounds(z, x, y, buffer=0.0):
+    n = 2 ** z
+    west = (x - buffer) / n * 360.0 - 180.0
+    east = (x + 1 + buffer) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y - buffer) / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1 + buffer) / n))))
+    return west, south, east, north
+
+
+def project_to_tile(lon, lat, z, x, y, extent=mvt.EXTENT):
+    # 整欄一次換算成圖磚內座標
+    n = 2 ** z
+    lat_rad = np.radians(np.asarray(lat, dtype=float))
+    px = (np.asarray(lon, dtype=float) + 180.0) / 360.0 * n
+    py = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0 * n
+    return np.round((px - x) * extent).astype(np.int64), np.round((py - y) * extent).astype(np.int64)
+
+
+# ==========================================
+# 2. 產生圖磚 (每個圖磚結果都進 LRU 快取)
+# ==========================================
+TILE_CACHE = map_cache.ByteLRUCache(max_bytes=int(float(os.environ.get("QUAKE_TILE_CACHE_MB", "32")) * 1024 * 1024))
+
+
+def build_tile(z, x, y, min_mag, start_year, end_year):
+    df = quake_db.query_bbox(min_mag, start_year, end_year, *tile_bounds(z, x, y, TILE_BUFFER))
+    if df.empty:
+        return b""
+    xs, ys = project_to_tile(df['longitude'], df['latitude'], z, x, y)
+    return mvt.encode_point_layer(LAYER_NAME, xs.tolist(), ys.tolist(), {
+        "mag": np.round(df['mag'].to_numpy(dtype=float), 1).tolist(),
+        "depth": np.round(df['depth'].to_numpy(dtype=float), 1).tolist(),
+        "depth_class": quake_layers.depth_class(df['depth']).astype(int).tolist(),
+        "year": df['year'].astype(int).tolist(),
+        "place": df['place'].fillna("").astype(str).tolist(),
+    })
+
+
+def get_tile(z, x, y, min_mag, start_year, end_year):
+    min_mag = round(float(min_mag), 1)
+    key = (quake_db.catalog_version(), int(z), int(x), int(y), min_mag, int(start_year), int(end_year))
+    return TILE_CACHE.get_or_compute(key, lambda: build_tile(int(z), int(x), int(y), min_mag, int(start_year), int(end_year)))
+
+
+def tile_url(min_mag, start_year, end_year):
+    # v= 目錄指紋：資料更新 (或重啟後換了目錄) 瀏覽器不會拿到舊圖磚
+    return (f"{TILE_URL_TEMPLATE}?min_mag={round(float(min_mag), 1)}"
+            f"&start={int(start_year)}&end={int(end_year)}&v={quake_db.catalog_tag()}")
+
+
+# ==========================================
+# 3. 掛到 solara 的 starlette 伺服器上
+# ==========================================
+async def tile_endpoint(request):
+    from starlette.concurrency import run_in_threadpool
+    from starlette.responses import Response
+
+    p = request.path_params
+    q = request.query_params
+    try:
+        min_mag = float(q.get("min_mag", 4.0))
+        start_year = int(q.get("start", 2000))
+        end_year = int(q.get("end", 2100))
+    except ValueError:
+        return Response("bad filter", status_code=400)
+
+    data = await run_in_threadpool(get_tile, p["z"], p["x"], p["y"], min_mag, start_year, end_year)
+    return Response(data, media_type="application/vnd.mapbox-vector-tile",
+                    headers={"Cache-Control": "public, max-age=3600"})
+
+
+def install_routes():
+    return server_routes.install_route(TILE_ROUTE, tile_endpoint)
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from geodata import catalog
+
+# ==========================================
+# 1. 設定：本機 DEM (GeoTIFF) 與剖面取樣間距
+# ==========================================
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEM_FILE = os.environ.get("ROUTE_DEM_FILE", os.path.join(_REPO_ROOT, "data", "dem", "taiwan_dem.tif"))
+PROFILE_SPACING_M = float(os.environ.get("ROUTE_PROFILE_SPACING_M", "10"))
+PROFILE_DIR = "profiles"
+
+
+def _profile_dir(cache_dir=None):
+    return os.path.join(cache_dir or catalog.CACHE_DIR, PROFILE_DIR)
+
+
+def route_hash(route):
+    # 中心線頂點 (座標 + 里程) 的雜湊：換了中心線檔案，舊剖面自然不會被用到
+    h = hashlib.sha1()
+    for values in (route.lat, route.lon, route.km):
+        h.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return h.hexdigest()[:16]
+
+
+def dem_hash(path, cache_dir=None):
+    # DEM 內容的 SHA-1；大檔每次重算太慢，依 (大小, 修改時間) 記在快取資料夾，檔案沒變就沿用
+    stat = os.stat(path)
+    index_path = os.path.join(_profile_dir(cache_dir), "dem_hashes.json")
+    key = os.path.abspath(path)
+    try:
+        with open(index_path, encoding="utf8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    entry = index.get(key)
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["sha1"]
+
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    index[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": h.hexdigest()}
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    with open(index_path + ".tmp", "w", encoding="utf8") as f:
+        json.dump(index, f, indent=2)
+    os.replace(index_path + ".tmp", index_path)
+    return index[key]["sha1"]
+
+
+# ==========================================
+# 2. 取樣：只讀取樣點落到的那幾個內部區塊 (block window)，不整張載入
+# ==========================================
+def sample_dem(src, lon, lat):
+    # src：已開啟的 rasterio dataset；回傳每個點雙線性內插的高程 (nodata / 範圍外為 nan)
+    from rasterio.warp import transform
+    from rasterio.windows import Window
+
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    if src.crs is not None and not src.crs.is_geographic:
+        xs, ys = transform("EPSG:4326", src.crs, lon, lat)
+        xs, ys = np.asarray(xs), np.asarray(ys)
+    else:
+        xs, ys = lon, lat
+
+    # 像素座標 (以像素中心為整數點)，雙線性內插要 (r0, c0) 與右下鄰格
+    cols, rows = ~src.transform * (xs, ys)
+    cols, rows = np.asarray(cols) - 0.5, np.asarray(rows) - 0.5
+    inside = (rows >= 0) & (cols >= 0) & (rows <= src.height - 1) & (cols <= src.width - 1)
+    out = np.full(len(lon), np.nan)
+    if not inside.any():
+        return out
+    r0 = np.minimum(np.floor(rows[inside]).astype(np.int64), src.height - 2) if src.height > 1 else np.zeros(inside.sum(), dtype=np.int64)
+    c0 = np.minimum(np.floor(cols[inside]).astype(np.int64), src.width - 2) if src.width > 1 else np.zeros(inside.sum(), dtype=np.int64)
+    fr, fc = rows[inside] - r0, cols[inside] - c0
+
+    # 依 GeoTIFF 內部區塊分組：每個區塊只讀一次 (多讀右邊 / 下面一列，內插跨區塊邊界也不必再讀)
+    bh, bw = src.block_shapes[0]
+    block_r, block_c = r0 // bh, c0 // bw
+    keys = block_r * ((src.width + bw - 1) // bw) + block_c
+    order = np.argsort(keys, kind="stable")
+    bounds = np.flatnonzero(np.diff(keys[order])) + 1
+    values = np.full(len(r0), np.nan)
+    nodata = src.nodata
+    for group in np.split(order, bounds):
+        row_off, col_off = int(block_r[group[0]] * bh), int(block_c[group[0]] * bw)
+        height = min(bh + 1, src.height - row_off)
+        width = min(bw + 1, src.width - col_off)
+        block = src.read(1, window=Window(col_off, row_off, width, height)).astype(float)
+        if nodata is not None:
+            block[block == nodata] = np.nan
+        lr, lc = r0[group] - row_off, c0[group] - col_off
+        lr1, lc1 = np.minimum(lr + 1, height - 1), np.minimum(lc + 1, width - 1)
+        a, b = fr[group], fc[group]
+        values[group] = ((1 - a) * (1 - b) * block[lr, lc] + (1 - a) * b * block[lr, lc1]
+                         + a * (1 - b) * block[lr1, lc] + a * b * block[lr1, lc1])
+    out[inside] = values
+    return out
+
+
+def sample_profile(route, dem_path, spacing_m=PROFILE_SPACING_M):
+    # 沿路線每 spacing_m 公尺取一點 (含終點)；DEM 沒涵蓋 / nodata 的點沿里程內插補上
+    import rasterio
+
+    km = np.arange(0.0, route.length, spacing_m / 1000.0)
+    km = np.append(km, route.length)
+    points = route.locate_many(km)
+    with rasterio.open(dem_path) as src:
+        elev = sample_dem(src, points['lon'].to_numpy(), points['lat'].to_numpy())
+    valid = np.isfinite(elev)
+    if not valid.any():
+        raise ValueError("DEM 沒有涵蓋路線")
+    if not valid.all():
+        elev[~valid] = np.interp(km[~valid], km[valid], elev[valid])
+    return pd.DataFrame({"km": km, "elev": elev})
+
+
+# ==========================================
+# 3. 剖面快取：以 (路線, DEM, 間距) 為鍵存成 .npz，之後啟動直接讀檔
+# ==========================================
+_profile_lock = threading.Lock()
+
+
+def _profile_path(route, dem_path, spacing_m, cache_dir=None):
+    name = f"{route_hash(route)}_{dem_hash(dem_path, cache_dir)[:16]}_{spacing_m:g}m.npz"
+    return os.path.join(_profile_dir(cache_dir), name)
+
+
+def load_profile(route, dem_path=None, spacing_m=PROFILE_SPACING_M, cache_dir=None):
+    # 回傳 km / elev 的 DataFrame；沒有 DEM 檔 (或讀取失敗) 時退回路線頂點本身的海拔
+    dem_path = dem_path or DEM_FILE
+    fallback = pd.DataFrame({"km": route.km, "elev": route.elev})
+    if not os.path.exists(dem_path):
+        return fallback
+    with _profile_lock:
+        try:
+            started = time.perf_counter()
+            path = _profile_path(route, dem_path, spacing_m, cache_dir)
+            if os.path.exists(path):
+                with np.load(path) as cached:
+                    return pd.DataFrame({"km": cached["km"], "elev": cached["elev"]})
+            profile = sample_profile(route, dem_path, spacing_m)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                np.savez(f, km=profile['km'].to_numpy(), elev=profile['elev'].to_numpy())
+            os.replace(path + ".tmp", path)
+            print(f"DEM 剖面取樣完成：{len(profile)} 點 (每 {spacing_m:g} m)，{time.perf_counter() - started:.2f} 秒。")
+            return profile
+        except Exception as e:
+            print(f"DEM 剖面取樣失敗，改用節點海拔: {e}")
+            return fallback
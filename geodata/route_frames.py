@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from geodata import map_cache, profile_chart, quake_db, route_quakes
+
+# ==========================================
+# 1. 里程滑桿的每個停點 (0, 1, 2 … km) 預先算好：滑桿移動只查表
+# ==========================================
+FRAME_STEP_KM = 1.0
+# 周邊地震的畫格依 (目錄版本, 搜尋半徑) 快取，所有 session 共用；每個半徑一張表 (全部停點)
+FRAME_CACHE = map_cache.ByteLRUCache(
+    max_bytes=int(float(os.environ.get("TERRAIN_FRAME_CACHE_MB", "16")) * 1024 * 1024))
+# 目錄載入後在背景把所有半徑的畫格先算好 (設成 0 就改成第一次用到時才算)
+FRAME_WARMUP = os.environ.get("TERRAIN_FRAME_WARMUP", "1") == "1"
+# 最近一次預先計算的結果 (頁面上顯示用)：秒數與算好的表數
+# (預先計算本身造成的未命中另外記，頁面上的命中率只算訪客的查詢)
+WARMUP_STATS = {"seconds": None, "tables": 0, "misses": 0}
+
+
+def frame_positions(total_km, step_km=FRAME_STEP_KM):
+    return np.arange(0.0, total_km + 1e-9, step_km)
+
+
+def frame_index(km, count, step_km=FRAME_STEP_KM):
+    # 不在停點上 (例如滑桿拉到終點的小數里程) 回傳 None，由呼叫端直接計算
+    i = int(round(km / step_km))
+    if 0 <= i < count and abs(i * step_km - km) < 1e-6:
+        return i
+    return None
+
+
+class RouteFrames:
+    # 與地震目錄無關的部分 (座標、海拔、路段、剖面疊圖)：啟動時一次算完，常駐記憶體
+    def __init__(self, route, profile, background, step_km=FRAME_STEP_KM):
+        self.step_km = step_km
+        self.km = frame_positions(route.length, step_km)
+        points = route.locate_many(self.km)
+        self.lat = points['lat'].to_numpy()
+        self.lon = points['lon'].to_numpy()
+        self.elev = np.interp(self.km, profile['km'], profile['elev'])
+        self.section = [route.section_name(int(s)) for s in points['section']]
+        self.svg = [profile_chart.marker_svg(background, k, e) for k, e in zip(self.km, self.elev)]
+        self.nbytes = (self.km.nbytes * 4 + sum(len(s.encode("utf-8")) for s in self.svg + self.section))
+
+    def __len__(self):
+        return len(self.km)
+
+    def index(self, km):
+        return frame_index(km, len(self), self.step_km)
+
+
+# ==========================================
+# 2. 周邊地震畫格：一個半徑的所有停點一次向量化查詢 (k-d tree 一次查完)
+# ==========================================
+def station_table(stations):
+    rows = "\n".join(
+        f"| {r['name']} | {int(r['count'])} | "
+        + (f"M{r['max_mag']:.1f}" if r['count'] else "-") + " | "
+        + (f"{r['shallow_km']:.1f} km" if pd.notna(r['shallow_km']) else "-") + " |"
+        for _, r in stations.iterrows()
+    )
+    return "| 節點 | 筆數 | 最大 | 最近淺層 |\n|---|---|---|---|\n" + rows
+
+
+def build_quake_frames(frames, stations, radius_km):
+    # 回傳 (每個停點的周邊地震說明, 節點統計表)，都是 Markdown 字串
+    summary = route_quakes.nearby_summary(frames.lat, frames.lon, radius_km)
+    nearby = tuple(route_quakes.describe(row, radius_km) for _, row in summary.iterrows())
+    return nearby, station_table(route_quakes.station_summary(stations, radius_km))
+
+
+def get_quake_frames(frames, stations, radius_km):
+    key = (quake_db.catalog_version(), round(float(radius_km), 1), len(frames))
+    return FRAME_CACHE.get_or_compute(key, lambda: build_quake_frames(frames, stations, radius_km))
+
+
+def warm_up(frames, stations, radii):
+    # 在背景執行緒把每個半徑的表都先放進快取；目錄之後更新 (版本改變) 時由第一次查詢補算
+    def run():
+        started = time.perf_counter()
+        misses = FRAME_CACHE.misses
+        for radius_km in radii:
+            get_quake_frames(frames, stations, radius_km)
+        stats = FRAME_CACHE.stats()
+        WARMUP_STATS.update(seconds=time.perf_counter() - started, tables=len(radii), misses=stats['misses'] - misses)
+        print(f"地形頁畫格預先計算完成：{len(frames)} 個停點 × {len(radii)} 個半徑，"
+              f"{time.perf_counter() - started:.2f} 秒，快取 {stats['bytes'] / 1024:.0f} KB。")
+
+    thread = threading.Thread(target=run, name="terrain-frame-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,219 @@
+import json
+import math
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from geodata.route_quakes import EARTH_RADIUS_KM
+
+# ==========================================
+# 1. 路線中心線檔案 (台14甲 / 台8 線)：GeoJSON 或 GPX，放在本機
+# ==========================================
+# 例如從 OpenStreetMap 匯出的道路 LineString；沒有檔案時退回只用沿線節點連直線
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTE_FILE = os.environ.get("ROUTE_CENTERLINE_FILE", os.path.join(_REPO_ROOT, "data", "route", "central_cross_island.geojson"))
+# 以本地平面座標投影 (km) 找最近線段時，每個查詢點檢查幾個最近的頂點
+SNAP_CANDIDATES = 4
+# 串接分段時，上一段終點與下一段起點最多可以相隔多遠 (公尺)；更遠的多半是支線或不相連的碎段，
+# 硬接上去會在累積里程裡多出一段直線跳躍，之後每個節點的里程都跟著偏移
+MAX_GAP_M = float(os.environ.get("ROUTE_MAX_GAP_M", "300"))
+
+
+def _geojson_parts(doc):
+    # FeatureCollection / Feature / (Multi)LineString → [(lon, lat, elev 或 nan) 陣列, ...]
+    kind = doc.get("type")
+    if kind == "FeatureCollection":
+        return [p for f in doc.get("features", []) for p in _geojson_parts(f)]
+    if kind == "Feature":
+        return _geojson_parts(doc.get("geometry") or {})
+    if kind == "GeometryCollection":
+        return [p for g in doc.get("geometries", []) for p in _geojson_parts(g)]
+    lines = {"LineString": [doc.get("coordinates")], "MultiLineString": doc.get("coordinates")}.get(kind, [])
+    return [np.array([(c[0], c[1], c[2] if len(c) > 2 else np.nan) for c in line], dtype=float)
+            for line in lines if line and len(line) >= 2]
+
+
+def _gpx_parts(root):
+    # 每個 trkseg / rte 一段；<ele> 有就用
+    ns = root.tag[:root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+    parts = []
+    for seg in root.iter(f"{ns}trkseg"):
+        parts.append(seg.findall(f"{ns}trkpt"))
+    for rte in root.iter(f"{ns}rte"):
+        parts.append(rte.findall(f"{ns}rtept"))
+    out = []
+    for points in parts:
+        rows = []
+        for p in points:
+            ele = p.find(f"{ns}ele")
+            rows.append((float(p.get("lon")), float(p.get("lat")), float(ele.text) if ele is not None else np.nan))
+        if len(rows) >= 2:
+            out.append(np.array(rows, dtype=float))
+    return out
+
+
+def read_parts(path):
+    if path.lower().endswith(".gpx"):
+        return _gpx_parts(ET.parse(path).getroot())
+    with open(path, encoding="utf8") as f:
+        return _geojson_parts(json.load(f))
+
+
+def chain_parts(parts, start_lon, start_lat, max_gap_m=MAX_GAP_M):
+    # OSM 匯出的道路常拆成許多段、方向不一：從最靠近起點的一端開始，
+    # 每次接上端點最近的下一段 (必要時反轉)，串成一條連續的線；
+    # 第一段之後，最近的端點也超過 max_gap_m 就停止 (剩下的段都接不上，丟掉並印出警告)
+    heads = np.array([p[0, :2] for p in parts]).reshape(-1, 2)
+    tails = np.array([p[-1, :2] for p in parts]).reshape(-1, 2)
+    used = np.zeros(len(parts), dtype=bool)
+    here = np.array([start_lon, start_lat])
+    line = []
+    for _ in range(len(parts)):
+        d_head = np.where(used, np.inf, ((heads - here) ** 2).sum(axis=1))
+        d_tail = np.where(used, np.inf, ((tails - here) ** 2).sum(axis=1))
+        k = int(np.argmin(np.minimum(d_head, d_tail)))
+        p = parts[k][::-1] if d_tail[k] < d_head[k] else parts[k]
+        if line:
+            gap_m = float(haversine_km(here[1], here[0], p[0, 1], p[0, 0])) * 1000
+            if gap_m > max_gap_m:
+                dropped = int((~used).sum())
+                print(f"路線中心線：剩下 {dropped} 段與已串接的線相隔 {gap_m:.0f} m (> {max_gap_m:g} m)，視為支線 / 碎段略過")
+                break
+        used[k] = True
+        # 與上一段共用的端點只留一個
+        if line and ((line[-1][-1, :2] - p[0, :2]) ** 2).sum() < 1e-14:
+            p = p[1:]
+        line.append(p)
+        here = line[-1][-1, :2]
+    return np.concatenate(line) if line else np.empty((0, 3))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+# ==========================================
+# 2. 線性參考 (linear referencing)：累積里程預先算好，查詢只做二分搜尋
+# ==========================================
+class RouteLine:
+    def __init__(self, lat, lon, km, elev, stations):
+        # lat / lon / km / elev：沿線頂點 (km 單調遞增)；stations：name / lat / lon / elev / dist 的節點表
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.km = np.asarray(km, dtype=float)
+        self.elev = np.asarray(elev, dtype=float)
+        self.stations = stations.reset_index(drop=True)
+        self.station_km = self.stations['dist'].to_numpy(dtype=float)
+        self.sections = [f"{a} 往 {b}" for a, b in zip(self.stations['name'][:-1], self.stations['name'][1:])]
+        # 找最近線段用：本地等距平面 (km)，台灣尺度下誤差可忽略
+        self._lat0 = float(self.lat.mean()) if len(self.lat) else 0.0
+        self._xy = self._project(self.lat, self.lon)
+        self._tree = cKDTree(self._xy)
+
+    def __len__(self):
+        return len(self.km)
+
+    @property
+    def length(self):
+        return float(self.km[-1]) if len(self.km) else 0.0
+
+    def _project(self, lat, lon):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        kx = math.radians(1) * EARTH_RADIUS_KM * math.cos(math.radians(self._lat0))
+        ky = math.radians(1) * EARTH_RADIUS_KM
+        return np.column_stack([lon * kx, lat * ky])
+
+    def _interpolate(self, km):
+        # 一次 searchsorted 找出每個里程所在的線段，再線性內插
+        n = len(self.km)
+        i = np.clip(np.searchsorted(self.km, km, side="right") - 1, 0, n - 2)
+        span = self.km[i + 1] - self.km[i]
+        t = np.clip(np.divide(km - self.km[i], span, out=np.zeros_like(km), where=span > 0), 0.0, 1.0)
+        lat = self.lat[i] + (self.lat[i + 1] - self.lat[i]) * t
+        lon = self.lon[i] + (self.lon[i + 1] - self.lon[i]) * t
+        elev = self.elev[i] + (self.elev[i + 1] - self.elev[i]) * t
+        section = np.clip(np.searchsorted(self.station_km, km, side="right") - 1, 0, len(self.station_km) - 2)
+        section = np.where(km > self.station_km[-1], -1, section)
+        return lat, lon, elev, section
+
+    def locate_many(self, km):
+        # 里程陣列 → lat / lon / elev / section (節點區段編號；-1 = 已抵達終點)
+        km = np.asarray(km, dtype=float)
+        lat, lon, elev, section = self._interpolate(km)
+        return pd.DataFrame({"km": km, "lat": lat, "lon": lon, "elev": elev, "section": section})
+
+    def section_name(self, section):
+        return self.sections[section] if section >= 0 else "抵達終點"
+
+    def locate(self, km):
+        # 單一里程 → (lat, lon, elev, 路段名稱)
+        lat, lon, elev, section = self._interpolate(np.array([float(km)]))
+        return float(lat[0]), float(lon[0]), float(elev[0]), self.section_name(int(section[0]))
+
+    def snap(self, lat, lon):
+        # 座標 → 最近的路線里程與偏離距離 (km)；lat / lon 可為陣列
+        # 先用 k-d tree 找最近的幾個頂點，再投影到它們前後的線段上取最近的一點
+        points = self._project(np.atleast_1d(lat), np.atleast_1d(lon))
+        k = min(SNAP_CANDIDATES, len(self.km))
+        _, idx = self._tree.query(points, k=k)
+        idx = idx.reshape(len(points), k)
+        # 候選線段：每個候選頂點的前一段與後一段
+        seg = np.clip(np.concatenate([idx - 1, idx], axis=1), 0, len(self.km) - 2)
+        a, b = self._xy[seg], self._xy[seg + 1]
+        ab = b - a
+        denom = (ab ** 2).sum(axis=2)
+        t = np.clip(np.divide(((points[:, None, :] - a) * ab).sum(axis=2), denom,
+                              out=np.zeros_like(denom), where=denom > 0), 0.0, 1.0)
+        off = np.linalg.norm(a + ab * t[..., None] - points[:, None, :], axis=2)
+        best = off.argmin(axis=1)
+        rows = np.arange(len(points))
+        s, tb = seg[rows, best], t[rows, best]
+        km = self.km[s] + (self.km[s + 1] - self.km[s]) * tb
+        return km, off[rows, best]
+
+
+def from_stations(stations):
+    # 沒有中心線檔案：節點之間連直線，里程沿用節點表的 dist (與原本的行為相同)
+    return RouteLine(stations['lat'], stations['lon'], stations['dist'], stations['elev'], stations)
+
+
+def from_parts(parts, stations):
+    # 中心線頂點的里程以大圓距離累加；節點依投影到線上的位置重新給里程
+    coords = chain_parts(parts, float(stations['lon'].iloc[0]), float(stations['lat'].iloc[0]))
+    lon, lat, elev = coords[:, 0], coords[:, 1], coords[:, 2]
+    step = haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    km = np.concatenate([[0.0], np.cumsum(step)])
+    keep = np.concatenate([[True], step > 0])   # 重複的頂點會讓里程不嚴格遞增
+    lat, lon, km, elev = lat[keep], lon[keep], km[keep], elev[keep]
+
+    line = RouteLine(lat, lon, km, np.zeros_like(km), stations)
+    station_km, _ = line.snap(stations['lat'], stations['lon'])
+    # 節點的順序以原表為準 (線的方向已依起點決定)
+    stations = stations.assign(dist=np.round(np.maximum.accumulate(station_km), 2))
+    if np.isnan(elev).any():
+        # 檔案沒有高程 (或有缺)：用節點海拔沿里程內插
+        missing = np.isnan(elev)
+        elev[missing] = np.interp(km[missing], stations['dist'], stations['elev'])
+    return RouteLine(lat, lon, km, elev, stations)
+
+
+def load_route(stations, path=None):
+    path = path or ROUTE_FILE
+    if not os.path.exists(path):
+        return from_stations(stations)
+    try:
+        parts = read_parts(path)
+        if not parts:
+            raise ValueError("檔案中沒有 LineString")
+        line = from_parts(parts, stations)
+        print(f"路線中心線：{path} ({len(line)} 個頂點，{line.length:.1f} km)")
+        return line
+    except Exception as e:
+        print(f"路線中心線讀取失敗，改用節點直線: {e}")
+        return from_stations(stations)
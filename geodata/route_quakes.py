@@ -0,0 +1,149 @@
+import functools
+import math
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from geodata import quake_db, quake_layers
+
+# ==========================================
+# 1. 球面空間索引：經緯度轉成單位球上的 3D 座標後建 k-d tree
+# ==========================================
+# 單位球上兩點的弦長 c 與大圓距離 d 單調對應 (c = 2 sin(d / 2R))，
+# 用弦長半徑查詢就等於用 haversine 距離查詢，結果完全一致
+EARTH_RADIUS_KM = 6371.0
+NEARBY_RADIUS_KM = 20.0
+# 「淺層」與地圖配色的第一個深度分界相同 (< 20 km，破壞力最強)
+SHALLOW_DEPTH_KM = quake_layers.DEPTH_BINS[0]
+SUMMARY_COLUMNS = ['count', 'max_mag', 'max_mag_time', 'max_mag_depth', 'max_mag_km',
+                   'shallow_km', 'shallow_mag', 'shallow_depth']
+
+
+def unit_vectors(lat, lon):
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_for_km(km):
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+def km_for_chord(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=float) / 2, 0, 1))
+
+
+class QuakeTree:
+    def __init__(self, df):
+        # 依規模由大到小排序：同一段規模級距內，索引越小規模越大
+        order = np.argsort(-df['mag'].to_numpy(dtype=float), kind="stable")
+        self.lat = df['latitude'].to_numpy(dtype=float)[order]
+        self.lon = df['longitude'].to_numpy(dtype=float)[order]
+        self.mag = df['mag'].to_numpy(dtype=float)[order]
+        self.depth = df['depth'].to_numpy(dtype=float)[order]
+        self.time = (df['time'].to_numpy()[order] if 'time' in df
+                     else np.full(len(df), np.datetime64("NaT"), dtype="datetime64[ns]"))
+        xyz = unit_vectors(self.lat, self.lon)
+        self.tree = cKDTree(xyz)
+        # 每個整數規模級距另建一棵小樹：找「範圍內最大規模」時由大級距往下查，
+        # 第一個有命中的級距才需要取出點位 (大地震很少，取出的點也少)
+        band = np.floor(self.mag).astype(np.int64)
+        self.bands = []
+        for b in np.unique(band)[::-1]:
+            idx = np.flatnonzero(band == b)
+            self.bands.append((idx, cKDTree(xyz[idx])))
+        # 「最近的淺層地震」另建一棵只含淺層的樹：最近鄰查詢一次到位，不必在大樹裡逐筆過濾
+        self.shallow = np.flatnonzero(self.depth < SHALLOW_DEPTH_KM)
+        self.shallow_tree = cKDTree(xyz[self.shallow]) if len(self.shallow) else None
+
+    def __len__(self):
+        return len(self.mag)
+
+    def _largest(self, points, chord):
+        # 回傳每個查詢點範圍內規模最大的地震索引 (沒有則為 -1)
+        best = np.full(len(points), -1, dtype=np.int64)
+        todo = np.arange(len(points))
+        for idx, tree in self.bands:
+            if not len(todo):
+                break
+            hit = tree.query_ball_point(points[todo], chord, return_length=True) > 0
+            for i in todo[hit]:
+                # 級距內已依規模遞減排序：最小的區域索引就是最大規模 (同規模取較早排入的一筆)
+                best[i] = idx[min(tree.query_ball_point(points[i], chord))]
+            todo = todo[~hit]
+        return best
+
+    def summarize(self, lat, lon, radius_km=NEARBY_RADIUS_KM):
+        # lat / lon 可以是單點或陣列 (所有站點一次查完)；回傳每個查詢點一列
+        points = unit_vectors(np.atleast_1d(lat), np.atleast_1d(lon))
+        n = len(points)
+        count = np.zeros(n, dtype=np.int64)
+        max_mag, max_depth, max_km = np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.nan)
+        max_time = np.full(n, np.datetime64("NaT"), dtype="datetime64[ns]")
+        shallow_km, shallow_mag, shallow_depth = np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.nan)
+
+        if len(self) and n:
+            chord = chord_for_km(radius_km)
+            count = self.tree.query_ball_point(points, chord, return_length=True).astype(np.int64)
+
+            best = self._largest(points, chord)
+            found = best >= 0
+            rows = best[found]
+            max_mag[found], max_depth[found] = self.mag[rows], self.depth[rows]
+            max_time[found] = self.time[rows]
+            max_km[found] = km_for_chord(np.linalg.norm(points[found] - self.tree.data[rows], axis=1))
+
+            if self.shallow_tree is not None:
+                dist, idx = self.shallow_tree.query(points, k=1, distance_upper_bound=chord)
+                found = np.isfinite(dist)
+                rows = self.shallow[idx[found]]
+                shallow_km[found] = km_for_chord(dist[found])
+                shallow_mag[found], shallow_depth[found] = self.mag[rows], self.depth[rows]
+
+        return pd.DataFrame({
+            'count': count, 'max_mag': max_mag, 'max_mag_time': max_time, 'max_mag_depth': max_depth,
+            'max_mag_km': max_km, 'shallow_km': shallow_km, 'shallow_mag': shallow_mag, 'shallow_depth': shallow_depth,
+        }, columns=SUMMARY_COLUMNS)
+
+
+@functools.lru_cache(maxsize=4)
+def _build_tree(version, min_mag):
+    # version 只用來當快取鍵：目錄更新後自動重建 (每個行程每份目錄只建一次)
+    return QuakeTree(quake_db.query_timeline(min_mag))
+
+
+def get_tree(min_mag=0.0):
+    return _build_tree(quake_db.catalog_version(), round(float(min_mag), 1))
+
+
+# ==========================================
+# 2. 路線站點 / 任意里程的周邊地震摘要
+# ==========================================
+def nearby_summary(lat, lon, radius_km=NEARBY_RADIUS_KM, min_mag=0.0):
+    return get_tree(min_mag).summarize(lat, lon, radius_km)
+
+
+def station_summary(stations, radius_km=NEARBY_RADIUS_KM, min_mag=0.0):
+    # stations：含 name / lat / lon 欄的 DataFrame (例如 02 頁的 df_route)
+    summary = nearby_summary(stations['lat'].to_numpy(), stations['lon'].to_numpy(), radius_km, min_mag)
+    summary.insert(0, 'name', stations['name'].to_numpy())
+    return summary
+
+
+def describe(row, radius_km=NEARBY_RADIUS_KM):
+    # 一列摘要 → 側欄顯示用的 Markdown 文字
+    if not row['count']:
+        return f"方圓 {radius_km:g} km 內沒有目錄中的地震"
+    when = row['max_mag_time']
+    lines = [
+        f"**方圓 {radius_km:g} km**：{int(row['count'])} 筆地震",
+        f"**最大**：M{row['max_mag']:.1f}，深 {row['max_mag_depth']:.0f} km，距 {row['max_mag_km']:.1f} km"
+        + (f" ({when:%Y-%m-%d})" if pd.notna(when) else ""),
+    ]
+    if pd.notna(row['shallow_km']):
+        lines.append(f"**最近淺層 (<{SHALLOW_DEPTH_KM} km)**：距 {row['shallow_km']:.1f} km，M{row['shallow_mag']:.1f}")
+    else:
+        lines.append(f"**最近淺層 (<{SHALLOW_DEPTH_KM} km)**：範圍內沒有")
+    return "\n\n".join(lines)
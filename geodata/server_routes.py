@@ -0,0 +1,15 @@
+# ==========================================
+# 在 solara 的 starlette 伺服器上加掛自訂 HTTP 路由
+# ==========================================
+# solara 沒有提供自訂路由的設定，直接插在 catch-all 頁面路由之前
+
+
+def install_route(path, endpoint):
+    try:
+        from solara.server.starlette import app
+        from starlette.routing import Route
+    except ImportError:
+        return False
+    if not any(getattr(r, "path", None) == path for r in app.router.routes):
+        app.router.routes.insert(0, Route(path, endpoint=endpoint))
+    return True
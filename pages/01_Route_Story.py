@@ -2,6 +2,8 @@ import solara
 import leafmap.foliumap as leafmap
 import io  # 記憶體操作工具
 
+from geodata import catalog, quake_db, route_quakes
+
 # ==========================================
 # 1. 定義沿途亮點 (埔里 -> 水庫 -> 武嶺 -> 峽谷 -> 海口)
 # ==========================================
@@ -86,6 +88,17 @@ ROUTE_HIGHLIGHTS = [
 # ==========================================
 current_step = solara.reactive(0) 
 
+# 地震目錄在背景載入 (與 09 頁共用)；每個亮點的周邊地震一次查完
+catalog_future = catalog.load_catalog_async()
+
+def wait_for_catalog():
+    return catalog_future.result()[1].total
+
+def get_highlight_quakes():
+    quake_db.use_catalog(catalog_future.result()[0])
+    lat, lon = zip(*(item["location"] for item in ROUTE_HIGHLIGHTS))
+    return route_quakes.nearby_summary(lat, lon)
+
 # ==========================================
 # 3. 頁面元件
 # ==========================================
@@ -93,6 +106,8 @@ current_step = solara.reactive(0)
 def Page():
     
     highlight = ROUTE_HIGHLIGHTS[current_step.value]
+    solara.lab.use_task(wait_for_catalog, dependencies=[])
+    quakes_ready = catalog_future.done() and catalog_future.exception() is None
     
     # 建立地圖物件
     m = leafmap.Map(
@@ -146,6 +161,10 @@ def Page():
                 with solara.Div(key=f"hl-final-content-{highlight['id']}"):
                     solara.HTML(tag="h3", unsafe_innerHTML=highlight["title"], style=f"color: {highlight['color']};")
                     solara.Markdown(highlight["content"])
+                    if quakes_ready:
+                        with solara.Card(elevation=1, style={"background-color": "#fff3e0"}):
+                            solara.Markdown("##### 🌏 周邊地震")
+                            solara.Markdown(route_quakes.describe(get_highlight_quakes().iloc[highlight["id"]]))
 
                 solara.Markdown("---")
                 solara.Markdown("#### 📍 路線節點")
@@ -1,10 +1,11 @@
 import solara
-import leafmap.foliumap as leafmap
+import ipyleaflet
+import ipywidgets
 import pandas as pd
-import matplotlib.pyplot as plt
-import io
 import numpy as np 
 
+from geodata import catalog, profile_chart, quake_db, route_dem, route_frames, route_line, route_quakes
+
 # ==========================================
 # 1. 數據準備：中橫公路關鍵節點
 # ==========================================
@@ -19,68 +20,111 @@ route_data = [
     {"name": "天祥", "lat": 24.1820, "lon": 121.4945, "elev": 480, "dist": 95},
     {"name": "太魯閣", "lat": 24.1565, "lon": 121.6225, "elev": 60, "dist": 114},
 ]
-df_route = pd.DataFrame(route_data)
+# 沿線道路中心線 (台14甲 / 台8，ROUTE_CENTERLINE_FILE 指定的 GeoJSON / GPX)：
+# 有檔案時節點里程改成投影到中心線上的實際道路里程；沒有檔案就沿用上表、節點之間連直線
+ROUTE = route_line.load_route(pd.DataFrame(route_data))
+df_route = ROUTE.stations
 
 # ★★★ 關鍵修復：強制轉型為 float (解決 TraitError) ★★★
-TOTAL_DIST = float(df_route['dist'].max())
+TOTAL_DIST = float(ROUTE.length)
+WULING_KM = float(df_route.loc[df_route['name'] == "武嶺", 'dist'].iloc[0])
+
+# 高程剖面：有本機 DEM (ROUTE_DEM_FILE) 時沿中心線每 10 m 取樣，結果快取在 data/cache/profiles/；
+# 沒有 DEM 就用節點 (或中心線檔案) 的海拔
+PROFILE = route_dem.load_profile(ROUTE)
 
-# --- 輔助函式：根據公里數(km)計算目前的經緯度 ---
+# --- 輔助函式：根據公里數(km)計算目前的經緯度 (滑桿停點直接查表；其他里程用累積里程二分搜尋，O(log n)) ---
 def get_location_at_km(current_km):
-    for i in range(len(df_route) - 1):
-        p1 = df_route.iloc[i]
-        p2 = df_route.iloc[i+1]
-        
-        if p1['dist'] <= current_km <= p2['dist']:
-            ratio = (current_km - p1['dist']) / (p2['dist'] - p1['dist'])
-            lat = p1['lat'] + (p2['lat'] - p1['lat']) * ratio
-            lon = p1['lon'] + (p2['lon'] - p1['lon']) * ratio
-            elev = p1['elev'] + (p2['elev'] - p1['elev']) * ratio
-            section_name = f"{p1['name']} 往 {p2['name']}"
-            return lat, lon, elev, section_name
-            
-    last = df_route.iloc[-1]
-    return last['lat'], last['lon'], last['elev'], "抵達終點"
+    i = FRAMES.index(current_km)
+    if i is not None:
+        return float(FRAMES.lat[i]), float(FRAMES.lon[i]), float(FRAMES.elev[i]), FRAMES.section[i]
+    lat, lon, _, section_name = ROUTE.locate(current_km)
+    elev = float(np.interp(current_km, PROFILE['km'], PROFILE['elev']))
+    return lat, lon, elev, section_name
+
+# --- 地震目錄：與 09 頁共用同一個背景載入 (import 本頁不必等網路) ---
+catalog_future = catalog.load_catalog_async()
+
+def wait_for_catalog():
+    return catalog_future.result()[1].total
+
+def get_quake_panel(current_km, lat, lon, radius_km):
+    # 回傳 (周邊地震說明, 節點統計表)：同一半徑的所有停點一次查完放進共用快取，滑桿移動只查表
+    quake_db.use_catalog(catalog_future.result()[0])
+    nearby, table = route_frames.get_quake_frames(FRAMES, df_route, radius_km)
+    i = FRAMES.index(current_km)
+    if i is None:
+        nearby_text = route_quakes.describe(route_quakes.nearby_summary(lat, lon, radius_km).iloc[0], radius_km)
+    else:
+        nearby_text = nearby[i]
+    return nearby_text, table
 
 # ==========================================
 # 2. 響應式變數
 # ==========================================
 current_km = solara.reactive(0.0)
+nearby_radius = solara.reactive(route_quakes.NEARBY_RADIUS_KM)   # 周邊地震搜尋半徑 (km)
+RADIUS_CHOICES = [float(r) for r in range(5, 55, 5)]             # 與下方半徑滑桿的停點相同
 
 # ==========================================
-# 3. 繪圖函式 (動態版)
+# 3. 繪圖函式 (動態版)：剖面底圖只畫一次，滑桿移動只換紅線 / 紅點的 SVG 疊圖
 # ==========================================
+CHART_BACKGROUND = profile_chart.render_background(PROFILE, df_route)
+
+
+# 滑桿每個停點的座標、海拔、路段與疊圖 SVG 先算好 (約百來個停點，幾十 KB)
+FRAMES = route_frames.RouteFrames(ROUTE, PROFILE, CHART_BACKGROUND)
+
+
 def get_elevation_chart(current_pos_km):
-    fig, ax = plt.subplots(figsize=(6, 4))
-    fig.patch.set_facecolor('#ffffff')
-    
-    ax.fill_between(df_route['dist'], df_route['elev'], color='#2E8B57', alpha=0.5)
-    ax.plot(df_route['dist'], df_route['elev'], color='#006400', linewidth=2)
-    
+    i = FRAMES.index(current_pos_km)
+    if i is not None:
+        return FRAMES.svg[i]
+    _, _, curr_elev, _ = get_location_at_km(current_pos_km)
+    return profile_chart.marker_svg(CHART_BACKGROUND, current_pos_km, curr_elev)
+
+
+def warm_up_frames(future):
+    # 目錄載入後，背景把每個搜尋半徑的周邊地震畫格先算好
+    if route_frames.FRAME_WARMUP and future.exception() is None:
+        quake_db.use_catalog(future.result()[0])
+        route_frames.warm_up(FRAMES, df_route, RADIUS_CHOICES)
+
+catalog_future.add_done_callback(warm_up_frames)
+
+# --- 駕駛地圖：ipyleaflet widget 常駐在前端，圖磚與路線不會因為滑桿移動重新載入 ---
+def create_drive_map(lat, lon):
+    m = ipyleaflet.Map(
+        center=[lat, lon],
+        zoom=12,
+        basemap=ipyleaflet.basemaps.OpenStreetMap.Mapnik,
+        scroll_wheel_zoom=True,
+        layout=ipywidgets.Layout(height="750px", width="100%"),
+    )
+    m.add(ipyleaflet.basemap_to_tiles(ipyleaflet.basemaps.Esri.WorldTopoMap))
+    m.add(ipyleaflet.FullScreenControl())
+
+    points = np.column_stack([ROUTE.lat, ROUTE.lon]).round(5).tolist()
+    m.add(ipyleaflet.Polyline(locations=points, color="blue", weight=3, opacity=0.5, fill=False))
+
     for _, row in df_route.iterrows():
-        if row['name'] in ["埔里", "武嶺", "太魯閣"]:
-            ax.text(row['dist'], row['elev'] + 100, row['name'], ha='center', fontsize=8, fontweight='bold')
+        if row['name'] in ["武嶺", "埔里", "太魯閣"]:
+            m.add(ipyleaflet.Marker(
+                location=[row['lat'], row['lon']],
+                title=row['name'],
+                draggable=False,
+                icon=ipyleaflet.AwesomeIcon(name="info-circle", marker_color="green"),
+            ))
 
-    # 動態紅線
-    ax.axvline(x=current_pos_km, color='red', linestyle='--', linewidth=2)
-    
-    _, _, curr_elev, _ = get_location_at_km(current_pos_km)
-    ax.scatter(current_pos_km, curr_elev, color='red', s=50, zorder=5)
-    ax.text(current_pos_km + 2, curr_elev, f"{int(curr_elev)}m", color='red', fontsize=9, fontweight='bold')
-
-    ax.set_title("中橫公路垂直剖面 (拖曳下方滑桿移動)", fontsize=10, fontweight='bold')
-    ax.set_xlabel("距離 (km)")
-    ax.set_ylabel("海拔 (m)")
-    ax.grid(True, linestyle='--', alpha=0.3)
-    ax.set_ylim(0, 3600)
-    
-    plt.tight_layout()
-    
-    s = io.BytesIO()
-    plt.savefig(s, format='png', dpi=100)
-    plt.close()
-    s.seek(0)
-    import base64
-    return f'<img src="data:image/png;base64,{base64.b64encode(s.read()).decode()}" style="width: 100%;">'
+    car_popup = ipywidgets.HTML()
+    car = ipyleaflet.Marker(
+        location=[lat, lon],
+        draggable=False,
+        popup=car_popup,
+        icon=ipyleaflet.AwesomeIcon(name="car", marker_color="red"),
+    )
+    m.add(car)
+    return m, car, car_popup
 
 # ==========================================
 # 4. 頁面元件
@@ -89,40 +133,18 @@ def get_elevation_chart(current_pos_km):
 def Page():
     
     lat, lon, elev, section_name = get_location_at_km(current_km.value)
+    solara.lab.use_task(wait_for_catalog, dependencies=[])
+    quakes_ready = catalog_future.done() and catalog_future.exception() is None
     
-    def calculate_map():
-        m = leafmap.Map(
-            center=[lat, lon],
-            zoom=12,
-            google_map="TERRAIN",
-            draw_control=False,
-            measure_control=False,
-        )
-        
-        points = [(row['lat'], row['lon']) for _, row in df_route.iterrows()]
-        leafmap.folium.PolyLine(locations=points, color="blue", weight=3, opacity=0.5).add_to(m)
-
-        leafmap.folium.Marker(
-            location=[lat, lon],
-            popup=f"目前位置: {section_name}<br>海拔: {int(elev)}m",
-            icon=leafmap.folium.Icon(color="red", icon="car", prefix="fa")
-        ).add_to(m)
-        
-        for _, row in df_route.iterrows():
-            if row['name'] in ["武嶺", "埔里", "太魯閣"]:
-                leafmap.folium.Marker(
-                    location=[row['lat'], row['lon']],
-                    tooltip=row['name'],
-                    icon=leafmap.folium.Icon(color="green", icon="info-sign")
-                ).add_to(m)
-        
-        # 記憶體輸出 (io.BytesIO)
-        fp = io.BytesIO()
-        m.save(fp, close_file=False)
-        fp.seek(0)
-        return fp.read().decode('utf-8')
+    # 地圖 widget 每個工作階段只建一次；滑桿移動只送車子的新座標、彈出視窗文字與視角中心
+    drive_map, car, car_popup = solara.use_memo(lambda: create_drive_map(lat, lon), dependencies=[])
 
-    map_html = solara.use_memo(calculate_map, dependencies=[current_km.value])
+    def move_car():
+        car.location = [lat, lon]
+        car_popup.value = f"目前位置: {section_name}<br>海拔: {int(elev)}m"
+        drive_map.center = [lat, lon]
+
+    solara.use_effect(move_car, [current_km.value])
     chart_html = get_elevation_chart(current_km.value)
 
     solara.Title("中橫地形探索")
@@ -157,27 +179,45 @@ def Page():
                 )
                 
                 solara.Markdown("---")
+
+                solara.Markdown("### 🌏 周邊地震")
+                solara.SliderFloat(
+                    label="搜尋半徑 (km)",
+                    value=nearby_radius,
+                    min=RADIUS_CHOICES[0],
+                    max=RADIUS_CHOICES[-1],
+                    step=5.0,
+                    thumb_label="always"
+                )
+                if quakes_ready:
+                    nearby_text, station_text = get_quake_panel(current_km.value, lat, lon, nearby_radius.value)
+                    with solara.Card(elevation=1, style={"background-color": "#fff3e0"}):
+                        solara.Markdown(nearby_text)
+                    solara.Markdown(station_text)
+                    cache_stats = route_frames.FRAME_CACHE.stats()
+                    warmup = route_frames.WARMUP_STATS
+                    misses = cache_stats['misses'] - warmup['misses']
+                    lookups = cache_stats['hits'] + misses
+                    solara.Markdown(
+                        f"<small>畫格快取：命中 {cache_stats['hits']} / 未命中 {misses}"
+                        + (f" (命中率 {cache_stats['hits'] / lookups:.0%})" if lookups else "")
+                        + f"，{cache_stats['bytes'] / 1024:.0f} KB / {cache_stats['max_bytes'] / 1024 / 1024:.0f} MB"
+                        + (f"，預先計算 {warmup['tables']} 個半徑 {warmup['seconds']:.2f} 秒" if warmup['seconds'] is not None else "")
+                        + "</small>"
+                    )
+                else:
+                    solara.Info("地震目錄載入中…")
+
+                solara.Markdown("---")
                 
                 solara.Markdown("### 📈 垂直位置")
-                solara.HTML(tag="div", unsafe_innerHTML=chart_html)
+                # 底圖 <img> 的屬性永遠不變，前端不會重新傳送；每次只更新上面那層幾百位元組的 SVG
+                with solara.Div(style={"position": "relative"}):
+                    solara.HTML(tag="img", attributes={"src": CHART_BACKGROUND.data_uri, "style": "width: 100%; display: block;"})
+                    solara.HTML(tag="div", unsafe_innerHTML=chart_html, style="position: absolute; inset: 0;")
                 
-                solara.Info("觀察重點：注意看當滑桿通過「武嶺 (53km)」時，剖面圖達到最高點，隨後進入東段急速下降，這就是立霧溪強烈侵蝕造成的險峻地形。")
-
-            with solara.Column(style={"height": "100%", "padding": "0"}):
-                solara.Div(
-                    children=[
-                         solara.HTML(
-                            tag="iframe",
-                            attributes={
-                                "srcdoc": map_html,
-                                "width": "100%",
-                                "height": "100%",
-                                "style": "border: none; width: 100%; height: 750px;" 
-                            }
-                        )
-                    ],
-                    style={"height": "100%", "width": "100%"},
-                    key=f"drive-map-{current_km.value}"
-                )
+                solara.Info(f"觀察重點：注意看當滑桿通過「武嶺 ({WULING_KM:.0f}km)」時，剖面圖達到最高點，隨後進入東段急速下降，這就是立霧溪強烈侵蝕造成的險峻地形。")
+
+            solara.Column(children=[drive_map], style={"height": "100%", "padding": "0"})
 
 Page()
\ No newline at end of file
@@ -1,138 +1,405 @@
 import solara
 import leafmap.foliumap as leafmap
-import pandas as pd
-import duckdb
+import numpy as np
 import io
+import base64
+import matplotlib.pyplot as plt
 import datetime
+import threading
+import json
+
+from geodata import catalog, cross_section, crossfilter, decluster, map_cache, quake_3d, quake_animation, quake_db, quake_density, quake_feed, quake_export, quake_layers, quake_progressive, quake_stats, quake_tiles
+
+# ==========================================
+# 1. 資料準備：USGS 台灣專屬歷史查詢 (本機 Parquet 快取 + 增量同步)
+# ==========================================
+# 背景下載 (全域共用的 Future)：import 本頁不必等網路，所有 session 共用同一份資料
+# 冷啟動直接讀本機快取，只向 USGS 補抓高水位之後 (含重疊窗) 的新地震
+catalog_future = catalog.load_catalog_async()
+
+def get_earthquakes():
+    # 等待背景載入完成 (完成後即時回傳)
+    # QUAKE_STORAGE=parquet 時回傳的是分區 Parquet 資料夾路徑，查詢一律經過 quake_db
+    df, _ = catalog_future.result()
+    return df
+
+def wait_for_catalog():
+    # 在 solara 的背景執行緒等待，不會卡住頁面渲染
+    return catalog_future.result()[1].total
+
+# 分區 Parquet 模式才載入 M2 以上的完整目錄，滑桿下限跟著放寬
+PARTITIONED = catalog.STORAGE_MODE == "parquet"
+MIN_MAG_FLOOR = catalog.PARTITION_MIN_MAGNITUDE if PARTITIONED else 4.0
 
 # ==========================================
-# 1. 資料準備：USGS 台灣專屬歷史查詢
+# 2. DuckDB 查詢引擎
+# ==========================================
+def query_earthquakes(min_mag, selected_year_range, zoom=None, mainshocks=False):
+    # zoom=None：回傳原始點位 DataFrame
+    # 給 zoom：細緻度模式，回傳 LodResult (筆數超過門檻時為依縮放等級聚合的格網)
+    # mainshocks=True：只查去除前震 / 餘震後的主震 (主震標記需已由頁面在背景掛上，見 load_labels)
+    quake_db.use_catalog(get_earthquakes())
+    start_year, end_year = selected_year_range
+    if zoom is None:
+        return quake_db.query_points(min_mag, start_year, end_year, mainshocks)
+    return quake_db.query_lod(min_mag, start_year, end_year, zoom, mainshocks=mainshocks)
+
+# 地震點繪製方式："progressive" = 依規模由大到小分批載入 (HTML 只內嵌第一批)；
+# "canvas" = 單一 Canvas 圖層 + 共用 popup (全部內嵌)；"markers" = 逐筆 CircleMarker (舊版)
+QUAKE_RENDER_MODE = "progressive"
+
+# ==========================================
+# 3. 響應式變數
+# ==========================================
+# 設定年份範圍 (資料還在背景下載，先用今年當預設，載入後再依資料調整滑桿範圍)
+current_year = datetime.date.today().year
+DEFAULT_VIEW = (4.0, [current_year - 5, current_year], 9, True, False)   # (最小規模, 年份, 縮放, 格網聚合, 向量圖磚)
+
+min_magnitude = solara.reactive(DEFAULT_VIEW[0]) 
+year_range = solara.reactive(DEFAULT_VIEW[1]) # 預設看最近5年
+map_zoom = solara.reactive(DEFAULT_VIEW[2])          # 地圖縮放等級 (同時決定格網大小)
+lod_enabled = solara.reactive(DEFAULT_VIEW[3])    # 筆數過多時自動改畫格網
+tile_mode = solara.reactive(DEFAULT_VIEW[4])      # 向量圖磚 (MVT)：只下載畫面內的圖磚
+
+# 震源剖面：預設為通過立霧溪出海口的東西向剖面線
+show_section = solara.reactive(False)
+section_azimuth = solara.reactive(90.0)       # 方位角 (由北順時針)
+section_offset = solara.reactive(0.0)         # 垂直平移 (km，正值往北 / 左側)
+section_half_length = solara.reactive(100.0)  # 剖面半長 (km)
+section_buffer = solara.reactive(20.0)        # 緩衝寬度 (km，剖面線兩側)
+animation_mode = solara.reactive(False)       # 時間動畫 (逐月播放)
+density_mode = solara.reactive(False)         # 核密度圖 (取代圓點)
+density_weighted = solara.reactive(False)     # 密度以規模加權
+view_3d = solara.reactive(False)              # 3D 深度點雲 (deck.gl)
+mainshocks_only = solara.reactive(False)      # 只顯示主震 (Gardner–Knopoff 去叢集)
+# 交叉篩選：規模 / 深度 / 年份 直方圖互相連動 (刷選範圍 None = 整個維度)
+crossfilter_mode = solara.reactive(False)
+mag_brush = solara.reactive(None)
+depth_brush = solara.reactive(None)
+year_brush = solara.reactive(None)
+# 即時 feed：本 session 收到的最新事件序號 (背景輪詢有新事件時由訂閱 callback 更新)
+live_seq = solara.reactive(0)
+
+def get_year_bounds():
+    quake_db.use_catalog(get_earthquakes())
+    return quake_db.year_bounds() or (2000, current_year)
+
 # ==========================================
-def get_taiwan_earthquake_data():
-    today = datetime.date.today()
-    end_date = today.strftime("%Y-%m-%d")
+# 4. 地圖產生 + 全行程共用的 LRU 快取
+# ==========================================
+def build_map_html(min_mag, selected_year_range, zoom, lod, tiles=False, animate=False, density=None, mainshocks=False, brushing=False):
+    # 先記下即時 feed 的序號：之後才進來的即時事件 (快取的地圖裡沒有) 由瀏覽器依序號補畫
+    live_base = quake_feed.current_seq()
+    # mainshocks 只作用在 點位 / 格網 / 密度圖 (圖磚、動畫模式在頁面上與主震模式互斥)
+    if density:
+        # 密度圖：DuckDB 分箱 + FFT 高斯核，整個範圍只輸出一張圖 (density 為 "count" 或 "mag" 加權)
+        start_year, end_year = selected_year_range
+        grid = quake_density.get_density(min_mag, start_year, end_year, weighted=(density == "mag"), mainshocks=mainshocks)
+        result = quake_db.LodResult("density", None, quake_db.count_events(min_mag, start_year, end_year, mainshocks))
+    elif animate:
+        # 時間動畫：2000 年起逐月播放，地圖只內嵌第一段影格，其餘由瀏覽器向 /_quake/frames.json 分段抓
+        frames = quake_animation.get_frames(min_mag)
+        total_frames = len(frames["labels"])
+        first_chunk = quake_animation.frame_chunk(min_mag, 0)
+        result = quake_db.LodResult("animation", None, int(frames["offsets"][-1]))
+    elif tiles:
+        # 向量圖磚模式：地圖本身不含地震資料，瀏覽器平移縮放時再向 /_quake/tiles 要圖磚
+        start_year, end_year = selected_year_range
+        count = quake_db.count_events(min_mag, start_year, end_year)
+        result = quake_db.LodResult("tiles", None, count)
+    elif brushing:
+        # 交叉篩選：點陣圖索引裡的地震全部畫一次 (順序與索引相同)；刷選結果由頁面以 iframe 的
+        # data-selection 點陣圖送到前端，只切換點的顯示，地圖不重建也不進快取鍵
+        xf = crossfilter.get_crossfilter()
+        result = quake_db.LodResult("crossfilter", xf.points(), len(xf))
+    elif lod:
+        result = query_earthquakes(min_mag, selected_year_range, zoom=zoom, mainshocks=mainshocks)
+    elif QUAKE_RENDER_MODE == "progressive":
+        # 漸進式：只取規模最大的前 FIRST_BATCH 筆內嵌，出圖時間與篩選結果的筆數無關
+        start_year, end_year = selected_year_range
+        first = quake_progressive.first_batch(min_mag, start_year, end_year, mainshocks)
+        result = quake_db.LodResult("progressive", first, first["total"])
+    else:
+        df = query_earthquakes(min_mag, selected_year_range, mainshocks=mainshocks)
+        result = quake_db.LodResult("points", df, len(df))
+    count = result.total
     
-    # 抓取 2000 年至今，台灣東部與花蓮外海的地震
-    api_url = (
-        f"https://earthquake.usgs.gov/fdsnws/event/1/query?format=csv"
-        f"&starttime=2000-01-01&endtime={end_date}"
-        f"&minmagnitude=4.0"
-        f"&minlatitude=21.0&maxlatitude=26.0"
-        f"&minlongitude=119.0&maxlongitude=123.0"
+    # 建立地圖：中心鎖定立霧溪口
+    m = leafmap.Map(
+        center=[24.14, 121.6], 
+        zoom=zoom,                
+        google_map="HYBRID",
+        draw_control=False,
+        measure_control=False,
     )
+
+    # ★★★ 顏色分層優化：強調隱沒帶深度結構 (分界見 quake_layers.DEPTH_BINS) ★★★
+    lod_note = ""
+    if result.kind == "density":
+        quake_layers.add_density_layer(m, quake_density.density_png(grid), quake_density.DENSITY_BOUNDS)
+        unit = "規模加權" if density == "mag" else "筆"
+        lod_note = f"核密度圖 (頻寬 {quake_density.BANDWIDTH_KM:.0f} km，峰值 {grid.max():.2f} {unit}/km²)"
+    elif result.kind == "animation":
+        quake_layers.add_animation_layer(m, quake_animation.frames_url(min_mag), total_frames, first_chunk,
+                                         quake_animation.FRAME_CHUNK)
+        lod_note = f"時間動畫 ({total_frames} 個月，按左下角 ▶ 播放)"
+    elif result.kind == "tiles":
+        quake_layers.add_tile_layer(m, quake_tiles.tile_url(min_mag, *selected_year_range))
+        lod_note = "向量圖磚 (只載入畫面內的範圍)"
+    elif result.kind == "grid":
+        # 筆數太多：每格顯示筆數 / 最大規模 / 深度中位數
+        quake_layers.add_grid_layer(m, result.data, result.cell_deg)
+        lod_note = f"{result.cell_deg * 111:.0f} km 格網聚合 ({len(result.data)} 格)"
+    elif result.kind == "progressive":
+        # 其餘批次由瀏覽器依序抓；換篩選條件時 iframe 換掉，還在路上的請求跟著中止
+        quake_layers.add_progressive_layer(m, result.data, quake_progressive.batch_url(min_mag, *selected_year_range, count, mainshocks))
+        if count > len(result.data["lat"]):
+            lod_note = f"依規模由大到小分批載入 (先畫前 {len(result.data['lat'])} 筆，之後每批 {quake_progressive.BATCH_SIZE} 筆)"
+    elif result.kind == "crossfilter":
+        quake_layers.add_quake_layer(m, result.data, select=True)
+        lod_note = ("交叉篩選 (刷選只切換點的顯示"
+                    + (f"，地圖只畫規模最大的 {xf.map_rows} 筆 (M{float(xf.mag[xf.map_rows - 1]):.1f} 以上)" if 0 < xf.map_rows < len(xf) else "")
+                    + (f"，索引只含 M{xf.min_mag:.1f} 以上" if xf.min_mag is not None else "") + ")")
+    elif QUAKE_RENDER_MODE == "markers":
+        quake_layers.add_circle_markers(m, result.data)
+    else:
+        quake_layers.add_quake_layer(m, result.data)
     
-    print(f"正在下載台灣 25 年地震大數據: {api_url} ...")
+    # 即時新事件疊加層：之後的新地震由瀏覽器依序號補抓，地圖本身不重建
+    quake_layers.add_live_layer(m)
+
+    # 剖面線與緩衝範圍：由頁面寫進 iframe 的 data-section，瀏覽器自己畫 (拖動剖面滑桿不重建地圖、不進快取鍵)
+    quake_layers.add_section_layer(m)
+
+    # 標記：立霧溪出海口 (參考點)
+    leafmap.folium.Marker(
+        location=[24.138, 121.655],
+        popup="立霧溪出海口",
+        tooltip="中橫公路終點",
+        icon=leafmap.folium.Icon(color="blue", icon="info-sign")
+    ).add_to(m)
+
+    # 記憶體輸出 (io.BytesIO) - 穩定不報錯
+    fp = io.BytesIO()
+    m.save(fp, close_file=False)
+    fp.seek(0)
+    map_html_str = fp.read().decode('utf-8')
     
+    return map_html_str, count, lod_note, live_base
+
+# 依 HTML 位元組數控管大小 (QUAKE_MAP_CACHE_MB，預設 64 MB)，所有 session 共用
+MAP_CACHE = map_cache.ByteLRUCache()
+
+def map_cache_key(min_mag, selected_year_range, zoom, lod, tiles=False, animate=False, density=None, mainshocks=False, brushing=False):
+    # 滑桿數值量化後當鍵；目錄版本變了 (重新同步) 舊的地圖自然不會被命中
+    start_year, end_year = selected_year_range
+    return (quake_db.catalog_version(), round(float(min_mag), 1), int(start_year), int(end_year),
+            int(zoom), bool(lod), bool(tiles), bool(animate), density, bool(mainshocks), bool(brushing), QUAKE_RENDER_MODE)
+
+def get_map_html(min_mag, selected_year_range, zoom, lod, tiles=False, animate=False, density=None, mainshocks=False, brushing=False):
+    quake_db.use_catalog(get_earthquakes())
+    key = map_cache_key(min_mag, selected_year_range, zoom, lod, tiles, animate, density, mainshocks, brushing)
+    return MAP_CACHE.get_or_compute(key, lambda: build_map_html(min_mag, selected_year_range, zoom, lod, tiles, animate, density, mainshocks, brushing))
+
+def prewarm_default_views():
+    # 預設畫面 (最近五年、M4.0) 在資料載入後先畫好，第一位訪客就能直接命中
     try:
-        df = pd.read_csv(api_url)
-        
-        df['time'] = pd.to_datetime(df['time'])
-        df['year'] = df['time'].dt.year
-        df = df.dropna(subset=['latitude', 'longitude', 'mag', 'depth'])
-        
-        print(f"下載成功！取得 {len(df)} 筆台灣真實地震資料。")
-        return df
-        
+        get_map_html(*DEFAULT_VIEW)
+        get_stats_panel(*DEFAULT_VIEW[:2])
     except Exception as e:
-        print(f"下載失敗: {e}")
-        # 回傳空 DataFrame 避免報錯
-        return pd.DataFrame(columns=['latitude', 'longitude', 'mag', 'depth', 'year', 'place'])
+        print(f"預先產生地圖失敗: {e}")
 
-# 下載資料 (全域變數，只下載一次)
-df_earthquakes = get_taiwan_earthquake_data()
+# 向量圖磚端點 /_quake/tiles/{z}/{x}/{y}.pbf (掛在 solara 伺服器上)
+quake_tiles.install_routes()
+# 動畫影格端點 /_quake/frames.json
+quake_animation.install_routes()
+# 3D 點雲的二進位屬性緩衝 /_quake/points3d.bin
+quake_3d.install_routes()
+# 篩選結果串流下載 /_quake/export.{arrow,parquet,csv}
+quake_export.install_routes()
+# 漸進式繪製的後續批次 /_quake/batch.json
+quake_progressive.install_routes()
+# 即時新事件 /_quake/live.json；目錄載入後啟動背景輪詢 (QUAKE_FEED_INTERVAL=0 關閉)
+quake_feed.install_routes()
+catalog_future.add_done_callback(lambda f: quake_feed.start(f.result()[0]) if f.exception() is None else None)
 
 # ==========================================
-# 2. DuckDB 查詢引擎
+# 5. 震源剖面 (沿剖面線距離 vs 深度)
 # ==========================================
-def query_earthquakes(min_mag, selected_year_range):
-    if df_earthquakes.empty:
-        return df_earthquakes
+def get_section_line():
+    return cross_section.SectionLine(
+        azimuth=float(section_azimuth.value),
+        half_length_km=float(section_half_length.value),
+        offset_km=float(section_offset.value),
+        buffer_km=float(section_buffer.value),
+    )
 
-    start_year, end_year = selected_year_range
+def get_section_chart(section_df, line):
+    fig, ax = plt.subplots(figsize=(9, 3.2))
+    fig.patch.set_facecolor('#ffffff')
+
+    if not section_df.empty:
+        colors = [quake_layers.DEPTH_COLORS[c] for c in quake_layers.depth_class(section_df['depth'])]
+        ax.scatter(section_df['distance_km'], section_df['depth'], s=(section_df['mag'] ** 2) * 1.2,
+                   c=colors, alpha=0.6, edgecolors='black', linewidths=0.3)
+
+    ax.set_xlim(0, 2 * line.half_length_km)
+    ax.set_ylim(300, 0)   # 深度往下
+    ax.set_title(f"震源剖面 A → B (方位 {line.azimuth:.0f}°，緩衝 ±{line.buffer_km:.0f} km，{len(section_df)} 筆)", fontsize=10, fontweight='bold')
+    ax.set_xlabel("沿剖面距離 (km)")
+    ax.set_ylabel("深度 (km)")
+    ax.grid(True, linestyle='--', alpha=0.3)
 
-    query = f"""
-        SELECT latitude, longitude, mag, depth, place, year
-        FROM df_earthquakes 
-        WHERE mag >= {min_mag} 
-        AND year >= {start_year} AND year <= {end_year}
-    """
-    return duckdb.query(query).to_df()
+    plt.tight_layout()
+
+    s = io.BytesIO()
+    fig.savefig(s, format='png', dpi=100)
+    plt.close(fig)
+    s.seek(0)
+    return f'<img src="data:image/png;base64,{base64.b64encode(s.read()).decode()}" style="width: 100%;">'
 
 # ==========================================
-# 3. 響應式變數
+# 6. 統計面板：規模-頻率分布 (G-R 關係) + 每年筆數
 # ==========================================
-min_magnitude = solara.reactive(4.0) 
-
-# 設定年份範圍
-current_year = 2025
-if not df_earthquakes.empty:
-    max_y = int(df_earthquakes['year'].max())
-    min_y = int(df_earthquakes['year'].min())
-    year_range = solara.reactive([max_y - 5, max_y]) # 預設看最近5年
-else:
-    min_y, max_y = 2000, 2025
-    year_range = solara.reactive([2020, 2025])
+# 圖表 HTML 也依篩選條件快取 (所有 session 共用)，滑桿來回拖動不必重畫
+STATS_CHART_CACHE = map_cache.ByteLRUCache(max_bytes=8 * 1024 * 1024)
+
+def build_stats_chart(stats):
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(6, 2.6))
+    fig.patch.set_facecolor('#ffffff')
+
+    mfd = stats.mfd
+    if not mfd.empty:
+        # 直接畫 log10 N (G-R 圖慣用)，比對數座標軸的數學字型刻度快很多
+        ax1.plot(mfd['mag'], np.log10(mfd['cumulative']), 'o', ms=3, color='#2c3e50', label="N(>=M)")
+        ax1.plot(mfd['mag'], np.log10(mfd['count']), 's', ms=2, color='#95a5a6', label="N(M)")
+        if stats.b == stats.b:   # 不是 NaN
+            fit_m = mfd['mag'][mfd['mag'] >= stats.mc - 1e-9]
+            ax1.plot(fit_m, stats.a - stats.b * fit_m, '-', color='#e74c3c', label=f"b = {stats.b:.2f}")
+            ax1.axvline(stats.mc, color='#e67e22', linestyle='--', linewidth=1)
+        ax1.legend(fontsize=7)
+    ax1.set_xlabel("M", fontsize=8)
+    ax1.set_ylabel("log10 N", fontsize=8)
+    ax1.tick_params(labelsize=7)
+
+    if len(stats.per_year):
+        ax2.bar(stats.per_year.index, stats.per_year.values, color='#3498db')
+    ax2.tick_params(labelsize=7)
+
+    # 固定邊界 (不用 tight_layout)、圖內不放中文字 (標題放在面板上)：沒快取的組合也能很快畫完
+    fig.subplots_adjust(left=0.1, right=0.98, bottom=0.17, top=0.95, wspace=0.3)
+    s = io.BytesIO()
+    fig.savefig(s, format='png', dpi=80)
+    plt.close(fig)
+    s.seek(0)
+    return f'<img src="data:image/png;base64,{base64.b64encode(s.read()).decode()}" style="width: 100%;">'
+
+def get_stats_panel(min_mag, selected_year_range, mainshocks=False):
+    # 統計量本身由 quake_stats 依篩選條件快取；這裡再快取畫好的圖
+    quake_db.use_catalog(get_earthquakes())
+    stats = quake_stats.get_stats(min_mag, *selected_year_range, mainshocks)
+    key = (quake_db.catalog_version(), round(float(min_mag), 1), int(selected_year_range[0]), int(selected_year_range[1]), bool(mainshocks))
+    return stats, STATS_CHART_CACHE.get_or_compute(key, lambda: build_stats_chart(stats))
+
+# 預熱要用到地圖與統計面板，兩者都定義完才登記 (目錄已在快取時 callback 會立刻執行)
+catalog_future.add_done_callback(
+    lambda f: threading.Thread(target=prewarm_default_views, daemon=True).start() if f.exception() is None else None)
 
 # ==========================================
-# 4. 頁面元件
+# 7. 頁面元件
 # ==========================================
 @solara.component
 def Page():
     
+    # 資料在背景載入，完成後本元件會自動重新渲染
+    solara.lab.use_task(wait_for_catalog, dependencies=[], raise_error=False)
+    # 背景載入丟出例外也算 done：只有成功才算 ready，失敗時顯示錯誤 (不在渲染中呼叫 result())
+    ready = catalog_future.done() and catalog_future.exception() is None
+    failed = catalog_future.done() and not ready
+    min_y, max_y = get_year_bounds() if ready else (2000, current_year)
+    section_line = get_section_line() if show_section.value else None
+    density = ("mag" if density_weighted.value else "count") if density_mode.value else None
+
+    # 主震標記只在勾選「只顯示主震」後才準備，而且在背景執行緒做 (有快取就讀檔，否則去叢集計算)；
+    # 準備好之前地圖與統計照常顯示全部地震，不卡住渲染
+    def load_labels():
+        if ready and mainshocks_only.value:
+            return decluster.ensure_labels()
+        return None
+
+    labels_task = solara.lab.use_task(load_labels, dependencies=[ready, mainshocks_only.value], raise_error=False)
+    labels = labels_task.value if labels_task.finished and mainshocks_only.value else None
+    mainshocks = labels is not None and decluster.labels_ready()
+
+    # 交叉篩選：點陣圖索引每份目錄建一次；每次刷選只做位元運算，結果以點陣圖送給地圖 (見 data-selection)
+    xf = crossfilter.get_crossfilter() if ready and crossfilter_mode.value else None
+    brushing = xf is not None
+    brush_values, brushes, selection = {}, None, None
+    if xf is not None:
+        brush_values = {
+            "mag": mag_brush.value or xf.extent("mag"),
+            "depth": depth_brush.value or xf.extent("depth"),
+            "year": year_brush.value or (int(xf.extent("year")[0]), int(xf.extent("year")[1]) - 1),
+        }
+        # 年份滑桿是頭尾都含的整數，索引用 [lo, hi)
+        brushes = tuple((float(brush_values[name][0]), float(brush_values[name][1]) + (1 if name == "year" else 0))
+                        for name in crossfilter.DIMENSIONS)
+        selection = xf.update(dict(zip(crossfilter.DIMENSIONS, brushes)))
+
+    def clear_brushes():
+        for brush in (mag_brush, depth_brush, year_brush):
+            brush.set(None)
+
     def calculate_map_html():
-        df = query_earthquakes(min_magnitude.value, year_range.value)
-        count = len(df)
-        
-        # 建立地圖：中心鎖定立霧溪口
-        m = leafmap.Map(
-            center=[24.14, 121.6], 
-            zoom=9,                
-            google_map="HYBRID",
-            draw_control=False,
-            measure_control=False,
-        )
-
-        # ★★★ 顏色分層優化：強調隱沒帶深度結構 ★★★
-        def get_color(depth):
-            if depth < 20: return "#FF0000"      # 極淺層 (紅) - 破壞力最強
-            elif depth < 60: return "#FF8800"    # 淺層 (橘)
-            elif depth < 150: return "#FFFF00"   # 中層 (黃)
-            else: return "#0000FF"               # 深層 (藍) - 隱沒帶深處
-
-        if not df.empty:
-            radius_scale = 1.0 if count < 1000 else 0.8
-            
-            for _, row in df.iterrows():
-                leafmap.folium.CircleMarker(
-                    location=[row['latitude'], row['longitude']],
-                    radius=(row['mag'] ** 2) * 0.15 * radius_scale, 
-                    color=None,
-                    fill=True,
-                    fill_color=get_color(row['depth']),
-                    fill_opacity=0.6,
-                    popup=f"<b>{row['place']}</b><br>年份: {row['year']}<br>規模: {row['mag']}<br>深度: {row['depth']}km"
-                ).add_to(m)
-        
-        # 標記：立霧溪出海口 (參考點)
-        leafmap.folium.Marker(
-            location=[24.138, 121.655],
-            popup="立霧溪出海口",
-            tooltip="中橫公路終點",
-            icon=leafmap.folium.Icon(color="blue", icon="info-sign")
-        ).add_to(m)
-
-        # 記憶體輸出 (io.BytesIO) - 穩定不報錯
-        fp = io.BytesIO()
-        m.save(fp, close_file=False)
-        fp.seek(0)
-        map_html_str = fp.read().decode('utf-8')
-        
-        return map_html_str, count
+        if not ready:
+            return "", 0, "", 0
+        if view_3d.value:
+            # 3D 模式不畫 folium 地圖，點位由 deck.gl 直接抓二進位緩衝
+            quake_db.use_catalog(get_earthquakes())
+            return "", quake_db.count_events(min_magnitude.value, *year_range.value), "3D 深度點雲 (二進位屬性緩衝)", quake_feed.current_seq()
+        # 先查全行程共用的快取，其他訪客看過的組合直接拿現成 HTML (連同地圖產生當時的即時 feed 序號)
+        return get_map_html(min_magnitude.value, year_range.value, map_zoom.value, lod_enabled.value, tile_mode.value, animation_mode.value, density, mainshocks, brushing)
 
     # 使用 use_memo 優化效能
-    map_html, count = solara.use_memo(
+    map_html, count, lod_note, live_base = solara.use_memo(
         calculate_map_html,
-        dependencies=[min_magnitude.value, year_range.value]
+        dependencies=[ready, min_magnitude.value, year_range.value, map_zoom.value, lod_enabled.value, tile_mode.value, animation_mode.value, density, view_3d.value, mainshocks, brushing]
+    )
+
+    def calculate_section_chart():
+        if not ready or section_line is None:
+            return ""
+        # 格網空間索引 (每份基本目錄建一次) 只挑剖面範圍內的格子，拖動滑桿不必掃整個目錄；
+        # 即時疊加層的新事件與修訂版由 DuckDB 另外補上
+        quake_db.use_catalog(get_earthquakes())
+        section_df = cross_section.cross_section(section_line, min_magnitude.value, year_range.value)
+        return get_section_chart(section_df, section_line)
+
+    section_chart = solara.use_memo(
+        calculate_section_chart,
+        dependencies=[ready, section_line, min_magnitude.value, year_range.value, live_seq.value]
+    )
+
+    # 訂閱即時 feed：有新事件時只更新本 session 的序號，iframe 的 data-live 跟著變
+    session_id = solara.server.kernel_context.get_current_context().id
+
+    def subscribe_live():
+        context = solara.server.kernel_context.get_current_context()
+
+        def on_new_events(seq, added):
+            with context:
+                live_seq.set(seq)
+
+        return quake_feed.get_feed().subscribe(session_id, on_new_events)
+
+    solara.use_effect(subscribe_live, [])
+    # live_seq 只負責觸發重新渲染；補抓範圍是地圖產生之後到現在的全部序號 (快取的地圖可能是別的 session 較早產生的)
+    live_upto = max(live_seq.value, quake_feed.current_seq())
+    live_query = quake_feed.live_url(live_base, live_upto, min_magnitude.value, *year_range.value) if live_upto > live_base else ""
+
+    stats, stats_chart = solara.use_memo(
+        lambda: get_stats_panel(min_magnitude.value, year_range.value, mainshocks) if ready else (None, ""),
+        dependencies=[ready, min_magnitude.value, year_range.value, mainshocks]
     )
 
     solara.Title("台灣東部地震分布")
@@ -154,7 +421,47 @@ def Page():
                 with solara.Card(margin=0, elevation=2, style={"background-color": "#2c3e50", "color": "white"}):
                     solara.Markdown("### 📊 區域統計")
                     solara.Markdown(f"**年份**：{year_range.value[0]} - {year_range.value[1]}")
-                    solara.Markdown(f"**地震總數**：{count} 筆")
+                    if ready:
+                        solara.Markdown(f"**地震總數**：{count} 筆")
+                        if lod_note:
+                            solara.Markdown(f"**顯示方式**：{lod_note}")
+                        if mainshocks_only.value and labels_task.error:
+                            solara.Error(f"主震標記失敗：{labels_task.exception}")
+                        elif mainshocks_only.value and not mainshocks:
+                            solara.Markdown("<small>主震標記準備中 (背景去叢集)，完成前先顯示全部地震…</small>")
+                            solara.ProgressLinear(True)
+                        if mainshocks:
+                            solara.Markdown(f"<small>只計主震 ({labels.method})：全目錄 {labels.n_main} 筆主震、{labels.n_dependent} 筆前震/餘震已排除</small>")
+                        if stats is not None:
+                            if stats.b == stats.b:   # 不是 NaN
+                                solara.Markdown(f"**完整震級 Mc**：{stats.mc:.1f} (95% 區間 {stats.mc_ci[0]:.1f} – {stats.mc_ci[1]:.1f})")
+                                solara.Markdown(f"**b 值**：{stats.b:.2f} (95% 區間 {stats.b_ci[0]:.2f} – {stats.b_ci[1]:.2f}，Mc 以上 {stats.n_above_mc} 筆)")
+                            for note in stats.notes:
+                                solara.Markdown(f"<small>⚠️ {note}</small>")
+                            solara.Markdown("**深度分層**：" + "、".join(f"{label} {n} 筆" for label, n in stats.per_depth.items()))
+                            solara.Markdown("<small>左：規模-頻率分布 (G-R 擬合)｜右：每年筆數</small>")
+                            solara.HTML(tag="div", unsafe_innerHTML=stats_chart)
+                        if quake_feed.FEED_INTERVAL > 0:
+                            solara.Markdown(f"<small>即時 feed：本頁已收到 {quake_feed.get_feed().delivered(session_id)} 筆新地震</small>")
+                        cache_stats = MAP_CACHE.stats()
+                        solara.Markdown(f"<small>地圖快取：命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']} / 淘汰 {cache_stats['evictions']}</small>")
+                        if PARTITIONED:
+                            solara.Markdown(f"<small>目錄：分區 Parquet (M{MIN_MAG_FLOOR} 以上，不常駐記憶體)</small>")
+                        else:
+                            solara.Markdown(f"<small>目錄記憶體：{catalog_future.result()[1].memory_bytes / 1e6:.1f} MB</small>")
+                    else:
+                        solara.Markdown("**地震總數**：資料載入中…")
+                        solara.ProgressLinear(True)
+
+                if ready:
+                    # 下載與地圖相同篩選條件 (規模 / 年份 / 主震) 的完整資料：由 DuckDB 逐批串流，不經 pandas
+                    solara.Markdown("### ⬇️ 匯出篩選結果")
+                    with solara.Row(gap="4px"):
+                        for fmt, label in (("csv", "CSV"), ("parquet", "Parquet"), ("arrow", "Arrow")):
+                            solara.Button(label, icon_name="mdi-download", text=True, color="white", target="_blank",
+                                          href=quake_export.export_url(fmt, min_magnitude.value, *year_range.value, mainshocks))
+                    if crossfilter_mode.value:
+                        solara.Markdown("<small>匯出不套用交叉篩選的刷選範圍</small>")
                 
                 solara.Markdown("---")
                 
@@ -163,7 +470,54 @@ def Page():
                 solara.SliderRangeInt(label="", value=year_range, min=min_y, max=max_y, thumb_label="always")
                 
                 solara.Markdown("### 📉 最小規模 ")
-                solara.SliderFloat(label="", value=min_magnitude, min=4.0, max=7.5, step=0.1, thumb_label="always")
+                solara.SliderFloat(label="", value=min_magnitude, min=MIN_MAG_FLOOR, max=7.5, step=0.1, thumb_label="always")
+                
+                solara.Markdown("### 🔍 地圖縮放")
+                solara.SliderInt(label="", value=map_zoom, min=7, max=12, thumb_label="always")
+                solara.Checkbox(label=f"超過 {quake_db.RAW_POINT_LIMIT} 筆時以格網聚合顯示", value=lod_enabled, disabled=tile_mode.value or animation_mode.value or density_mode.value or crossfilter_mode.value)
+                solara.Checkbox(label="向量圖磚模式 (平移縮放時只載入可見範圍)", value=tile_mode, disabled=animation_mode.value or density_mode.value or mainshocks_only.value or crossfilter_mode.value)
+                solara.Checkbox(label="⏯️ 時間動畫 (2000 年起逐月播放，不受年份篩選)", value=animation_mode, disabled=density_mode.value or mainshocks_only.value or crossfilter_mode.value)
+                solara.Checkbox(label="🔥 密度圖 (高斯核密度，取代重疊的圓點)", value=density_mode, disabled=crossfilter_mode.value)
+                if density_mode.value:
+                    solara.Checkbox(label="以規模加權", value=density_weighted)
+                solara.Checkbox(label="🧊 3D 深度點雲 (地震畫在真實深度)", value=view_3d, disabled=mainshocks_only.value or crossfilter_mode.value)
+                solara.Checkbox(label="🔁 只顯示主震 (Gardner–Knopoff 去除前震 / 餘震)", value=mainshocks_only,
+                                disabled=tile_mode.value or animation_mode.value or view_3d.value or crossfilter_mode.value)
+
+                solara.Markdown("---")
+
+                # 交叉篩選直方圖：拖動任一維度的範圍，其他直方圖與地圖跟著更新 (取代上方的年份 / 規模篩選)
+                solara.Markdown("### 🔗 交叉篩選")
+                solara.Checkbox(label="規模 / 深度 / 年份 直方圖連動篩選", value=crossfilter_mode,
+                                disabled=tile_mode.value or animation_mode.value or density_mode.value or view_3d.value or mainshocks_only.value)
+                if selection is not None:
+                    solara.Markdown(f"**選取**：{selection.total} / {len(xf)} 筆")
+                    brush_controls = (("mag", mag_brush, crossfilter.MAG_BIN, "#e67e22"),
+                                      ("depth", depth_brush, crossfilter.DEPTH_BIN_KM, "#e74c3c"),
+                                      ("year", year_brush, 1, "#3498db"))
+                    for (name, brush, step, color), (lo, hi) in zip(brush_controls, brushes):
+                        dim = xf.dims[name]
+                        solara.Markdown(f"<small>{crossfilter.DIMENSION_LABELS[name]}</small>")
+                        solara.HTML(tag="div", unsafe_innerHTML=crossfilter.histogram_svg(selection.histograms[name], dim.bin_range(lo, hi), color=color))
+                        low, high = xf.extent(name)
+                        if name == "year":
+                            solara.SliderRangeInt(label="", value=brush_values[name], min=int(low), max=int(high) - 1,
+                                                  on_value=brush.set, thumb_label="always")
+                        else:
+                            solara.SliderRangeFloat(label="", value=brush_values[name], min=low, max=high, step=step,
+                                                    on_value=brush.set, thumb_label="always")
+                    solara.Button("清除刷選", text=True, on_click=clear_brushes)
+                
+                solara.Markdown("---")
+                
+                # 震源剖面
+                solara.Markdown("### 🧭 震源剖面")
+                solara.Checkbox(label="顯示剖面 (預設：通過立霧溪出海口的東西向剖面)", value=show_section)
+                if show_section.value:
+                    solara.SliderFloat(label="方位角 (°)", value=section_azimuth, min=0, max=180, step=5, thumb_label="always")
+                    solara.SliderFloat(label="垂直平移 (km)", value=section_offset, min=-100, max=100, step=5, thumb_label="always")
+                    solara.SliderFloat(label="剖面半長 (km)", value=section_half_length, min=20, max=200, step=10, thumb_label="always")
+                    solara.SliderFloat(label="緩衝寬度 (km)", value=section_buffer, min=2, max=60, step=2, thumb_label="always")
                 
                 solara.Markdown("---")
                 
@@ -178,20 +532,55 @@ def Page():
 
             # 右側：地圖
             with solara.Column(style={"height": "100%", "padding": "0"}):
-                solara.Div(
-                    children=[
-                         solara.HTML(
-                            tag="iframe",
-                            attributes={
-                                "srcdoc": map_html,
-                                "width": "100%",
-                                "height": "100%",
-                                "style": "border: none; width: 100%; height: 750px;" 
-                            }
-                        )
-                    ],
-                    style={"height": "100%", "width": "100%"},
-                    key=f"tw-quake-map-{year_range.value}-{min_magnitude.value}"
-                )
+                if not ready:
+                    with solara.Column(style={"padding": "40px"}):
+                        if failed:
+                            solara.Error(f"載入失敗：{catalog_future.exception()}")
+                        else:
+                            solara.ProgressLinear(True)
+                            solara.Info("⏳ 正在載入 USGS 台灣地震資料庫 (首次啟動需要下載，之後會使用本機快取)…")
+                    return
+
+                if view_3d.value:
+                    # deck.gl 外殼固定不變 (key 不含篩選條件)：篩選只改 data-query 屬性，
+                    # iframe 不重載，裡面的 deck 抓新緩衝後只更新屬性
+                    solara.Div(
+                        children=[
+                            solara.HTML(
+                                tag="iframe",
+                                attributes={
+                                    "srcdoc": quake_3d.deck_html(),
+                                    "data-query": quake_3d.points_url(min_magnitude.value, *year_range.value),
+                                    "width": "100%",
+                                    "height": "100%",
+                                    "style": f"border: none; width: 100%; height: {'480px' if section_chart else '750px'};"
+                                }
+                            )
+                        ],
+                        style={"height": "100%", "width": "100%"},
+                        key="tw-quake-3d"
+                    )
+                else:
+                    solara.Div(
+                        children=[
+                             solara.HTML(
+                                tag="iframe",
+                                attributes={
+                                    "srcdoc": map_html,
+                                    "data-live": live_query,
+                                    "data-section": json.dumps(section_line.overlay(), ensure_ascii=False) if section_line is not None else "",
+                                    **({"data-selection": xf.encode(selection.bits)} if selection is not None else {}),
+                                    "width": "100%",
+                                    "height": "100%",
+                                    "style": f"border: none; width: 100%; height: {'480px' if section_chart else '750px'};" 
+                                }
+                            )
+                        ],
+                        style={"height": "100%", "width": "100%"},
+                        key=f"tw-quake-map-{year_range.value}-{min_magnitude.value}-{map_zoom.value}-{lod_enabled.value}-{tile_mode.value}-{animation_mode.value}-{density}-{mainshocks}-{brushing}"
+                    )
+                
+                if section_chart:
+                    solara.HTML(tag="div", unsafe_innerHTML=section_chart)
 
 Page()
\ No newline at end of file
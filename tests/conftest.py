@@ -0,0 +1,23 @@
+import os
+import sys
+
+# 測試直接 import geodata / benchmarks (與 PYTHONPATH=. 執行 benchmarks 相同)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import threading
+
+import pytest
+
+from benchmarks.fake_fdsn_feed import FakeCatalog, make_server
+
+
+@pytest.fixture
+def fake():
+    # 本機假 FDSN 端點 (與 benchmarks/fake_fdsn_feed.py 同一份)，fake.url 為查詢網址
+    fake = FakeCatalog()
+    server = make_server(fake)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    fake.url = f"http://127.0.0.1:{server.server_address[1]}/query"
+    yield fake
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,46 @@
+import datetime
+import os
+
+from geodata import catalog
+from geodata.synthetic import make_events
+
+
+def layout(root):
+    # {年份目錄: {規模級距目錄, ...}}
+    return {y: set(os.listdir(os.path.join(root, y))) for y in sorted(os.listdir(root))}
+
+
+def test_write_replaces_and_prunes_whole_years(tmp_path):
+    root = str(tmp_path / "parts")
+    df = make_events(600, start_year=2020, end_year=2022, min_mag=2.0)
+    catalog.write_partitions(df, root)
+    assert set(layout(root)) == {"year=2020", "year=2021", "year=2022"}
+    assert catalog.count_partitioned(root) == 600
+
+    # 重抓 2021：只剩 M3 以下，該年其他規模級距的舊檔不能留著
+    small = df[(df.year == 2021) & (df.mag < 3.0)]
+    catalog.write_partitions(small, root)
+    assert layout(root)["year=2021"] == {"mag_band=2"}
+    assert layout(root)["year=2020"] == {f"mag_band={b}" for b in df[df.year == 2020].mag.astype(int).unique()}
+    assert catalog.count_partitioned(root) == (df.year != 2021).sum() + len(small)
+
+    # 重抓 2022 回來是空的：舊分區整個拿掉
+    catalog.write_partitions(df.iloc[0:0], root, years=[2022])
+    assert set(layout(root)) == {"year=2020", "year=2021"}
+    assert catalog.count_partitioned(root) == (df.year == 2020).sum() + len(small)
+
+
+def test_sync_drops_a_refetched_year_that_came_back_empty(fake, tmp_path):
+    fake.add(make_events(40, start_year=2023, end_year=2024, min_mag=2.5))
+    root, stats = catalog.sync_partitioned(cache_dir=str(tmp_path), base_url=fake.url,
+                                           now=datetime.datetime(2024, 6, 1))
+    assert set(layout(root)) == {"year=2023", "year=2024"}
+    assert stats.total == 40
+
+    # 今年的事件全被撤銷：今年每次都重抓，回來是空的
+    with fake.lock:
+        fake.events = fake.events[fake.events["time"].dt.year != 2024]
+    root, stats = catalog.sync_partitioned(cache_dir=str(tmp_path), base_url=fake.url,
+                                           now=datetime.datetime(2024, 6, 2))
+    assert set(layout(root)) == {"year=2023"}
+    assert stats.total == len(fake.events)
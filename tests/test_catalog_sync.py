@@ -0,0 +1,64 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from geodata import catalog
+
+
+def put(fake, event_id, time, mag, updated=None):
+    # 同一 id 再放一次 (updated 較新) 就是 USGS 的修訂版，假端點只回傳最新的一版
+    fake.add(pd.DataFrame({"id": [event_id], "time": [pd.Timestamp(time)], "latitude": [24.0], "longitude": [121.6],
+                           "depth": [10.0], "mag": [mag], "place": ["Taiwan"],
+                           "updated": [pd.Timestamp(updated or time)]}))
+
+
+def test_first_sync_then_delta_sync(fake, tmp_path):
+    put(fake, "e1", datetime.datetime(2024, 1, 1), 4.5)
+    put(fake, "e2", datetime.datetime(2024, 3, 1), 5.0)
+    put(fake, "e3", datetime.datetime(2024, 3, 10), 4.2)
+
+    # 冷啟動：從 CATALOG_START 整份下載
+    df, stats = catalog.sync_catalog(cache_dir=str(tmp_path), base_url=fake.url, now=datetime.datetime(2024, 3, 15))
+    assert fake.requests[-1]["starttime"] == [catalog.CATALOG_START.strftime("%Y-%m-%dT%H:%M:%S")]
+    assert (stats.fetched, stats.reused, stats.total) == (3, 0, 3)
+    assert stats.from_network
+    assert stats.high_water_mark == "2024-03-10T00:00:00"
+
+    # USGS 修正了 e2 的規模、又多了一筆 e4；e1 在重疊窗之外
+    put(fake, "e2", datetime.datetime(2024, 3, 1), 5.3, updated=datetime.datetime(2024, 3, 18))
+    put(fake, "e4", datetime.datetime(2024, 3, 20), 4.8)
+    df, stats = catalog.sync_catalog(cache_dir=str(tmp_path), base_url=fake.url, now=datetime.datetime(2024, 3, 21))
+
+    # 增量：只抓高水位往回一個重疊窗之後的資料
+    expected_start = datetime.datetime(2024, 3, 10) - catalog.OVERLAP_WINDOW
+    assert fake.requests[-1]["starttime"] == [expected_start.strftime("%Y-%m-%dT%H:%M:%S")]
+    assert (stats.fetched, stats.reused, stats.total) == (3, 1, 4)
+    assert stats.high_water_mark == "2024-03-20T00:00:00"
+    assert sorted(df['id']) == ["e1", "e2", "e3", "e4"]
+    assert df.loc[df['id'] == "e2", 'mag'].iloc[0] == pytest.approx(5.3)
+    assert df['time'].is_monotonic_increasing
+
+
+def test_recent_sync_reuses_cache_without_network(fake, tmp_path):
+    put(fake, "e1", datetime.datetime(2024, 1, 1), 4.5)
+    catalog.sync_catalog(cache_dir=str(tmp_path), base_url=fake.url, now=datetime.datetime(2024, 3, 15))
+    put(fake, "e2", datetime.datetime(2024, 3, 14), 5.0)
+
+    # 距離上次同步不到 MIN_REFRESH_INTERVAL：直接用快取
+    df, stats = catalog.sync_catalog(cache_dir=str(tmp_path), base_url=fake.url,
+                                     now=datetime.datetime(2024, 3, 15, 0, 30))
+    assert len(fake.requests) == 1
+    assert (stats.fetched, stats.reused, stats.total) == (0, 1, 1)
+    assert not stats.from_network
+    assert list(df['id']) == ["e1"]
+
+
+def test_failed_download_keeps_cached_catalog(fake, tmp_path):
+    put(fake, "e1", datetime.datetime(2024, 1, 1), 4.5)
+    catalog.sync_catalog(cache_dir=str(tmp_path), base_url=fake.url, now=datetime.datetime(2024, 3, 15))
+
+    df, stats = catalog.sync_catalog(cache_dir=str(tmp_path), base_url="http://127.0.0.1:9/query",
+                                     now=datetime.datetime(2024, 3, 21))
+    assert (stats.fetched, stats.reused, stats.total) == (0, 1, 1)
+    assert list(df['id']) == ["e1"]
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from geodata import cross_section, quake_db
+from geodata.synthetic import make_events
+
+
+def brute_force(df, line, min_mag, year_range):
+    distance, across = line.project(df['longitude'].to_numpy(), df['latitude'].to_numpy())
+    keep = ((np.abs(across) <= line.buffer_km) & (distance >= 0) & (distance <= 2 * line.half_length_km)
+            & (df['mag'].to_numpy() >= min_mag)
+            & (df['year'].to_numpy() >= year_range[0]) & (df['year'].to_numpy() <= year_range[1]))
+    return np.sort(distance[keep])
+
+
+def test_grid_index_matches_full_scan_with_live_overlay():
+    df = make_events(3000, start_year=2010, end_year=2024)
+    df["updated"] = df["time"]
+    quake_db.use_catalog(df)
+    line = cross_section.SectionLine(azimuth=60.0, offset_km=-15.0, buffer_km=25.0)
+
+    section = cross_section.cross_section(line, 4.5, (2012, 2022))
+    assert 0 < len(section) < len(df)
+    assert np.allclose(section['distance_km'].to_numpy(), brute_force(df, line, 4.5, (2012, 2022)))
+
+    # 即時 feed：剖面內一筆被修訂到剖面外，另有一筆新事件落在剖面中心
+    inside = df.index[np.abs(line.project(df['longitude'], df['latitude'])[1]) <= 5][0]
+    moved = df.loc[[inside]].assign(latitude=21.0, longitude=119.0, updated=pd.Timestamp("2025-01-01"))
+    new = df.iloc[[0]].assign(id="live1", latitude=line.center[0], longitude=line.center[1], mag=6.0, year=2015)
+    quake_db.append_events(pd.concat([moved, new]))
+
+    merged = pd.concat([df.drop(index=inside), moved, new])
+    section = cross_section.cross_section(line, 0.0, (2000, 2030))
+    assert np.allclose(section['distance_km'].to_numpy(), brute_force(merged, line, 0.0, (2000, 2030)))
+    assert 6.0 in section['mag'].to_numpy()
@@ -0,0 +1,69 @@
+import base64
+
+import numpy as np
+
+from geodata import crossfilter, quake_db
+from geodata.synthetic import make_events
+
+
+def test_row_cap_sets_magnitude_floor():
+    df = make_events(2000, start_year=2010, end_year=2024)
+    quake_db.use_catalog(df)
+    mag = np.round(df["mag"].to_numpy(dtype=np.float32).astype(float), 1)
+
+    assert quake_db.crossfilter_floor(len(df)) is None
+    floor = quake_db.crossfilter_floor(300)
+    kept = (mag >= floor - 1e-6).sum()
+    # 最低一級：再往下一級就超過上限
+    assert kept <= 300 < (mag >= floor - 0.1 - 1e-6).sum()
+
+    xf = crossfilter.Crossfilter(quake_db.crossfilter_input(floor), floor)
+    assert len(xf) == kept
+    assert set(quake_db.CROSSFILTER_COLUMNS) == set(xf.points().columns)
+
+
+def test_selection_bitmap_round_trips_through_base64():
+    df = make_events(1000, start_year=2010, end_year=2024)
+    quake_db.use_catalog(df)
+    xf = crossfilter.Crossfilter(quake_db.crossfilter_input())
+    selection = xf.update({"mag": (5.0, 6.0), "year": (2015, 2020)})
+
+    # 地圖端的解碼方式：第 i 筆 = 第 i >> 3 個位元組的第 i & 7 bit
+    raw = np.frombuffer(base64.b64decode(xf.encode(selection.bits)), dtype=np.uint8)
+    shown = np.flatnonzero(np.unpackbits(raw, bitorder="little")[:len(xf)])
+    expected = np.flatnonzero((np.round(xf.mag, 1) >= 5.0) & (np.round(xf.mag, 1) < 6.0)
+                              & (xf.year >= 2015) & (xf.year < 2020))
+    assert np.array_equal(shown, expected)
+    assert selection.total == len(expected)
+
+
+def test_map_draws_the_largest_prefix_but_histograms_count_everything():
+    df = make_events(1000, start_year=2010, end_year=2024)
+    quake_db.use_catalog(df)
+    xf = crossfilter.Crossfilter(quake_db.crossfilter_input(), map_rows=100)
+    assert len(xf) == 1000 and len(xf.points()) == 100
+    # 索引依規模由大到小：地圖上的 100 筆就是規模最大的 100 筆
+    assert xf.points()['mag'].min() >= np.sort(df['mag'].to_numpy(dtype=np.float32))[-100]
+
+    selection = xf.update({"year": (2012, 2020)})
+    assert selection.total == ((df['year'] >= 2012) & (df['year'] < 2020)).sum()
+    assert sum(selection.histograms["mag"]) == selection.total
+    raw = np.frombuffer(base64.b64decode(xf.encode(selection.bits)), dtype=np.uint8)
+    assert len(raw) == 13
+    shown = np.unpackbits(raw, bitorder="little")
+    assert not shown[100:].any()
+    assert np.array_equal(np.flatnonzero(shown), xf.indices(selection.bits)[xf.indices(selection.bits) < 100])
+
+
+def test_popcount_table_matches_bitwise_count(monkeypatch):
+    df = make_events(777, start_year=2010, end_year=2024)
+    quake_db.use_catalog(df)
+    xf = crossfilter.Crossfilter(quake_db.crossfilter_input())
+    brushes = {"mag": (4.5, 5.5), "depth": (0, 40)}
+    expected = xf.update(brushes)
+    # numpy 2 以前沒有 np.bitwise_count：改走查表
+    monkeypatch.delattr(np, "bitwise_count", raising=False)
+    fallback = xf.update(brushes)
+    assert fallback.total == expected.total
+    for name in crossfilter.DIMENSIONS:
+        assert np.array_equal(fallback.histograms[name], expected.histograms[name])
@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import pytest
+
+from geodata import decluster, quake_db
+from geodata.route_quakes import EARTH_RADIUS_KM, unit_vectors
+from geodata.synthetic import make_events
+
+
+def brute_force(t, lat, lon, mag, method):
+    # 對照組：每個事件與全部事件兩兩比較 (O(n²))，處理順序與規則同 decluster.decluster
+    dist_km, days = decluster.WINDOWS[method](mag)
+    xyz = unit_vectors(lat, lon)
+    cluster = np.zeros(len(t), dtype=np.int32)
+    mainshock = np.ones(len(t), dtype=bool)
+    next_id = 1
+    for i in np.argsort(-mag, kind="stable"):
+        if cluster[i]:
+            continue
+        span = days[i] * decluster.DAY_SECONDS
+        angle = np.arccos(np.clip(xyz @ xyz[i], -1, 1))
+        inside = (t >= t[i] - span) & (t <= t[i] + span) & (angle <= dist_km[i] / EARTH_RADIUS_KM)
+        members = np.flatnonzero(inside & (cluster == 0))
+        if len(members) > 1:
+            cluster[members] = next_id
+            mainshock[members] = False
+            mainshock[i] = True
+            next_id += 1
+        else:
+            cluster[i] = -1
+    cluster[cluster < 0] = 0
+    return mainshock, cluster
+
+
+@pytest.mark.parametrize("method", sorted(decluster.WINDOWS))
+def test_matches_brute_force(method):
+    # 背景地震 + 幾個餘震序列，時間跨好幾個區塊
+    rng = np.random.default_rng(7)
+    n = 3000
+    t = rng.uniform(0, 20 * 365 * decluster.DAY_SECONDS, n)
+    lat = rng.uniform(21.0, 26.0, n)
+    lon = rng.uniform(119.0, 123.0, n)
+    mag = np.round(4.0 + rng.exponential(0.45, n), 1)
+    for k in rng.choice(n, 10, replace=False):
+        m = 60
+        t = np.append(t, t[k] + rng.exponential(10 * decluster.DAY_SECONDS, m))
+        lat = np.append(lat, lat[k] + rng.normal(0, 0.1, m))
+        lon = np.append(lon, lon[k] + rng.normal(0, 0.1, m))
+        mag = np.append(mag, np.minimum(mag[k] - 0.5, 4.0 + rng.exponential(0.3, m)))
+    order = np.argsort(t, kind="stable")
+    t, lat, lon, mag = t[order], lat[order], lon[order], mag[order]
+
+    mainshock, cluster = decluster.decluster(t, lat, lon, mag, method)
+    expected_main, expected_cluster = brute_force(t, lat, lon, mag, method)
+    assert np.array_equal(mainshock, expected_main)
+    assert np.array_equal(cluster, expected_cluster)
+    assert (cluster > 0).sum() > 100
+
+
+@pytest.mark.parametrize("blocker", ["file", "dir"])
+def test_unwritable_cache_still_attaches_labels(tmp_path, blocker):
+    # 快取資料夾寫不進去：file = 資料夾路徑被一個檔案佔住 (OSError)，dir = 暫存檔路徑是個資料夾 (DuckDB IOException)
+    quake_db.use_catalog(make_events(300, start_year=2015, end_year=2024))
+    if blocker == "file":
+        (tmp_path / "cache").write_text("")
+        cache_dir = tmp_path / "cache" / "sub"
+    else:
+        cache_dir = tmp_path
+        parquet_path, _ = decluster._label_paths(str(cache_dir))
+        os.makedirs(os.path.join(parquet_path + ".tmp", "x"))
+    result = decluster.ensure_labels("gardner_knopoff", cache_dir=str(cache_dir))
+    assert not result.from_cache and result.n_main > 0
+    assert quake_db.has_mainshocks()
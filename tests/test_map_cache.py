@@ -0,0 +1,37 @@
+from geodata import map_cache
+
+
+def test_evicts_least_recently_used_within_the_byte_budget():
+    cache = map_cache.ByteLRUCache(max_bytes=100, sizeof=len)
+    cache.put("a", "x" * 40)
+    cache.put("b", "y" * 40)
+    assert cache.get("a") == "x" * 40          # a 變成最近用過的
+
+    cache.put("c", "z" * 40)                   # 超過 100 位元組：踢掉最久沒用的 b
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert cache.bytes == 80 and cache.evictions == 1
+
+    # 同一個鍵換新值：大小重算，不會重複計入
+    cache.put("a", "x" * 10)
+    assert cache.bytes == 50 and len(cache) == 2
+
+    # 比整個預算還大的值不進快取，也不會把其他項目擠掉
+    assert not cache.put("huge", "w" * 101)
+    assert len(cache) == 2 and cache.bytes == 50
+
+
+def test_counts_hits_and_misses():
+    cache = map_cache.ByteLRUCache(max_bytes=1024)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return ("<html>地圖</html>", 12, "")
+
+    assert cache.get_or_compute("k", compute) == cache.get_or_compute("k", compute)
+    assert cache.get("missing") is None
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 1)
+    # (html, count, note)：字串依 UTF-8 位元組計，其他值與 tuple 本身各算固定 64
+    assert stats["bytes"] == len("<html>地圖</html>".encode("utf-8")) + 0 + 64 + 64
@@ -0,0 +1,125 @@
+import math
+import struct
+
+import numpy as np
+
+from geodata import mvt, quake_db, quake_tiles
+from geodata.synthetic import make_events
+
+
+# 極簡 protobuf 解碼 (只認得 MVT 用到的 varint / fixed64 / length-delimited)
+def read_varint(buf, i):
+    value = shift = 0
+    while True:
+        b = buf[i]
+        i += 1
+        value |= (b & 0x7F) << shift
+        shift += 7
+        if b < 0x80:
+            return value, i
+
+
+def read_fields(buf):
+    i, fields = 0, []
+    while i < len(buf):
+        key, i = read_varint(buf, i)
+        number, wire = key >> 3, key & 7
+        if wire == 0:
+            value, i = read_varint(buf, i)
+        elif wire == 1:
+            value, i = buf[i:i + 8], i + 8
+        else:
+            n, i = read_varint(buf, i)
+            value, i = buf[i:i + n], i + n
+        fields.append((number, value))
+    return fields
+
+
+def unpack(buf):
+    out, i = [], 0
+    while i < len(buf):
+        v, i = read_varint(buf, i)
+        out.append(v)
+    return out
+
+
+def unzigzag(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+def decode_value(buf):
+    number, value = read_fields(buf)[0]
+    if number == 1:
+        return value.decode("utf-8")
+    if number == 3:
+        return struct.unpack("<d", value)[0]
+    if number == 6:
+        return unzigzag(value)
+    return bool(value)
+
+
+def decode_tile(data):
+    # 回傳 {圖層名稱: (extent, [(id, type, (x, y), {屬性})])}
+    layers = {}
+    for _, layer in read_fields(data):
+        fields = read_fields(layer)
+        keys = [v.decode("utf-8") for n, v in fields if n == 3]
+        values = [decode_value(v) for n, v in fields if n == 4]
+        extent = next(v for n, v in fields if n == 5)
+        features = []
+        for n, raw in fields:
+            if n != 2:
+                continue
+            f = dict(read_fields(raw))
+            command, dx, dy = unpack(f[4])
+            assert command == (1 | (1 << 3))          # MoveTo，一個點
+            tags = unpack(f[2])
+            props = {keys[k]: values[v] for k, v in zip(tags[::2], tags[1::2])}
+            features.append((f[1], f[3], (unzigzag(dx), unzigzag(dy)), props))
+        name = next(v for n, v in fields if n == 1).decode("utf-8")
+        layers[name] = (extent, features)
+    return layers
+
+
+def test_point_layer_round_trips():
+    data = mvt.encode_point_layer("pts", [0, 4096, -40], [10, 2048, 4130], {
+        "mag": [4.5, 6.1, 4.5],
+        "year": [2001, -3, 2024],
+        "place": ["花蓮", "", None],
+        "felt": [True, False, True],
+    })
+    extent, features = decode_tile(data)["pts"]
+    assert extent == mvt.EXTENT
+    assert [f[0] for f in features] == [1, 2, 3]
+    assert all(f[1] == 1 for f in features)           # POINT
+    assert [f[2] for f in features] == [(0, 10), (4096, 2048), (-40, 4130)]
+    assert features[0][3] == {"mag": 4.5, "year": 2001, "place": "花蓮", "felt": True}
+    assert features[1][3] == {"mag": 6.1, "year": -3, "place": "", "felt": False}
+    assert features[2][3] == {"mag": 4.5, "year": 2024, "felt": True}
+
+
+def test_tile_points_land_back_on_their_coordinates():
+    df = make_events(2000, start_year=2015, end_year=2024)
+    quake_db.use_catalog(df)
+    z, x, y = 7, 107, 54                                   # 台灣東部
+    extent, features = decode_tile(quake_tiles.build_tile(z, x, y, 4.0, 2015, 2024))[quake_tiles.LAYER_NAME]
+
+    west, south, east, north = quake_tiles.tile_bounds(z, x, y, quake_tiles.TILE_BUFFER)
+    inside = df[(df.longitude >= west) & (df.longitude <= east) & (df.latitude >= south) & (df.latitude <= north)]
+    assert 0 < len(features) == len(inside)
+
+    # 圖磚座標反推經緯度 (Web Mercator)，誤差在一個圖磚像素以內
+    n = 2 ** z
+    got = []
+    for _, _, (px, py), props in features:
+        lon = (x + px / extent) / n * 360.0 - 180.0
+        lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + py / extent) / n))))
+        got.append((round(props["mag"], 1), props["year"], lon, lat))
+    got.sort()
+    want = sorted(zip(np.round(inside.mag, 1), inside.year, inside.longitude, inside.latitude))
+    pixel = 360.0 / n / extent
+    for (mag, year, lon, lat), (wmag, wyear, wlon, wlat) in zip(got, want):
+        assert (mag, year) == (wmag, wyear)
+        assert abs(lon - wlon) <= pixel and abs(lat - wlat) <= pixel
+    # 緩衝區內的點座標可以超出 0 ~ extent
+    assert all(-64 <= f[2][0] <= extent + 64 and -64 <= f[2][1] <= extent + 64 for f in features)
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+from geodata import profile_chart
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_and_render_keep_the_process_backend():
+    # 另開行程：import + 畫圖之後，使用者選的後端 (例如 notebook 的 inline) 不能被換成 Agg
+    code = ("import matplotlib; import pandas as pd; from geodata import profile_chart; "
+            "profile_chart.render_background(pd.DataFrame({'km': [0, 1], 'elev': [0, 1]}), "
+            "pd.DataFrame({'name': [], 'dist': []})); print(matplotlib.get_backend())")
+    env = dict(os.environ, MPLBACKEND="svg", PYTHONPATH=REPO)
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "svg"
+
+
+def test_pixel_mapping_matches_the_axes_box():
+    km = np.linspace(0, 90, 50)
+    background = profile_chart.render_background(pd.DataFrame({"km": km, "elev": 1000 + 10 * km}),
+                                                  pd.DataFrame({"name": ["武嶺"], "dist": [30.0]}))
+    assert background.data_uri.startswith("data:image/png;base64,")
+    left, top, right, bottom = background.axes_box
+    (k0, k1), (e0, e1) = background.km_range, background.elev_range
+    assert np.allclose(background.to_pixel(k0, e0), (left, bottom))
+    assert np.allclose(background.to_pixel(k1, e1), (right, top))
+    assert 0 <= left < right <= background.width and 0 <= top < bottom <= background.height
@@ -0,0 +1,77 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from geodata import quake_db, quake_progressive
+
+
+def make_catalog(mags):
+    n = len(mags)
+    time = pd.date_range("2024-01-01", periods=n, freq="D")
+    return pd.DataFrame({
+        "id": [f"e{i}" for i in range(n)],
+        "time": time,
+        "updated": time,
+        "latitude": [24.0] * n,
+        "longitude": [121.6] * n,
+        "depth": [10.0] * n,
+        "mag": mags,
+        "year": time.year.astype("int16"),
+        "place": ["Taiwan"] * n,
+    })
+
+
+def test_catalog_tag_follows_content_not_version():
+    # 同樣內容的目錄 (例如重啟後) 版本號不同但 v= 相同；規模被修訂就換一個 v=
+    quake_db.use_catalog(make_catalog([4.5, 5.0, 4.2]))
+    first_version, first = quake_db.catalog_version(), quake_db.catalog_tag()
+    quake_db.use_catalog(make_catalog([4.5, 5.0, 4.2]))
+    assert quake_db.catalog_version() != first_version
+    assert quake_db.catalog_tag() == first
+    quake_db.use_catalog(make_catalog([4.5, 5.3, 4.2]))
+    assert quake_db.catalog_tag() != first
+
+
+def tied_catalog(n=60):
+    # 只有三種規模 (大量同分)，緯度當作每筆的識別
+    df = make_catalog([(4.0, 4.5, 5.0)[i % 3] for i in range(n)])
+    df["latitude"] = 23.0 + np.arange(n) / 1000
+    return df
+
+
+def test_ranked_batches_join_to_the_full_ordered_query():
+    quake_db.use_catalog(tied_catalog())
+    full = quake_db.query_ranked(4.0, 2000, 2100, limit=1000)
+    assert list(full['mag_key']) == sorted(full['mag_key'], reverse=True)
+
+    # 與瀏覽器相同的走法：next 游標經過 JSON (id_key 是字串) 再拆回整數；批量 7 讓批次邊界落在同分規模中間
+    lats, after = [], None
+    while True:
+        batch = json.loads(json.dumps(quake_progressive.fetch_batch(4.0, 2000, 2100, after, limit=7, total=len(full))))
+        lats += batch["lat"]
+        if batch["next"] is None:
+            break
+        after = (int(batch["next"][0]), int(batch["next"][1]))
+    assert lats == list(np.round(full['latitude'], 4))
+    assert len(set(lats)) == 60
+
+
+def test_stream_points_batches_join_to_the_full_query():
+    quake_db.use_catalog(tied_catalog())
+    reader = quake_db.stream_points(4.5, 2000, 2100, ['latitude', 'mag', 'place'], batch_rows=8)
+    streamed = pa.Table.from_batches(list(reader)).to_pandas()
+    expected = quake_db.query_points(4.5, 2000, 2100)
+    assert len(streamed) == len(expected) == 40
+    assert sorted(streamed['latitude']) == sorted(expected['latitude'])
+    assert set(streamed['mag']) == {4.5, 5.0}
+
+
+def test_numpy_floats_are_not_truncated_in_prepared_queries():
+    quake_db.use_catalog(make_catalog([4.2, 4.5, 4.8, 5.0]))
+    # 滑桿 / pandas 給的 np.float32、np.float64 要照原值帶入 (不能被 int() 截成 4)
+    for min_mag in (np.float32(4.5), np.float64(4.5), 4.5):
+        assert quake_db._execute_prepared("count_q", min_mag, np.int64(2000), 2100)['n'].iloc[0] == 3
+    assert quake_db._literal(np.float32(0.25)) == "0.25"
+    assert quake_db._literal(np.int16(2024)) == "2024"
@@ -0,0 +1,44 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow.ipc as pa_ipc
+import pyarrow.parquet as pq
+import pytest
+
+from geodata import quake_db, quake_export
+from geodata.synthetic import make_events
+
+
+def read_back(data, fmt):
+    if fmt == "arrow":
+        return pa_ipc.open_stream(data).read_all().to_pandas()
+    if fmt == "parquet":
+        return pq.read_table(io.BytesIO(data)).to_pandas()
+    return pd.read_csv(io.BytesIO(data), parse_dates=["time", "updated"])
+
+
+@pytest.mark.parametrize("fmt", ["arrow", "parquet", "csv"])
+def test_export_round_trips_the_filtered_catalog(fmt):
+    df = make_events(1000, start_year=2010, end_year=2024)
+    df["updated"] = df["time"] + pd.Timedelta(hours=1)
+    quake_db.use_catalog(df)
+
+    # 每批 50 筆：輸出一定分成好幾段
+    chunks = list(quake_export.iter_export(quake_export.export_reader(4.5, 2015, 2020, batch_rows=50), fmt))
+    assert len(chunks) > 2
+    got = read_back(b"".join(chunks), fmt)
+
+    assert list(got.columns) == quake_export.EXPORT_COLUMNS
+    expected = df[(df.mag >= 4.5) & (df.year >= 2015) & (df.year <= 2020)][quake_export.EXPORT_COLUMNS]
+    got = got.sort_values("id").reset_index(drop=True)
+    expected = expected.sort_values("id").reset_index(drop=True)
+    assert len(got) == len(expected) > 50
+    assert list(got["id"]) == list(expected["id"])
+    assert list(got["place"]) == list(expected["place"])
+    assert list(got["year"]) == list(expected["year"])
+    for c in ("latitude", "longitude", "depth", "mag"):
+        assert np.allclose(got[c].to_numpy(dtype=float), expected[c].to_numpy(dtype=float))
+    for c in ("time", "updated"):
+        delta = pd.to_datetime(got[c]).dt.tz_localize(None) - expected[c]
+        assert delta.abs().max() < pd.Timedelta(milliseconds=1)
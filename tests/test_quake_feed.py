@@ -0,0 +1,89 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from benchmarks.fake_fdsn_feed import FakeCatalog, make_server
+from geodata import quake_db, quake_feed
+from geodata.synthetic import make_events
+
+
+@pytest.fixture
+def base():
+    # 基本目錄：2020~2024 年 50 筆，最後一筆落在 feed 往回多抓的那段時間裡
+    df = make_events(50, start_year=2020, end_year=2024)
+    df["updated"] = df["time"]
+    quake_db.use_catalog(df)
+    return df
+
+
+def live_events(n, start, id_offset):
+    df = make_events(n, seed=id_offset, id_offset=id_offset)
+    df["id"] = "live" + df["id"]
+    df["time"] = pd.Timestamp(start) + pd.to_timedelta(range(n), unit="min")
+    return df
+
+
+def total():
+    return quake_db.count_events(0.0, 0, 9999)
+
+
+def test_poll_dedups_upserts_and_counts_deliveries(fake, base):
+    version = quake_db.catalog_version()
+    quake_db.attach_mainshocks(version, base["id"])
+    feed = quake_feed.LiveFeed(base_url=fake.url, interval=10)
+    pushes = []
+    feed.subscribe("s1", lambda seq, n: pushes.append((seq, n)))
+
+    def closed_session(seq, n):
+        raise RuntimeError("kernel gone")
+
+    feed.subscribe("s2", closed_session)
+
+    # 三筆新事件 + 基本目錄最後一筆的修訂版 (updated 較新，取代舊版，筆數不變)
+    fake.add(live_events(3, "2025-06-01", 1000))
+    fake.add(base.iloc[[-1]].assign(mag=7.9, updated=pd.Timestamp("2025-06-02")))
+    assert feed.poll() == 4
+    assert total() == 53
+    assert quake_db.count_events(7.85, 0, 9999) == 1
+    assert pushes == [(4, 4)]
+    assert feed.delivered("s1") == 4
+    # 推送失敗的 session 取消訂閱，不計入
+    assert feed.delivered("s2") == 0 and "s2" not in feed._subscribers
+
+    # 重疊的時間窗又抓到同樣幾筆：全部去重
+    assert feed.poll() == 0
+    assert feed.delivered("s1") == 4
+
+    # 即時事件再被修訂一次
+    fake.revise("livesyn000001000", mag=7.6)
+    assert feed.poll() == 1
+    assert total() == 53
+    assert quake_db.count_events(7.55, 0, 9999) == 2
+    assert feed.delivered("s1") == 5
+    assert [e["mag"] for e in feed.events_between(4)] == [7.6]
+
+    # 基本目錄沒換：版本不變，主震 view 照常可查
+    assert quake_db.catalog_version() == version
+    assert quake_db.count_events(0.0, 0, 9999, mainshocks=True) == 50
+
+
+def test_poll_backs_off_and_recovers(fake, base):
+    dead = make_server(FakeCatalog())
+    dead_url = f"http://127.0.0.1:{dead.server_address[1]}/query"
+    dead.server_close()
+
+    feed = quake_feed.LiveFeed(base_url=dead_url, interval=10)
+    assert feed.next_delay() == 10
+    assert feed.poll() is None
+    assert feed.failures == 1
+    assert 16 <= feed.next_delay() <= 24
+    for _ in range(12):
+        feed.poll()
+    assert feed.next_delay() <= quake_feed.MAX_BACKOFF * 1.2
+
+    feed.base_url = fake.url
+    fake.add(live_events(2, "2025-06-01", 2000))
+    assert feed.poll() == 2
+    assert feed.failures == 0
+    assert feed.next_delay() == 10
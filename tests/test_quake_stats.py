@@ -0,0 +1,35 @@
+import numpy as np
+
+from geodata import quake_db, quake_stats
+from geodata.synthetic import make_events
+
+
+def gr_catalog(n, b, mc, seed=0):
+    # 連續規模從 2.0 - ΔM/2 起依 b 值指數分布，再取到 0.1；M < mc 的部分依偵測率漸次漏掉
+    rng = np.random.default_rng(seed)
+    df = make_events(n, seed=seed, start_year=2010, end_year=2024, min_mag=2.0)
+    mag = 2.0 - quake_stats.MAG_BIN / 2 + rng.exponential(1 / (b * np.log(10)), n)
+    detected = rng.random(n) < np.exp(-3.0 * np.clip(mc - mag, 0, None))
+    df["mag"] = np.round(mag, 1)
+    return df[detected].reset_index(drop=True)
+
+
+def test_b_value_recovers_a_known_gutenberg_richter_sample():
+    quake_db.use_catalog(gr_catalog(60000, b=1.2, mc=3.0))
+    stats = quake_stats.get_stats(2.0, 2010, 2024)
+
+    # 偵測率在 Mc 以下遞減：分布峰值 (+0.2 修正) 落在真正的完整震級附近
+    assert 2.9 <= stats.mc <= 3.4
+    assert stats.n_above_mc >= quake_stats.MIN_EVENTS_FOR_B
+    assert abs(stats.b - 1.2) < 0.06
+    assert stats.b_ci[0] < 1.2 < stats.b_ci[1]
+    assert stats.mc_ci[0] <= stats.mc <= stats.mc_ci[1]
+    # a 值：log10 N(≥Mc) = a - b·Mc
+    assert abs(stats.a - (np.log10(stats.n_above_mc) + stats.b * stats.mc)) < 1e-9
+
+
+def test_b_value_is_skipped_with_too_few_events():
+    quake_db.use_catalog(gr_catalog(200, b=1.0, mc=3.0, seed=1))
+    stats = quake_stats.get_stats(4.0, 2010, 2024)
+    assert stats.n_above_mc < quake_stats.MIN_EVENTS_FOR_B
+    assert np.isnan(stats.b) and stats.notes
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from geodata import route_line
+
+
+def polyline(n=31):
+    # 約 0.5 km 一個頂點、往東再轉向東北的一條線 (lon, lat, elev)
+    lon = 121.3 + np.concatenate([np.arange(16) * 0.005, 0.075 + np.arange(1, n - 15) * 0.0035])
+    lat = 24.2 + np.concatenate([np.zeros(16), np.arange(1, n - 15) * 0.0035])
+    return np.column_stack([lon, lat, np.linspace(500, 2000, n)])
+
+
+def stations_for(coords):
+    ends = coords[[0, len(coords) // 2, -1]]
+    return pd.DataFrame({"name": ["起點", "中點", "終點"], "lat": ends[:, 1], "lon": ends[:, 0],
+                         "elev": ends[:, 2], "dist": [0.0, 1.0, 2.0]})
+
+
+def test_chain_parts_orders_and_flips_segments():
+    coords = polyline()
+    a, b, c = coords[:11], coords[10:21], coords[20:]
+    # 順序打亂、中間那段反向；另有一段離線 10 km 的支線
+    branch = coords[:5] + [0.1, 0.0, 0.0]
+    chained = route_line.chain_parts([c, branch, b[::-1], a], coords[0, 0], coords[0, 1])
+    assert np.allclose(chained, coords)
+
+    # 從終點那頭起算：整條線反過來
+    chained = route_line.chain_parts([a, c[::-1], b], coords[-1, 0], coords[-1, 1])
+    assert np.allclose(chained, coords[::-1])
+
+
+def test_snap_projects_points_onto_the_line():
+    coords = polyline()
+    line = route_line.from_parts([coords[16:][::-1], coords[:17]], stations_for(coords))
+    assert np.allclose(line.lon, coords[:, 0]) and np.allclose(line.lat, coords[:, 1])
+
+    # 線上的點回到自己的里程
+    km = np.array([0.0, 0.37, 4.2, 7.9, line.length])
+    on = line.locate_many(km)
+    snapped, off = line.snap(on['lat'], on['lon'])
+    assert np.allclose(snapped, km, atol=1e-3) and np.all(off < 1e-3)
+
+    # 第一段 (正東西向) 旁邊 1 km 的點：投影到線段中間，偏離 1 km
+    lat0, lon0, _, _ = line.locate(2.0)
+    snapped, off = line.snap(lat0 + 1 / 110.57, lon0)
+    assert abs(snapped[0] - 2.0) < 0.01 and abs(off[0] - 1.0) < 0.01
+
+    # 節點里程改為投影到中心線上的道路里程
+    assert line.stations['dist'].iloc[0] == 0.0
+    assert abs(line.stations['dist'].iloc[-1] - line.length) < 0.01
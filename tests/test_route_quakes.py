@@ -0,0 +1,45 @@
+import numpy as np
+
+from geodata import route_quakes
+from geodata.synthetic import make_events
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * route_quakes.EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def test_chord_radius_matches_haversine_brute_force():
+    df = make_events(4000, start_year=2000, end_year=2024)     # 依時間排序
+    tree = route_quakes.QuakeTree(df)
+    rng = np.random.default_rng(7)
+    lat = rng.uniform(23.0, 25.0, 200)
+    lon = rng.uniform(121.0, 122.5, 200)
+
+    for radius in (5.0, 20.0, 60.0):
+        summary = tree.summarize(lat, lon, radius)
+        for i in range(len(lat)):
+            d = haversine_km(lat[i], lon[i], df['latitude'].to_numpy(), df['longitude'].to_numpy())
+            near = np.flatnonzero(d <= radius)
+            row = summary.iloc[i]
+            assert row['count'] == len(near)
+            if not len(near):
+                assert np.isnan(row['max_mag']) and np.isnan(row['shallow_km'])
+                continue
+
+            # 範圍內規模最大的一筆 (同規模取較早的)
+            mags = df['mag'].to_numpy()[near]
+            top = near[np.flatnonzero(mags == mags.max())[0]]
+            assert row['max_mag'] == df['mag'].iloc[top]
+            assert row['max_mag_time'] == df['time'].iloc[top]
+            assert abs(row['max_mag_km'] - d[top]) < 1e-6
+
+            # 範圍內最近的淺層地震
+            shallow = near[df['depth'].to_numpy()[near] < route_quakes.SHALLOW_DEPTH_KM]
+            if len(shallow):
+                nearest = shallow[np.argmin(d[shallow])]
+                assert abs(row['shallow_km'] - d[nearest]) < 1e-6
+                assert row['shallow_mag'] == df['mag'].iloc[nearest]
+            else:
+                assert np.isnan(row['shallow_km'])